@@ -0,0 +1,101 @@
+from ollama import AsyncClient
+import asyncio
+import concurrent.futures
+import threading
+
+
+class EnigmaAsyncBackend:
+    """
+    Runs Ollama streams on a single asyncio event loop in a dedicated thread.
+
+    Any number of streams can be submitted from any thread, at most
+    `max_concurrency` of them talk to the server at once and the rest wait on
+    the loop without holding a thread. Results are handed back through the
+    callbacks given to stream(), which run on the loop thread, so they
+    should only emit Qt signals or otherwise be thread-safe.
+    """
+
+    # How often a running stream checks whether it was cancelled.
+    CANCEL_POLL_INTERVAL = 0.1
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, max_concurrency: int = 8):
+        self.max_concurrency = max_concurrency
+        self._semaphore = None
+        self._clients = {}
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run_loop, name="EnigmaAsyncLoop", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def shared(cls) -> "EnigmaAsyncBackend":
+        """
+        Return the process-wide backend, starting its loop on first use.
+        """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def stream(self, host_url: str, request: dict, on_part: callable,
+               is_cancelled: callable) -> concurrent.futures.Future:
+        """
+        Stream a chat request on the loop.
+
+        Args:
+            host_url: Ollama server, e.g. "http://localhost:11434".
+            request: Keyword arguments for AsyncClient.chat, with stream=True.
+            on_part: Called with every ChatResponse part.
+            is_cancelled: Polled while streaming, the stream is aborted (even
+                before the first token) once it returns True.
+
+        Returns:
+            Future: Resolves when the stream ends or is cancelled.
+        """
+        return asyncio.run_coroutine_threadsafe(
+            self._stream(host_url, request, on_part, is_cancelled), self._loop)
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    def _client(self, host_url: str) -> AsyncClient:
+        """
+        One AsyncClient per host, only used from the loop thread.
+        """
+        client = self._clients.get(host_url)
+        if client is None:
+            client = AsyncClient(host=host_url)
+            self._clients[host_url] = client
+        return client
+
+    async def _stream(self, host_url, request, on_part, is_cancelled):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async with self._semaphore:
+            if is_cancelled():
+                return
+            task = asyncio.ensure_future(self._consume(host_url, request, on_part, is_cancelled))
+            while not task.done():
+                await asyncio.wait({task}, timeout=self.CANCEL_POLL_INTERVAL)
+                if is_cancelled() and not task.done():
+                    # Cancelling the task closes the HTTP response, so Ollama
+                    # stops generating even if no token has arrived yet.
+                    task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def _consume(self, host_url, request, on_part, is_cancelled):
+        stream = await self._client(host_url).chat(**request)
+        try:
+            async for part in stream:
+                if is_cancelled():
+                    break
+                on_part(part)
+        finally:
+            await stream.aclose()
@@ -0,0 +1,265 @@
+from binaryninja import BinaryView
+from PySide6 import QtCore
+from .enigma_binapi import EnigmaBinAPI, EnigmaFunctionContext
+from .enigma_callgraph import EnigmaCallGraph, substitute_names
+from .enigma_executor import EnigmaExecutor, EnigmaRequest, Priority
+from .enigma_files import write_json_atomic
+from .enigma_ollama import EnigmaOllamaClient, MType
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+
+def sanitize_function_name(response: str) -> str:
+    """
+    Turn a model's rename response into a usable identifier, or None.
+    """
+    lines = [line for line in response.strip().strip('`').splitlines() if line.strip()]
+    if not lines:
+        return None
+    name = lines[0].strip().strip('`\'"').removesuffix('()')
+    name = re.sub(r'[^A-Za-z0-9_]', '_', name).strip('_')
+    if not name:
+        return None
+    if name[0].isdigit():
+        name = f"fn_{name}"
+    return name[:128]
+
+
+class EnigmaBatchRenamer(QtCore.QObject):
+    """
+    Renames every function whose name starts with a prefix (sub_ by default)
+    across a whole binary.
+
+    Functions are scheduled bottom-up over the call graph: a function is
+    only sent once all of its callees have a suggested name, and those names
+    are substituted into its IL, so callers are named from meaningful calls
+    rather than sub_* addresses. Requests are queued on the shared executor
+    with at most `parallelism` in flight. Suggested names are checkpointed to
+    disk as they arrive, so a crash or restart resumes where it stopped, and
+    are applied in bulk inside a single undo action once every function has
+    a name.
+    """
+
+    progress = QtCore.Signal(int, int, float)  # done, total, functions per minute
+    finished = QtCore.Signal(int)              # number of functions renamed
+    failed = QtCore.Signal(str)
+    cancelled = QtCore.Signal(int)             # number of names checkpointed
+
+    # Write the checkpoint at most this often (seconds).
+    CHECKPOINT_INTERVAL = 5.0
+
+    def __init__(self, bv: BinaryView, client: EnigmaOllamaClient, parallelism: int = 4,
+                 prefix: str = "sub_", executor: EnigmaExecutor = None, packs=None):
+        super().__init__()
+        self.bv = bv
+        self.client = client
+        self.parallelism = max(1, parallelism)
+        self.prefix = prefix
+        self.executor = executor or EnigmaExecutor.shared()
+
+        # Optional EnigmaAnnotationPacks, functions named in a pack skip the model.
+        self.packs = packs
+
+        checkpoint_dir = os.path.join(client.cache_dir, 'batch')
+        if not os.path.exists(checkpoint_dir):
+            os.makedirs(checkpoint_dir)
+        binary_id = hashlib.sha1(bv.file.filename.encode('utf-8')).hexdigest()
+        self.checkpoint_path = os.path.join(checkpoint_dir, f"rename_{binary_id}.json")
+
+        # Suggested names by function start, restored from the checkpoint.
+        self.names = {}
+        self.failures = set()
+
+        # Current name -> suggested name, substituted into callers' IL.
+        self._aliases = {}
+        self._schedule = None
+
+        self._lock = threading.Lock()
+        self._slots = threading.Semaphore(self.parallelism)
+        self._cancel_event = threading.Event()
+        self._requests = set()
+        self._last_checkpoint = 0.0
+        self._thread = None
+
+    def start(self):
+        """
+        Start the batch on a background thread.
+        """
+        self._thread = threading.Thread(target=self._run, name="EnigmaBatchRename", daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        """
+        Stop the batch. Names received so far stay in the checkpoint and are
+        picked up by the next run.
+        """
+        self._cancel_event.set()
+        with self._lock:
+            requests = list(self._requests)
+        for request in requests:
+            request.cancel()
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def targets(self) -> list:
+        """
+        Return the functions still to be renamed.
+        """
+        return [func for func in self.bv.functions
+                if func.name.startswith(self.prefix) and func.start not in self.names]
+
+    def _run(self):
+        try:
+            self._load_checkpoint()
+            if not EnigmaBinAPI.wait_for_analysis(self.bv, cancel_event=self._cancel_event):
+                self.cancelled.emit(len(self.names))
+                return
+
+            # Let the pool run as many batch requests as we keep in flight,
+            # chat and clicks still go first.
+            self.executor.set_limit(Priority.BATCH, self.parallelism)
+
+            self._aliases = {func.name: self.names[func.start] for func in self.bv.functions
+                             if func.start in self.names}
+            targets = self.targets()
+            graph = EnigmaCallGraph(self.bv, targets)
+            self._schedule = graph.schedule()
+            print(f"Batch rename of {len(targets)} functions in {len(graph.components)} "
+                  f"call graph components, {len(graph.by_level())} levels")
+
+            self._total = len(self.names) + len(targets)
+            self._done = len(self.names)
+            self._started = time.monotonic()
+            self._started_done = self._done
+            self._report()
+
+            while True:
+                self._slots.acquire()
+                start = self._schedule.next(self._cancel_event)
+                if start is None:
+                    self._slots.release()
+                    break
+                self._submit(graph.functions[start])
+
+            # Wait for the requests still in flight.
+            for _ in range(self.parallelism):
+                self._slots.acquire()
+            self._save_checkpoint(force=True)
+
+            if self._cancel_event.is_set():
+                print(f"Batch rename cancelled, {len(self.names)} names checkpointed")
+                self.cancelled.emit(len(self.names))
+                return
+
+            renamed = self._apply()
+            self._clear_checkpoint()
+            self.finished.emit(renamed)
+        except Exception as e:
+            print(f"Batch rename failed: {e}")
+            self.failed.emit(str(e))
+
+    def _submit(self, func):
+        """
+        Queue a rename request for a single function.
+        """
+        request = EnigmaRequest(self.client, MType.SYSTEM_RENAME_FN)
+        request.priority = Priority.BATCH
+        request.function_start = func.start
+        request.context_provider = lambda progress, cancel_event: self._capture(func)
+        request.on_done = self._on_done
+        with self._lock:
+            self._requests.add(request)
+        self.executor.submit(request)
+
+    def _capture(self, func) -> EnigmaFunctionContext:
+        """
+        Render a function's IL with the names its callees received, runs on
+        a worker thread once the callees are done.
+        """
+        # Names are only ever added, lookups don't need the lock.
+        annotation = self.packs.lookup(func) if self.packs is not None else None
+        return EnigmaFunctionContext(func.start, func.name,
+                                     substitute_names(str(func.high_level_il), self._aliases),
+                                     annotation=annotation)
+
+    def _on_done(self, request: EnigmaRequest):
+        """
+        Record a completed rename request, runs on a worker thread.
+        """
+        with self._lock:
+            self._requests.discard(request)
+            name = None
+            if request.error is None and not request.is_cancelled():
+                name = sanitize_function_name(request.result or "")
+            if name:
+                self.names[request.function_start] = name
+                if request.context is not None:
+                    self._aliases[request.context.name] = name
+                self._done += 1
+            elif not request.is_cancelled():
+                self.failures.add(request.function_start)
+                self._done += 1
+        self._schedule.done(request.function_start)
+        self._slots.release()
+        self._save_checkpoint()
+        self._report()
+
+    def _report(self):
+        elapsed = time.monotonic() - self._started
+        rate = (self._done - self._started_done) / (elapsed / 60) if elapsed > 0 else 0.0
+        self.progress.emit(self._done, self._total, rate)
+
+    def _apply(self) -> int:
+        """
+        Apply every suggested name inside one undo action.
+        """
+        used = {func.name for func in self.bv.functions}
+        renamed = 0
+        state = self.bv.begin_undo_actions()
+        try:
+            for start, name in self.names.items():
+                func = self.bv.get_function_at(start)
+                if func is None or not func.name.startswith(self.prefix):
+                    continue
+                if name in used:
+                    name = f"{name}_{start:x}"
+                func.name = name
+                used.add(name)
+                renamed += 1
+        finally:
+            # Binary Ninja 4.x returns an id to commit, 3.x takes no argument.
+            if state is None:
+                self.bv.commit_undo_actions()
+            else:
+                self.bv.commit_undo_actions(state)
+        print(f"Batch renamed {renamed} functions")
+        return renamed
+
+    def _load_checkpoint(self):
+        if not os.path.exists(self.checkpoint_path):
+            return
+        with open(self.checkpoint_path, 'r') as f:
+            checkpoint = json.load(f)
+        self.names = {int(start, 16): name for start, name in checkpoint.get('names', {}).items()}
+        print(f"Resuming batch rename with {len(self.names)} checkpointed names")
+
+    def _save_checkpoint(self, force: bool = False):
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._last_checkpoint < self.CHECKPOINT_INTERVAL:
+                return
+            self._last_checkpoint = now
+            checkpoint = {
+                'binary': self.bv.file.filename,
+                'names': {f"{start:x}": name for start, name in self.names.items()},
+            }
+            write_json_atomic(self.checkpoint_path, checkpoint)
+
+    def _clear_checkpoint(self):
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
@@ -1,4 +1,145 @@
-from binaryninja import BinaryView
+from binaryninja import BinaryView, BinaryDataNotification, AnalysisState
+from collections import OrderedDict
+import threading
+import time
+
+
+class EnigmaILCache:
+
+    def __init__(self, maxsize: int = 64) -> None:
+        """
+        Bounded LRU cache of rendered HLIL text of the watched view's
+        functions, keyed by function start address.
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._view = None
+        self._lock = threading.Lock()
+
+    def watch(self, view: BinaryView) -> None:
+        """
+        Cache the functions of another view from now on, dropping every entry.
+        """
+        with self._lock:
+            self._view = view
+            self._entries.clear()
+
+    def get(self, func) -> str:
+        """
+        Return the HLIL text of a function, rendering it on a miss. Functions
+        of other views than the watched one are rendered but never cached,
+        nothing would invalidate them.
+        return:
+            str: The IL of the function.
+        """
+        with self._lock:
+            # Views compare by handle, the Python wrappers are not unique.
+            watched = self._view is not None and func.view == self._view
+            text = self._entries.get(func.start) if watched else None
+            if text is not None:
+                self._entries.move_to_end(func.start)
+                self.hits += 1
+                return text
+            self.misses += 1
+
+        # Render outside the lock, stringifying big functions is slow.
+        text = str(func.high_level_il)
+
+        with self._lock:
+            # The watched view may have changed while rendering.
+            if self._view is None or func.view != self._view:
+                return text
+            self._entries[func.start] = text
+            self._entries.move_to_end(func.start)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return text
+
+    def invalidate(self, start: int) -> None:
+        """
+        Drop the cached text of a single function.
+        """
+        with self._lock:
+            self._entries.pop(start, None)
+
+    def clear(self) -> None:
+        """
+        Drop every cached entry, the counters are kept.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def info(self) -> dict:
+        """
+        Return the hit and miss counters and current size.
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+            }
+
+
+class EnigmaILCacheNotification(BinaryDataNotification):
+
+    def __init__(self, binapi) -> None:
+        """
+        Invalidates the IL cache when Binary Ninja updates analysis.
+        """
+        super().__init__()
+        self.binapi = binapi
+
+    def function_added(self, view, func) -> None:
+        self.binapi._forget_lookups()
+
+    def function_removed(self, view, func) -> None:
+        self.binapi.il_cache.invalidate(func.start)
+        self.binapi._forget_lookups()
+
+    def function_updated(self, view, func) -> None:
+        self.binapi.il_cache.invalidate(func.start)
+        if self.binapi.summaries is not None:
+            self.binapi.summaries.invalidate(view, func.start)
+
+    def symbol_updated(self, view, sym) -> None:
+        # Renames show up in the IL of every caller.
+        self.binapi.il_cache.clear()
+
+    # Retyping a struct, a typedef or a global changes the IL of every
+    # function using it, and none of them is reported as updated.
+    def type_defined(self, view, name, type) -> None:
+        self.binapi.il_cache.clear()
+
+    def type_undefined(self, view, name, type) -> None:
+        self.binapi.il_cache.clear()
+
+    def type_ref_changed(self, view, name, type) -> None:
+        self.binapi.il_cache.clear()
+
+    def data_var_updated(self, view, var) -> None:
+        self.binapi.il_cache.clear()
+
+
+class EnigmaFunctionContext:
+
+    def __init__(self, start: int = None, name: str = "None", il: str = "None", related: str = None,
+                 annotation: dict = None) -> None:
+        """
+        Context captured for a single function, handed to the model with a request.
+        """
+        self.start = start
+        self.name = name
+        self.il = il
+
+        # Summaries of the function's callees and callers, if any.
+        self.related = related
+
+        # Name, summary and variable names from an annotation pack, if any.
+        self.annotation = annotation
 
 
 class EnigmaBinAPI:
@@ -8,50 +149,199 @@ class EnigmaBinAPI:
         This class holds for methods fpr the Binary Ninja API for the Enigma plugin.
         """
         self.parent = parent
+        self.il_cache = EnigmaILCache()
+
+        # The view the cache notification is registered with.
+        self._bv = None
+        self._notification = EnigmaILCacheNotification(self)
+
+        # Last offset -> function lookup, so name and IL share one lookup.
+        self._lookup = (None, None)
+
+        # Optional EnigmaSummaryContext, adds callee and caller summaries to
+        # captured contexts.
+        self.summaries = None
+
+        # Optional EnigmaAnnotationPacks, looked up for every captured context.
+        self.packs = None
 
-    def rename_function(self, old_name: str, new_name: str) -> bool:
+    def rename_function(self, old_name: str, new_name: str, start: int = None) -> bool:
         """
-        Rename a function in the Binary Ninja database.
-        return: 
+        Rename a function in the Binary Ninja database. The function is looked
+        up at `start` if given, otherwise at the current offset.
+        return:
             bool: True if the function was renamed successfully, False otherwise.
         """
-        functions = self.parent.bv.get_functions_containing(self.parent.offset_addr)
+        offset = self.parent.offset_addr if start is None else start
+        functions = self.parent.bv.get_functions_containing(offset)
         for function in functions:
             if function.name == old_name:
                 print("renamed function")
                 function.name = new_name
                 return True
         return False
-    
+
+    def rename_variables(self, start: int, names: dict) -> int:
+        """
+        Rename the variables of the function at `start`. Names are keyed by
+        "<source type>:<storage>" as in annotation packs.
+        return:
+            int: The number of variables renamed.
+        """
+        func = self.parent.bv.get_function_at(start)
+        if func is None or not names:
+            return 0
+        renamed = 0
+        for var in func.vars:
+            name = names.get(f"{int(var.source_type)}:{var.storage}")
+            if name and name != var.name:
+                var.name = name
+                renamed += 1
+        return renamed
+
     def get_function_name(self) -> str:
         """
         Get the name of the current function.
-        return: 
+        return:
             str: The name of the function.
         """
-        if not self.parent.offset_addr:
-            return "None"
-        func = self.parent.bv.get_functions_containing(self.parent.offset_addr)
+        func = self._function_at(self.parent.offset_addr)
         if func:
-            self.func_name = func[0].name
-            return func[0].name
+            self.func_name = func.name
+            return func.name
         return "None"
-    
+
+    def get_function_start(self, offset: int = None) -> int:
+        """
+        Get the start address of the function containing an offset.
+        return:
+            int: The function start address, or None if there is no function.
+        """
+        offset = self.parent.offset_addr if offset is None else offset
+        func = self._function_at(offset)
+        if func:
+            return func.start
+        return None
+
     def get_function_il(self) -> str:
         """
         Get the IL of the current function.
-        return: 
+        return:
             str: The IL of the function.
         """
-        if not self.parent.offset_addr:
-            return "None"
-        func = self.parent.bv.get_functions_containing(self.parent.offset_addr)
+        func = self._function_at(self.parent.offset_addr)
         if func:
-            return str(func[0].high_level_il)
+            return self.il_cache.get(func)
         return "None"
-    
+
+    def context_capture(self, offset: int = None) -> callable:
+        """
+        Bind a context capture for the function at an offset (default: the
+        current one) to the current view. The returned callable does the
+        actual work and is meant to run on a worker thread.
+        """
+        offset = self.parent.offset_addr if offset is None else offset
+        bv = self.parent.bv
+        if bv is not None:
+            self._watch(bv)
+        summaries = self.summaries
+        packs = self.packs
+
+        def capture(progress: callable = None, cancel_event: threading.Event = None):
+            return self.capture_context(bv, offset, progress, cancel_event, summaries, packs)
+        return capture
+
+    def capture_context(self, bv: BinaryView, offset: int, progress: callable = None,
+                        cancel_event: threading.Event = None, summaries=None,
+                        packs=None) -> EnigmaFunctionContext:
+        """
+        Capture the context of the function containing an offset, waiting for
+        analysis to finish first. Blocks, so never call it on the UI thread.
+        return:
+            EnigmaFunctionContext: The captured context, or None if cancelled.
+        """
+        progress = progress or (lambda status: None)
+        if bv is None or not offset:
+            return EnigmaFunctionContext()
+
+        # HLIL of a function that is still being analysed may be incomplete.
+        if not self.wait_for_analysis(bv, progress, cancel_event):
+            return None
+
+        progress("Capturing function context")
+        funcs = bv.get_functions_containing(offset)
+        if not funcs:
+            return EnigmaFunctionContext()
+        func = funcs[0]
+        related = None
+        if summaries is not None:
+            progress("Collecting related function summaries")
+            related = summaries.describe(bv, func)
+
+        annotation = None
+        if packs is not None:
+            annotation = packs.lookup(func)
+        return EnigmaFunctionContext(func.start, func.name, self.il_cache.get(func), related, annotation)
+
+    @staticmethod
+    def wait_for_analysis(bv: BinaryView, progress: callable = None,
+                          cancel_event: threading.Event = None) -> bool:
+        """
+        Block until analysis of a view is idle, reporting progress.
+        return:
+            bool: True once analysis is idle, False if cancelled first.
+        """
+        while bv.analysis_info.state != AnalysisState.IdleState:
+            if cancel_event is not None and cancel_event.is_set():
+                return False
+            if progress is not None:
+                progress(f"Waiting for analysis: {bv.analysis_progress}")
+            time.sleep(0.25)
+        return True
+
+    def cache_info(self) -> dict:
+        """
+        Get the IL cache hit and miss counters.
+        """
+        return self.il_cache.info()
+
     def update_offset(self, offset: int) -> None:
         """
         Update the offset address.
         """
-        self.parent.offset_addr = offset
\ No newline at end of file
+        self.parent.offset_addr = offset
+
+    def _function_at(self, offset: int):
+        """
+        Get the first function containing an offset, reusing the last lookup.
+        """
+        bv = self.parent.bv
+        if not offset or bv is None:
+            return None
+        self._watch(bv)
+
+        last_offset, last_func = self._lookup
+        if last_offset == offset:
+            return last_func
+
+        funcs = bv.get_functions_containing(offset)
+        func = funcs[0] if funcs else None
+        self._lookup = (offset, func)
+        return func
+
+    def _forget_lookups(self) -> None:
+        self._lookup = (None, None)
+
+    def _watch(self, bv: BinaryView) -> None:
+        """
+        Register for analysis notifications on a new view and reset the cache.
+        """
+        # Views compare by handle, the Python wrappers are not unique.
+        if self._bv is not None and bv == self._bv:
+            return
+        if self._bv is not None:
+            self._bv.unregister_notification(self._notification)
+        self._bv = bv
+        self.il_cache.watch(bv)
+        self._forget_lookups()
+        bv.register_notification(self._notification)
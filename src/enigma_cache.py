@@ -0,0 +1,100 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+
+class EnigmaResponseCache:
+    """
+    On-disk cache of model responses, stored in SQLite.
+
+    Entries are keyed by a hash of the model name and the exact messages sent
+    (system prompts plus function IL), so a repeated explain or rename of an
+    unchanged function is replayed without calling the model. The least
+    recently used entries are evicted once the stored responses exceed
+    `max_bytes`.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 32 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        # Shared by the executor's workers, access is serialised by the lock.
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " response TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " last_used REAL NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses(last_used)")
+        self._db.commit()
+
+    @staticmethod
+    def make_key(model: str, messages: list) -> str:
+        """
+        Hash the model name and the messages of a request.
+        """
+        payload = json.dumps([model, messages], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> str:
+        """
+        Return the cached response for a key, or None.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+            return row[0]
+
+    def put(self, key: str, response: str):
+        """
+        Store a response and evict old entries if over the size limit.
+        """
+        size = len(response.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, response, size, time.time()))
+            self._evict()
+            self._db.commit()
+
+    def clear(self):
+        """
+        Remove every cached response.
+        """
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+
+    def info(self) -> dict:
+        """
+        Return the hit and miss counters and the stored size.
+        """
+        with self._lock:
+            count, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {'hits': self.hits, 'misses': self.misses, 'entries': count, 'bytes': total}
+
+    def _evict(self):
+        """
+        Delete least recently used entries until under max_bytes. Called with the lock held.
+        """
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._db.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall():
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
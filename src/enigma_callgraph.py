@@ -0,0 +1,185 @@
+import heapq
+import re
+import threading
+
+
+# Identifiers in rendered IL, used to swap in names callees already received.
+_IDENTIFIER = re.compile(r'\b[A-Za-z_][A-Za-z0-9_]*\b')
+
+
+def substitute_names(text: str, names: dict) -> str:
+    """
+    Replace whole identifiers in IL text, `names` maps old to new names.
+    """
+    if not names:
+        return text
+    return _IDENTIFIER.sub(lambda m: names.get(m.group(0), m.group(0)), text)
+
+
+class EnigmaCallGraph:
+    """
+    Call graph of a set of functions, collapsed into strongly connected
+    components and levelled from the leaves.
+
+    Only calls between the given functions are edges, calls to anything
+    else (imports, functions that already have a name) don't constrain the
+    order. A component's level is one more than the highest level of the
+    components it calls, so level 0 holds the leaves. Mutually recursive
+    functions share a component and are scheduled together.
+    """
+
+    def __init__(self, bv, functions: list = None):
+        functions = list(bv.functions) if functions is None else functions
+        self.functions = {func.start: func for func in functions}
+        self.callees = {
+            start: sorted({callee.start for callee in func.callees
+                           if callee.start in self.functions and callee.start != start})
+            for start, func in self.functions.items()
+        }
+
+        # Components in reverse topological order, callees before callers.
+        self.components = self._components()
+        self.component_of = {start: index for index, component in enumerate(self.components)
+                             for start in component}
+
+        self.component_callees = []
+        self.levels = []
+        for index, component in enumerate(self.components):
+            callees = {self.component_of[callee] for start in component
+                       for callee in self.callees[start]}
+            callees.discard(index)
+            self.component_callees.append(callees)
+            self.levels.append(1 + max((self.levels[c] for c in callees), default=-1))
+
+    def by_level(self) -> list:
+        """
+        Return the function starts grouped by level, leaves first.
+        """
+        levels = [[] for _ in range(max(self.levels, default=-1) + 1)]
+        for index, component in enumerate(self.components):
+            levels[self.levels[index]].extend(component)
+        return levels
+
+    def schedule(self) -> "EnigmaCallSchedule":
+        """
+        Return a schedule that hands out functions once their callees are done.
+        """
+        return EnigmaCallSchedule(self)
+
+    def _components(self) -> list:
+        """
+        Tarjan's algorithm, iterative so deep call chains don't hit the
+        recursion limit.
+        """
+        index = {}
+        low = {}
+        stack = []
+        on_stack = set()
+        components = []
+        counter = 0
+
+        for root in self.callees:
+            if root in index:
+                continue
+            index[root] = low[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack.add(root)
+            work = [(root, iter(self.callees[root]))]
+
+            while work:
+                node, successors = work[-1]
+                for succ in successors:
+                    if succ not in index:
+                        index[succ] = low[succ] = counter
+                        counter += 1
+                        stack.append(succ)
+                        on_stack.add(succ)
+                        work.append((succ, iter(self.callees[succ])))
+                        break
+                    if succ in on_stack:
+                        low[node] = min(low[node], index[succ])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        low[parent] = min(low[parent], low[node])
+                    if low[node] == index[node]:
+                        component = []
+                        while True:
+                            start = stack.pop()
+                            on_stack.discard(start)
+                            component.append(start)
+                            if start == node:
+                                break
+                        components.append(sorted(component))
+        return components
+
+
+class EnigmaCallSchedule:
+    """
+    Hands out the functions of a call graph bottom-up.
+
+    A component becomes ready once every component it calls is done, ready
+    functions are handed out lowest level first. Unlike a strict barrier per
+    level, a caller starts as soon as its own callees are done, so the
+    backend isn't left idle while the slowest function of a level finishes.
+    Thread-safe, done() is normally called from worker threads.
+    """
+
+    def __init__(self, graph: EnigmaCallGraph):
+        self.graph = graph
+        self._cond = threading.Condition()
+        self._ready = []
+        self._undispatched = len(graph.component_of)
+
+        # Callee components not done yet, and functions not done yet, per component.
+        self._waiting = [len(callees) for callees in graph.component_callees]
+        self._left = [len(component) for component in graph.components]
+        self._callers = [[] for _ in graph.components]
+        for index, callees in enumerate(graph.component_callees):
+            for callee in callees:
+                self._callers[callee].append(index)
+
+        for index, waiting in enumerate(self._waiting):
+            if waiting == 0:
+                self._release(index)
+
+    def next(self, cancel_event: threading.Event = None) -> int:
+        """
+        Block until a function is ready and return its start address.
+        return:
+            int: The start address, or None once everything was handed out
+                 or the schedule was cancelled.
+        """
+        with self._cond:
+            while not self._ready:
+                if self._undispatched == 0:
+                    return None
+                if cancel_event is not None and cancel_event.is_set():
+                    return None
+                self._cond.wait(0.25)
+            if cancel_event is not None and cancel_event.is_set():
+                return None
+            self._undispatched -= 1
+            return heapq.heappop(self._ready)[1]
+
+    def done(self, start: int):
+        """
+        Mark a function done (named, failed or skipped alike).
+        """
+        with self._cond:
+            index = self.graph.component_of[start]
+            self._left[index] -= 1
+            if self._left[index]:
+                return
+            for caller in self._callers[index]:
+                self._waiting[caller] -= 1
+                if self._waiting[caller] == 0:
+                    self._release(caller)
+            self._cond.notify_all()
+
+    def _release(self, index: int):
+        level = self.graph.levels[index]
+        for start in self.graph.components[index]:
+            heapq.heappush(self._ready, (level, start))
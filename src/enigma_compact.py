@@ -0,0 +1,113 @@
+import re
+
+
+# Any identifier, used to expand aliases back to the original names.
+_IDENTIFIER = re.compile(r'\b[A-Za-z_][A-Za-z0-9_]*\b')
+
+# Address columns some renderings put in front of every line.
+# The spacing after it is kept, it becomes the base indentation.
+_ADDRESS_PREFIX = re.compile(r'^(?:0x)?[0-9a-fA-F]{6,16}(?=(?: {2,}|\t))')
+
+# Long names worth an alias: auto-named variables and data, struct, union
+# and enum type names, and C++ template instantiations.
+_ALIAS_PATTERNS = (
+    ('v', re.compile(r'\b(?:var|arg)_[0-9a-fA-F]+(?:_\d+)?\b')),
+    ('d', re.compile(r'\b(?:data|jump_table|switch_table)_[0-9a-fA-F]+\b')),
+    ('T', re.compile(r'\b(?:struct|union|enum|class) [A-Za-z_][\w:]*')),
+    ('T', re.compile(r'\b[A-Za-z_][\w:]*<[^<>\n]*(?:<[^<>\n]*>[^<>\n]*)*>')),
+)
+
+
+class EnigmaCompactIL:
+    """
+    IL compacted for a prompt, and the aliases needed to undo it.
+    """
+
+    def __init__(self, text: str, aliases: dict, original_chars: int) -> None:
+        self.text = text
+        self.original_chars = original_chars
+
+        # Alias -> original name.
+        self.aliases = aliases
+
+    def expand(self, text: str) -> str:
+        """
+        Replace the aliases in a model response with the original names.
+        """
+        if not self.aliases or not text:
+            return text
+        return _IDENTIFIER.sub(lambda m: self.aliases.get(m.group(0), m.group(0)), text)
+
+
+class EnigmaILCompactor:
+    """
+    Shrinks rendered HLIL before it is sent to the model.
+
+    Address columns, blank lines and lines holding only a brace are dropped
+    and indentation is reduced to one space per level. Long generated names
+    (var_1c8_1, data_140023a40), struct types and template instantiations
+    are replaced by short aliases (v1, d1, T1) when that saves characters.
+    Aliases are numbered in order of first use, so the same IL always
+    compacts to the same text and prompt caching keeps working, and every
+    alias maps back to exactly one original name so responses can be
+    expanded again.
+    """
+
+    # Only alias names at least this long, or used this many times.
+    MIN_ALIAS_LENGTH = 10
+    MIN_ALIAS_USES = 3
+
+    def compact(self, il: str) -> EnigmaCompactIL:
+        """
+        Compact IL text.
+        return:
+            EnigmaCompactIL: The compacted text and its alias mapping.
+        """
+        if not il:
+            return EnigmaCompactIL(il, {}, 0)
+
+        text = self._strip_lines(il)
+        taken = set(_IDENTIFIER.findall(text))
+        aliases = {}
+
+        for prefix, pattern in _ALIAS_PATTERNS:
+            matches = pattern.findall(text)
+            counts = {}
+            for match in matches:
+                counts[match] = counts.get(match, 0) + 1
+
+            replacements = {}
+            index = 1
+            for name in dict.fromkeys(matches):
+                if len(name) < self.MIN_ALIAS_LENGTH and counts[name] < self.MIN_ALIAS_USES:
+                    continue
+                while f"{prefix}{index}" in taken or f"{prefix}{index}" in aliases:
+                    index += 1
+                alias = f"{prefix}{index}"
+                if len(alias) >= len(name):
+                    continue
+                replacements[name] = alias
+                aliases[alias] = name
+                index += 1
+
+            if replacements:
+                text = pattern.sub(lambda m: replacements.get(m.group(0), m.group(0)), text)
+
+        return EnigmaCompactIL(text, aliases, len(il))
+
+    def _strip_lines(self, il: str) -> str:
+        """
+        Drop address columns, blank and brace-only lines and shrink indentation.
+        """
+        lines = []
+        for line in il.splitlines():
+            line = _ADDRESS_PREFIX.sub('', line.rstrip())
+            stripped = line.lstrip()
+            if not stripped or stripped in ('{', '}', '};'):
+                continue
+            lines.append((len(line) - len(stripped), stripped))
+
+        # Indentation steps used by the renderer, usually 4 spaces.
+        indents = sorted({indent for indent, _ in lines})
+        levels = {indent: level for level, indent in enumerate(indents)}
+        return "\n".join(" " * levels[indent] + stripped for indent, stripped in lines)
@@ -0,0 +1,236 @@
+import threading
+
+
+class EnigmaContextPacker:
+    """
+    Fits a request into the model's context window.
+
+    Messages are added by priority: system prompts, the current function IL
+    and the new user message always go in, then the related context
+    (function summaries, documentation excerpts) if it fits, then as many of the most recent conversation
+    turns as the token budget allows. num_ctx is the same for every request
+    to a model, Ollama reloads the model (and drops its KV cache) whenever it
+    changes.
+
+    In prefix-stable mode (the default) messages are laid out so that the
+    start of the prompt changes as rarely as possible, which lets Ollama
+    reuse its KV cache between chat turns:
+
+        system prompts, function IL, history, related context, new message
+
+    The IL sits right after the fixed system prompts, so turns about the
+    same function share everything up to the new turn. The related context
+    is retrieved for each turn (document excerpts follow the question,
+    summaries of neighbours fill in over time), so it goes after the
+    history, where it doesn't move the cached prefix. When the history
+    no longer fits, the oldest turns are dropped in blocks of TRIM_STEP
+    messages rather than one turn at a time, so the first kept turn (and the
+    cached prefix) only moves every few turns.
+    """
+
+    # Rough estimate, HLIL and C are denser than prose.
+    CHARS_PER_TOKEN = 3.5
+
+    # Per-message overhead of the chat template.
+    MESSAGE_OVERHEAD = 4
+
+    # History is trimmed in blocks of this many messages in prefix-stable mode.
+    TRIM_STEP = 8
+
+    def __init__(self, reserve_tokens: int = 1024, max_num_ctx: int = 32768,
+                 default_context_length: int = 4096, prefix_stable: bool = True):
+        # Tokens kept free for the response.
+        self.reserve_tokens = reserve_tokens
+
+        # Upper bound for num_ctx even if the model supports more, large
+        # windows cost memory and prompt-eval time.
+        self.max_num_ctx = max_num_ctx
+
+        # Used when the model's context length can't be read from Ollama.
+        self.default_context_length = default_context_length
+
+        # Lay out messages for KV-cache reuse, see the class docstring.
+        self.prefix_stable = prefix_stable
+
+        self._context_lengths = {}
+        self._lock = threading.Lock()
+
+    def estimate_tokens(self, text: str) -> int:
+        """
+        Estimate the number of tokens in a piece of text.
+        """
+        if not text:
+            return 0
+        return int(len(text) / self.CHARS_PER_TOKEN) + 1
+
+    def message_tokens(self, message: dict) -> int:
+        """
+        Estimate the tokens a single chat message takes up.
+        """
+        return self.estimate_tokens(message.get('content') or "") + self.MESSAGE_OVERHEAD
+
+    def context_length(self, client, model: str) -> int:
+        """
+        Read the model's context length from Ollama's model info, once per
+        model. If the server can't be asked, default_context_length is used
+        and the server is asked again next time.
+        """
+        with self._lock:
+            if model in self._context_lengths:
+                return self._context_lengths[model]
+
+        length = self.default_context_length
+        try:
+            info = client.show(model)
+        except Exception as e:
+            print(f"Could not read context length for {model}: {e}")
+            return length
+        for key, value in (info.modelinfo or {}).items():
+            if key.endswith('.context_length'):
+                length = int(value)
+                break
+
+        with self._lock:
+            self._context_lengths[model] = length
+        return length
+
+    def budget(self, client, model: str) -> int:
+        """
+        Return the number of prompt tokens available for a model.
+        """
+        return self.num_ctx(client, model) - self.reserve_tokens
+
+    def pack(self, budget: int, system: list, function_il: dict, history: list,
+             message: dict = None, related: list = None) -> list:
+        """
+        Pack messages into a token budget.
+
+        Args:
+            budget: Prompt tokens available.
+            system: System prompt messages, always included.
+            function_il: Function IL message, truncated if it alone overflows.
+            history: Conversation turns, oldest first. The most recent turns
+                that fit are included.
+            message: The new user message, if any.
+            related: Related context messages, each dropped if it doesn't fit.
+
+        Returns:
+            list: The packed messages in the order they are sent.
+        """
+        used = sum(self.message_tokens(m) for m in system)
+        if message is not None:
+            used += self.message_tokens(message)
+
+        function_il = self._fit(function_il, budget - used)
+        used += self.message_tokens(function_il)
+
+        extras = []
+        for extra in related or []:
+            if self.message_tokens(extra) <= budget - used:
+                extras.append(extra)
+                used += self.message_tokens(extra)
+
+        if self.prefix_stable:
+            turns = self._trim_blocks(history, budget - used)
+            messages = list(system) + [function_il] + turns + extras
+        else:
+            turns = self._trim_newest(history, budget - used)
+            messages = list(system) + turns + [function_il] + extras
+
+        if message is not None:
+            messages.append(message)
+        return messages
+
+    def prompt_tokens(self, messages: list) -> int:
+        """
+        Estimate the prompt tokens of a list of messages.
+        """
+        return sum(self.message_tokens(m) for m in messages)
+
+    def _trim_newest(self, history: list, tokens: int) -> list:
+        """
+        Keep the most recent turns that fit, one turn at a time.
+        """
+        turns = []
+        for turn in reversed(history):
+            cost = self.message_tokens(turn)
+            if cost > tokens:
+                break
+            turns.append(turn)
+            tokens -= cost
+        turns.reverse()
+        return turns
+
+    def _trim_blocks(self, history: list, tokens: int) -> list:
+        """
+        Drop the oldest turns in blocks of TRIM_STEP until the rest fits.
+        """
+        costs = [self.message_tokens(turn) for turn in history]
+        total = sum(costs)
+        skip = 0
+        while total > tokens and skip < len(history):
+            step = min(self.TRIM_STEP, len(history) - skip)
+            total -= sum(costs[skip:skip + step])
+            skip += step
+        return list(history[skip:])
+
+    def num_ctx(self, client, model: str) -> int:
+        """
+        Return the num_ctx sent with every request to a model: its context
+        window, capped at max_num_ctx.
+        """
+        return min(self.context_length(client, model), self.max_num_ctx)
+
+    def split(self, text: str, tokens: int) -> list:
+        """
+        Split IL text into chunks of at most `tokens`, cutting between
+        statements. Cuts before a statement at the outermost indentation
+        (the start of a top-level block) are preferred, so a loop or switch
+        case stays in one chunk unless it is larger than a chunk by itself.
+        """
+        max_chars = max(1, int(tokens * self.CHARS_PER_TOKEN))
+        lines = text.splitlines()
+        # The first line may be the function signature, the body starts after it.
+        indents = [len(line) - len(line.lstrip()) for line in lines if line.strip()]
+        top = min(indents[1:] or indents, default=0)
+
+        chunks = []
+        current = []
+        size = 0
+        boundary = 0  # Index in `current` of the last top-level statement
+        for line in lines:
+            # A single statement larger than a chunk is cut anyway.
+            while len(line) > max_chars:
+                if current:
+                    chunks.append("\n".join(current))
+                    current, size, boundary = [], 0, 0
+                chunks.append(line[:max_chars])
+                line = line[max_chars:]
+
+            if size + len(line) + 1 > max_chars and current:
+                # Cut at the last top-level statement if that keeps at least
+                # half of the chunk, otherwise right here.
+                cut = boundary if boundary > len(current) // 2 else len(current)
+                chunks.append("\n".join(current[:cut]))
+                current = current[cut:]
+                size = sum(len(kept) + 1 for kept in current)
+                boundary = 0
+
+            if line.strip() and len(line) - len(line.lstrip()) <= top:
+                boundary = len(current)
+            current.append(line)
+            size += len(line) + 1
+
+        if current:
+            chunks.append("\n".join(current))
+        return [chunk for chunk in chunks if chunk.strip()]
+
+    def _fit(self, message: dict, tokens: int) -> dict:
+        """
+        Truncate a message so it fits in a number of tokens.
+        """
+        if self.message_tokens(message) <= tokens:
+            return message
+        chars = max(0, int((tokens - self.MESSAGE_OVERHEAD) * self.CHARS_PER_TOKEN) - 32)
+        content = (message.get('content') or "")[:chars] + "\n... [truncated]"
+        return {'role': message['role'], 'content': content}
@@ -0,0 +1,399 @@
+from binaryninja import BinaryView, BinaryDataNotification
+from .enigma_binapi import EnigmaBinAPI
+from .enigma_files import write_json_atomic
+from .enigma_ollama import EnigmaOllamaClient
+import hashlib
+import json
+import numpy as np
+import os
+import threading
+import time
+
+
+class EnigmaEmbeddingIndex:
+    """
+    Embeddings of the functions of one binary.
+
+    Vectors are L2-normalised and stored as rows of a contiguous float32
+    matrix in a memory-mapped file, so cosine similarity against every
+    function is a single matrix-vector product. Metadata (model, row of
+    each function and a digest of the text that was embedded) is kept in a
+    JSON file next to it. Rows of removed functions are zeroed and reused.
+    """
+
+    # Rows the matrix starts with, it doubles when full.
+    INITIAL_CAPACITY = 1024
+
+    def __init__(self, path: str):
+        self.path = path
+        self.matrix_path = path + '.f32'
+        self.meta_path = path + '.json'
+        self._lock = threading.Lock()
+
+        self.model = None
+        self.dim = 0
+        self.capacity = 0
+        self.rows = 0
+        self.free = []
+
+        # Function start -> [row, digest].
+        self.entries = {}
+        self._row_starts = []
+        self._matrix = None
+
+        if os.path.exists(self.meta_path) and os.path.exists(self.matrix_path):
+            with open(self.meta_path, 'r') as f:
+                meta = json.load(f)
+            self.model = meta['model']
+            self.dim = meta['dim']
+            self.capacity = meta['capacity']
+            self.rows = meta['rows']
+            self.free = meta['free']
+            self.entries = {int(start, 16): entry for start, entry in meta['entries'].items()}
+            self._row_starts = [None] * self.rows
+            for start, (row, _) in self.entries.items():
+                self._row_starts[row] = start
+            self._matrix = np.memmap(self.matrix_path, dtype=np.float32, mode='r+',
+                                     shape=(self.capacity, self.dim))
+
+    def reset(self, model: str, dim: int):
+        """
+        Start over if the embedding model or its dimension changed.
+        """
+        with self._lock:
+            if model == self.model and dim == self.dim:
+                return
+            self.model = model
+            self.dim = dim
+            self.capacity = 0
+            self.rows = 0
+            self.free = []
+            self.entries = {}
+            self._row_starts = []
+            self._matrix = None
+            if dim:
+                self._grow(self.INITIAL_CAPACITY)
+
+    def digest(self, start: int) -> str:
+        with self._lock:
+            entry = self.entries.get(start)
+            return entry[1] if entry else None
+
+    def starts(self) -> set:
+        with self._lock:
+            return set(self.entries)
+
+    def set(self, start: int, digest: str, vector: list):
+        """
+        Store the embedding of a function, replacing any previous one.
+        """
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector = vector / norm
+
+        with self._lock:
+            entry = self.entries.get(start)
+            if entry is not None:
+                row = entry[0]
+            elif self.free:
+                row = self.free.pop()
+            else:
+                if self.rows == self.capacity:
+                    self._grow(self.capacity * 2)
+                row = self.rows
+                self.rows += 1
+                self._row_starts.append(None)
+            self._matrix[row] = vector
+            self._row_starts[row] = start
+            self.entries[start] = [row, digest]
+
+    def remove(self, start: int):
+        with self._lock:
+            entry = self.entries.pop(start, None)
+            if entry is None:
+                return
+            self._matrix[entry[0]] = 0
+            self._row_starts[entry[0]] = None
+            self.free.append(entry[0])
+
+    def search(self, vector: list, top_k: int = 10) -> list:
+        """
+        Return the functions most similar to a query vector.
+        return:
+            list: (function start, cosine similarity) tuples, best first.
+        """
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        with self._lock:
+            if self._matrix is None or not self.rows or norm == 0 or query.shape[0] != self.dim:
+                return []
+            scores = self._matrix[:self.rows] @ (query / norm)
+            # Free rows are zero, push them behind every real match.
+            if self.free:
+                scores[self.free] = -np.inf
+
+            k = min(top_k, self.rows)
+            best = np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best])]
+            return [(self._row_starts[row], float(scores[row])) for row in best
+                    if self._row_starts[row] is not None]
+
+    def save(self):
+        """
+        Flush the matrix and write the metadata.
+        """
+        with self._lock:
+            if self._matrix is None:
+                return
+            self._matrix.flush()
+            write_json_atomic(self.meta_path, {
+                'model': self.model,
+                'dim': self.dim,
+                'capacity': self.capacity,
+                'rows': self.rows,
+                'free': self.free,
+                'entries': {f"{start:x}": entry for start, entry in self.entries.items()},
+            })
+
+    def _grow(self, capacity: int):
+        """
+        Move the matrix into a larger file. Called with the lock held.
+        """
+        tmp_path = self.matrix_path + '.tmp'
+        matrix = np.memmap(tmp_path, dtype=np.float32, mode='w+', shape=(capacity, self.dim))
+        if self._matrix is not None and self.rows:
+            matrix[:self.rows] = self._matrix[:self.rows]
+        matrix.flush()
+        del matrix
+        self._matrix = None
+        os.replace(tmp_path, self.matrix_path)
+        self.capacity = capacity
+        self._matrix = np.memmap(self.matrix_path, dtype=np.float32, mode='r+', shape=(capacity, self.dim))
+
+
+class EnigmaEmbeddingNotification(BinaryDataNotification):
+
+    def __init__(self, view: BinaryView) -> None:
+        """
+        Records the functions of a view whose embeddings are out of date.
+        """
+        super().__init__()
+        self.view = view
+        self.dirty = set()
+        self.lock = threading.Lock()
+
+        # EnigmaSemanticSearch instances using the view, unregistered with the last.
+        self.users = set()
+
+    def function_added(self, view, func) -> None:
+        with self.lock:
+            self.dirty.add(func.start)
+
+    def function_removed(self, view, func) -> None:
+        with self.lock:
+            self.dirty.add(func.start)
+
+    def function_updated(self, view, func) -> None:
+        with self.lock:
+            self.dirty.add(func.start)
+
+
+class EnigmaSemanticSearch:
+    """
+    Natural language search over the functions of a binary.
+
+    Every function is embedded through Ollama's embed endpoint from its
+    name, its one-line summary if there is one and the start of its HLIL.
+    The first update of a session checks every function against the stored
+    digests, later ones only the functions Binary Ninja reported as changed,
+    and only functions whose text changed are embedded again.
+
+    Indexes and view notifications are shared by every instance (one per
+    chat tab), so each view is watched once, until release() by the last
+    instance using it.
+    """
+
+    # HLIL characters embedded per function.
+    MAX_IL_CHARS = 4000
+
+    # Functions embedded per request.
+    BATCH_SIZE = 32
+
+    # Save the index at most this often while embedding (seconds).
+    SAVE_INTERVAL = 5.0
+
+    # Per index path: the index and the notification collecting changed
+    # functions of its view.
+    _indexes = {}
+    _notifications = {}
+
+    # Paths of the indexes whose functions were all checked while watched.
+    _scanned = set()
+
+    _lock = threading.Lock()
+
+    def __init__(self, client: EnigmaOllamaClient, summaries=None):
+        self.client = client
+        self.summaries = summaries
+        self.directory = os.path.join(client.cache_dir, 'embeddings')
+
+    def index(self, bv: BinaryView) -> EnigmaEmbeddingIndex:
+        """
+        Return the index of a binary, watching its view for changes.
+        """
+        path = self._path(bv)
+        with self._lock:
+            index = self._indexes.get(path)
+            if index is None:
+                if not os.path.exists(self.directory):
+                    os.makedirs(self.directory)
+                index = EnigmaEmbeddingIndex(path)
+                self._indexes[path] = index
+            notification = self._notifications.get(path)
+            if notification is None:
+                notification = EnigmaEmbeddingNotification(bv)
+                bv.register_notification(notification)
+                self._notifications[path] = notification
+                self._scanned.discard(path)
+            notification.users.add(self)
+            return index
+
+    def release(self, bv: BinaryView = None):
+        """
+        Stop using a view, or every view if None. The last instance to
+        release a view unregisters its notification, changes made while it
+        isn't watched are found by a full check on the next update.
+        """
+        with self._lock:
+            paths = [self._path(bv)] if bv is not None else list(self._notifications)
+            for path in paths:
+                notification = self._notifications.get(path)
+                if notification is None:
+                    continue
+                notification.users.discard(self)
+                if notification.users:
+                    continue
+                notification.view.unregister_notification(notification)
+                del self._notifications[path]
+                self._scanned.discard(path)
+
+    def _path(self, bv: BinaryView) -> str:
+        binary_id = hashlib.sha1(bv.file.filename.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, binary_id)
+
+    def update(self, bv: BinaryView, progress: callable = None,
+               cancel_event: threading.Event = None) -> int:
+        """
+        Embed the functions that are new or changed. Blocks, never call it
+        on the UI thread.
+        return:
+            int: The number of functions embedded.
+        """
+        progress = progress or (lambda status: None)
+        if not EnigmaBinAPI.wait_for_analysis(bv, progress, cancel_event):
+            return 0
+
+        index = self.index(bv)
+        with self._lock:
+            notification = self._notifications.get(index.path)
+        changed = set()
+        if notification is not None:
+            with notification.lock:
+                changed = set(notification.dirty)
+                notification.dirty.clear()
+
+        # Vectors of another model can't be compared, start over.
+        if index.model is not None and index.model != self.client.embedding_model:
+            index.reset(None, 0)
+            with self._lock:
+                self._scanned.discard(index.path)
+
+        with self._lock:
+            full_scan = index.path not in self._scanned
+            self._scanned.add(index.path)
+
+        functions = {func.start: func for func in bv.functions}
+        if full_scan:
+            candidates = list(functions)
+            removed = index.starts() - set(functions)
+        else:
+            candidates = [start for start in changed if start in functions]
+            removed = {start for start in changed if start not in functions}
+        for start in removed:
+            index.remove(start)
+
+        pending = []
+        for number, start in enumerate(candidates):
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            if number % 200 == 0:
+                progress(f"Checking functions: {number}/{len(candidates)}")
+            text = self.describe(bv, functions[start])
+            digest = hashlib.sha1(text.encode('utf-8')).hexdigest()
+            if index.digest(start) != digest:
+                pending.append((start, digest, text))
+
+        embedded = 0
+        saved = time.monotonic()
+        for offset in range(0, len(pending), self.BATCH_SIZE):
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            progress(f"Embedding functions: {offset}/{len(pending)}")
+            batch = pending[offset:offset + self.BATCH_SIZE]
+            vectors = self.embed([text for _, _, text in batch])
+            index.reset(self.client.embedding_model, len(vectors[0]))
+            for (start, digest, _), vector in zip(batch, vectors):
+                index.set(start, digest, vector)
+            embedded += len(batch)
+            if time.monotonic() - saved > self.SAVE_INTERVAL:
+                index.save()
+                saved = time.monotonic()
+
+        index.save()
+        if cancel_event is not None and cancel_event.is_set():
+            # Pick up where we stopped next time.
+            with self._lock:
+                self._scanned.discard(index.path)
+        print(f"Embedded {embedded} functions")
+        return embedded
+
+    def search(self, bv: BinaryView, query: str, top_k: int = 10, progress: callable = None,
+               cancel_event: threading.Event = None) -> list:
+        """
+        Update the index and return the functions best matching a question.
+        return:
+            list: (function start, function name, similarity) tuples, best first.
+        """
+        self.update(bv, progress, cancel_event)
+        progress = progress or (lambda status: None)
+        progress("Searching")
+        index = self.index(bv)
+        results = []
+        for start, score in index.search(self.embed([query])[0], top_k):
+            func = bv.get_function_at(start)
+            if func is not None:
+                results.append((start, func.name, score))
+        return results
+
+    def describe(self, bv: BinaryView, func) -> str:
+        """
+        Return the text embedded for a function.
+        """
+        parts = [func.name]
+        if self.summaries is not None:
+            summary = self.summaries.store(bv).get(func.start)
+            if summary:
+                parts.append(summary)
+        parts.append(str(func.high_level_il)[:self.MAX_IL_CHARS])
+        return "\n".join(parts)
+
+    def embed(self, texts: list) -> list:
+        """
+        Embed texts with the configured embedding model.
+        """
+        if self.client.client is None:
+            raise RuntimeError("No Ollama server configured")
+        response = self.client.client.embed(model=self.client.embedding_model, input=texts,
+                                            keep_alive=self.client.keep_alive)
+        return response.embeddings
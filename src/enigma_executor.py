@@ -0,0 +1,459 @@
+from PySide6 import QtCore
+from .enigma_ollama import EnigmaChatCall, EnigmaOllamaClient, MType
+from collections import deque
+from enum import IntEnum
+import concurrent.futures
+import itertools
+import threading
+
+
+class Priority(IntEnum):
+    """
+    Scheduling classes of the executor, most urgent first.
+    """
+    INTERACTIVE = 0  # Chat messages, a user is waiting on every token
+    CLICK = 1        # Explain and rename clicks
+    BATCH = 2        # Whole-binary work such as the batch rename
+    PREFETCH = 3     # Speculative work such as neighbour summaries
+
+
+# Priority of a request by message type, unless set otherwise.
+DEFAULT_PRIORITIES = {
+    MType.SYSTEM: Priority.INTERACTIVE,
+    MType.SYSTEM_SUMMARY: Priority.PREFETCH,
+}
+
+
+class EnigmaRequest(QtCore.QObject):
+    """
+    A single request for the executor. Each request carries its own progress
+    and result signals so concurrent requests never share a channel.
+    """
+
+    progress = QtCore.Signal(str)   # Streamed (coalesced) response text
+    finished = QtCore.Signal(str)   # Full response once the stream ends
+    failed = QtCore.Signal(str)     # Error message if the request raised
+    cancelled = QtCore.Signal(str)  # Partial response if the request was cancelled
+    status = QtCore.Signal(str)     # Progress of the stages before streaming starts
+    metrics = QtCore.Signal(dict)   # Timing and token counts once the request completes
+
+    _ids = itertools.count(1)
+
+    def __init__(self, client: EnigmaOllamaClient, mtype: MType = MType.SYSTEM,
+                 message: str = None, function_il: str = None):
+        super().__init__()
+        self.id = next(self._ids)
+        self.client = client
+        self.mtype = mtype
+        self.message = message
+        self.function_il = function_il
+        self.result = None
+        self.error = None
+
+        # Scheduling class on the executor, see Priority.
+        self.priority = DEFAULT_PRIORITIES.get(mtype, Priority.CLICK)
+
+        # Start address of the function the request is about, if any.
+        self.function_start = None
+
+        # Optional callable(progress, cancel_event) -> EnigmaFunctionContext,
+        # run on the worker before the model is called.
+        self.context_provider = None
+        self.context = None
+
+        # EnigmaConversation of the chat tab, chat requests read and extend it.
+        self.conversation = None
+
+        # Set to False to bypass the response cache for this request.
+        self.use_cache = True
+
+        # Optional callable(request) run on a worker thread
+        # once the request completes, for consumers without a Qt event loop.
+        self.on_done = None
+
+        # The executor running the request, set by submit().
+        self.executor = None
+
+        self._cancel_event = threading.Event()
+        self._done = threading.Event()
+
+    def cancel(self):
+        """
+        Cancel the request. A queued request is skipped, a streaming one is
+        stopped at its next chunk and its HTTP stream closed. Safe to call
+        from any thread.
+        """
+        self._cancel_event.set()
+
+    def is_cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+
+    def wait(self, timeout: float = None) -> bool:
+        """
+        Block until the request completed, returns False on timeout.
+        """
+        return self._done.wait(timeout)
+
+    def run(self):
+        """
+        Run the request on the calling (worker) thread. The function context
+        is captured first, the LLM request only starts once it is ready.
+        """
+        if not self._capture_context():
+            return ""
+        name = self._pack_name()
+        if name is not None:
+            return name
+        if self._needs_chunks():
+            return self.client.chat_chunked(on_status=self.status.emit, run_all=self._run_all,
+                                            **self._chat_kwargs())
+        return self.client.chat(self.message, self.mtype, **self._chat_kwargs())
+
+    def run_async(self) -> concurrent.futures.Future:
+        """
+        Like run(), but the stream is handed to the asyncio backend and the
+        returned future resolves to the response, or to the EnigmaChatCall
+        still to be finished with client.finish_chat().
+        """
+        if not self._capture_context():
+            future = concurrent.futures.Future()
+            future.set_result("")
+            return future
+        name = self._pack_name()
+        if name is not None:
+            future = concurrent.futures.Future()
+            future.set_result(name)
+            return future
+        if self._needs_chunks():
+            # The chunks run as requests of their own, only the final merge
+            # would stream, so run the whole thing here.
+            future = concurrent.futures.Future()
+            future.set_result(self.client.chat_chunked(on_status=self.status.emit, run_all=self._run_all,
+                                                       **self._chat_kwargs()))
+            return future
+        return self.client.chat_async(self.message, self.mtype, **self._chat_kwargs())
+
+    def _pack_name(self) -> str:
+        """
+        Renames of functions named in an annotation pack never reach the model.
+        """
+        annotation = self.context.annotation if self.context is not None else None
+        if self.mtype != MType.SYSTEM_RENAME_FN or not self.use_cache or not annotation:
+            return None
+        name = annotation.get('name')
+        if not name:
+            return None
+        self.progress.emit(name)
+        self.metrics.emit({'ttft': 0.0, 'cached': True, 'pack': True})
+        return name
+
+    def _related(self) -> str:
+        """
+        Related function summaries, led by the pack summary of the function
+        itself unless the cache (and so the packs) is bypassed.
+        """
+        if self.context is None:
+            return None
+        related = self.context.related
+        annotation = self.context.annotation
+        if self.use_cache and annotation and annotation.get('summary'):
+            known = f"Summary of this function from an annotation pack: {annotation['summary']}"
+            related = known + "\n" + related if related else known
+        return related
+
+    def _run_all(self, calls: list) -> list:
+        """
+        Run the chunk and merge calls of a chunked explanation as requests of
+        this request's class, sharing its cancellation.
+        """
+        requests = []
+        for mtype, function_il in calls:
+            request = EnigmaRequest(self.client, mtype, function_il=function_il)
+            request.priority = self.priority
+            request.use_cache = self.use_cache
+            request._cancel_event = self._cancel_event
+            requests.append(request)
+        executor = self.executor or EnigmaExecutor.shared()
+        return [request.result or "" for request in executor.run_all(requests)]
+
+    def _needs_chunks(self) -> bool:
+        """
+        Explanations of functions too large for the context window are map-reduced.
+        """
+        return self.mtype == MType.SYSTEM_PSEUDO and not self.client.fits_context(self.mtype, self.function_il)
+
+    def _capture_context(self) -> bool:
+        """
+        Capture the function context, returns False if cancelled meanwhile.
+        """
+        if self.context_provider is not None:
+            self.context = self.context_provider(self.status.emit, self._cancel_event)
+            if self.context is None or self.is_cancelled():
+                return False
+            self.function_il = self.context.il
+
+        self.status.emit("Waiting for the model")
+        return True
+
+    def _chat_kwargs(self) -> dict:
+        return {
+            'function_il': self.function_il,
+            'on_chunk': self.progress.emit,
+            'cancel_event': self._cancel_event,
+            'use_cache': self.use_cache,
+            'on_metrics': self.metrics.emit,
+            'related': self._related(),
+            'conversation': self.conversation,
+        }
+
+
+class EnigmaExecutor:
+    """
+    Long-lived pool of worker threads serving a queue of EnigmaRequests.
+    One executor is shared by the whole plugin, see shared().
+
+    With the client's asyncio backend a worker only captures the context and
+    hands the stream to the event loop, so it is free for the next request
+    while many streams run concurrently. Finished streams come back to the
+    workers, ahead of queued requests, to be completed off the loop.
+
+    Requests are queued per Priority class and workers always take the most
+    urgent one, so a chat message jumps every queued batch or prefetch
+    request. A class with a limit never has more requests running (until
+    their streams complete) than its limit, and batch and prefetch work
+    never takes the last `reserved_workers` idle workers, which are kept
+    for requests a user is waiting on.
+    """
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, workers: int = 3):
+        self._queues = {priority: deque() for priority in Priority}
+        self._running = {priority: 0 for priority in Priority}
+        self._busy = 0
+        self._active = set()
+        self._finishing = deque()
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._threads = []
+
+        # Running requests allowed per class, None for no limit.
+        self.limits = {
+            Priority.INTERACTIVE: None,
+            Priority.CLICK: None,
+            Priority.BATCH: 4,
+            Priority.PREFETCH: 2,
+        }
+        self.reserved_workers = 1
+        self.ensure_workers(workers)
+
+    def ensure_workers(self, workers: int):
+        """
+        Grow the pool to at least `workers` threads. Threads are never torn
+        down, so this only ever adds long-lived workers.
+        """
+        with self._lock:
+            while len(self._threads) < workers:
+                thread = threading.Thread(target=self._work, name=f"EnigmaWorker-{len(self._threads)}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    @classmethod
+    def shared(cls) -> "EnigmaExecutor":
+        """
+        Return the plugin-wide executor, creating it on first use.
+        """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def submit(self, request: EnigmaRequest) -> EnigmaRequest:
+        """
+        Queue a request. Results arrive through the request's own signals.
+        """
+        # Keep a reference until the request is done so its signals stay alive.
+        request.executor = self
+        with self._cond:
+            self._active.add(request)
+            self._queues[request.priority].append(request)
+            self._cond.notify()
+        return request
+
+    def run_all(self, requests: list) -> list:
+        """
+        Submit requests and wait until all of them completed. Meant for a
+        running request that needs requests of its own: the calling worker
+        runs those still queued itself, in the slot of the request it runs,
+        so they never wait for workers that are all waiting on them.
+        """
+        for request in requests:
+            self.submit(request)
+        for request in requests:
+            if self._steal(request):
+                self._run(request)
+            self._wait(request)
+        return requests
+
+    def _wait(self, request: EnigmaRequest):
+        """
+        Wait for a request, completing finished streams meanwhile since the
+        request's own may be among them.
+        """
+        while True:
+            with self._cond:
+                while not request._done.is_set() and not self._finishing:
+                    self._cond.wait()
+                if request._done.is_set():
+                    return
+                request_done, future = self._finishing.popleft()
+            self._complete(request_done, future=future)
+
+    def set_limit(self, priority: Priority, limit: int = None):
+        """
+        Set how many requests of a class may run at once, None for no limit.
+        Batch and prefetch work also get enough workers for their limit on
+        top of the reserved ones.
+        """
+        with self._cond:
+            self.limits[priority] = limit
+            self._cond.notify_all()
+        if limit is not None and priority >= Priority.BATCH:
+            self.ensure_workers(limit + self.reserved_workers)
+
+    def info(self) -> dict:
+        """
+        Return the number of queued and running requests of every class.
+        """
+        with self._lock:
+            return {priority: (len(self._queues[priority]), self._running[priority]) for priority in Priority}
+
+    def _steal(self, request: EnigmaRequest) -> bool:
+        """
+        Take a request off its queue if no worker took it yet.
+        """
+        with self._cond:
+            try:
+                self._queues[request.priority].remove(request)
+            except ValueError:
+                return False
+            self._running[request.priority] += 1
+            return True
+
+    def _take(self) -> EnigmaRequest:
+        """
+        Pop the most urgent request allowed to run now, or None. Called with
+        the lock held.
+        """
+        idle = len(self._threads) - self._busy
+        for priority in Priority:
+            pending = self._queues[priority]
+            if not pending:
+                continue
+            limit = self.limits.get(priority)
+            if limit is not None and self._running[priority] >= limit:
+                continue
+            if priority >= Priority.BATCH and idle <= self.reserved_workers:
+                continue
+            self._running[priority] += 1
+            return pending.popleft()
+        return None
+
+    def _next(self) -> tuple:
+        """
+        Pop a finished stream to complete or else a request to run, as
+        (request, future) with a None future for requests, or None. Called
+        with the lock held.
+        """
+        if self._finishing:
+            return self._finishing.popleft()
+        request = self._take()
+        return (request, None) if request is not None else None
+
+    def _work(self):
+        """
+        Worker loop, runs for the lifetime of the process.
+        """
+        while True:
+            with self._cond:
+                job = self._next()
+                while job is None:
+                    self._cond.wait()
+                    job = self._next()
+                self._busy += 1
+            request, future = job
+            try:
+                if future is None:
+                    self._run(request)
+                else:
+                    self._complete(request, future=future)
+            finally:
+                with self._cond:
+                    self._busy -= 1
+                    self._cond.notify_all()
+
+    def _run(self, request: EnigmaRequest):
+        # Cancelled while still queued, never reaches the server.
+        if request.is_cancelled():
+            self._complete(request, result="")
+            return
+
+        try:
+            if request.client.backend == EnigmaOllamaClient.BACKEND_ASYNCIO:
+                future = request.run_async()
+                future.add_done_callback(lambda f: self._finished(request, f))
+                return
+            result = request.run()
+        except Exception as e:
+            self._complete(request, error=e)
+        else:
+            self._complete(request, result=result)
+
+    def _finished(self, request: EnigmaRequest, future: concurrent.futures.Future):
+        """
+        Hand a finished stream back to the workers, runs on the event loop.
+        """
+        with self._cond:
+            self._finishing.append((request, future))
+            self._cond.notify_all()
+
+    def _complete(self, request: EnigmaRequest, result: str = None, error: Exception = None,
+                  future: concurrent.futures.Future = None):
+        """
+        Emit the outcome of a request and release it.
+        """
+        if future is not None:
+            try:
+                result = future.result()
+                if isinstance(result, EnigmaChatCall):
+                    result = request.client.finish_chat(result)
+            except Exception as e:
+                error = e
+
+        try:
+            if error is not None:
+                print(f"EnigmaAI request {request.id} failed: {error}")
+                request.error = str(error)
+                request.failed.emit(request.error)
+            else:
+                request.result = result or ""
+                if request.is_cancelled():
+                    request.cancelled.emit(request.result)
+                else:
+                    request.finished.emit(request.result)
+        except Exception as e:
+            # A slot or signal that raised must not keep the request's slot.
+            print(f"EnigmaAI request {request.id} signal failed: {e}")
+        finally:
+            with self._cond:
+                self._active.discard(request)
+                self._running[request.priority] -= 1
+                request._done.set()
+                self._cond.notify_all()
+
+        if request.on_done is not None:
+            try:
+                request.on_done(request)
+            except Exception as e:
+                print(f"EnigmaAI request {request.id} callback failed: {e}")
@@ -0,0 +1,20 @@
+import json
+import os
+import tempfile
+
+
+def write_json_atomic(path: str, data) -> None:
+    """
+    Write JSON to a temporary file next to `path` and move it into place,
+    so readers never see a half-written file even if the process dies.
+    """
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -0,0 +1,164 @@
+from ollama import ResponseError
+import concurrent.futures
+import threading
+
+
+class EnigmaHedgeAttempt:
+    """
+    One of the streams racing for a hedged call.
+    """
+
+    def __init__(self, endpoint, model: str, hedge: bool):
+        self.endpoint = endpoint
+        self.model = model
+        self.hedge = hedge
+        self.done = False
+
+
+class EnigmaHedgedStream:
+    """
+    Streams a chat call and, if no token arrives within `delay` seconds,
+    sends the same request to a second server (or `hedge_model`). The first
+    stream to produce a token wins, the other is cancelled, which closes its
+    HTTP response so the server stops generating. Both streams run on the
+    asyncio backend, which can abort a stream still waiting for its first
+    token. The result resolves to the call, as for chat_async().
+
+    If the first stream fails before any token, the hedge is sent right away.
+    """
+
+    def __init__(self, client, call, result: concurrent.futures.Future, delay: float,
+                 hedge_model: str = None):
+        self.client = client
+        self.call = call
+        self.result = result
+        self.delay = delay
+        self.hedge_model = hedge_model or call.model
+        self.attempts = []
+        self.winner = None
+        self.error = None
+        self._timer = None
+        self._finished = False
+
+        # Reentrant, a hedge may be launched while _done holds it.
+        self._lock = threading.RLock()
+
+    def start(self):
+        endpoint = self.client.pool.acquire(self.call.model)
+        self._launch(EnigmaHedgeAttempt(endpoint, self.call.model, hedge=False))
+        self._timer = threading.Timer(self.delay, self._hedge)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _launch(self, attempt: EnigmaHedgeAttempt):
+        with self._lock:
+            self.attempts.append(attempt)
+        request = dict(self.call.request_kwargs(), model=attempt.model)
+        stream = self.client.async_backend().stream(
+            attempt.endpoint.url, request,
+            lambda part: self._on_part(attempt, part),
+            lambda: self._is_cancelled(attempt))
+        stream.add_done_callback(lambda future: self._done(attempt, future))
+
+    def _hedge(self) -> bool:
+        """
+        Send the hedge request, unless a stream already won or the call ended.
+        """
+        # Held until the hedge is in self.attempts, so _done sees it running.
+        with self._lock:
+            if (self.winner is not None or self._finished or self.call.is_cancelled()
+                    or any(attempt.hedge for attempt in self.attempts)):
+                return False
+            primary = self.attempts[0]
+            pool = self.client.pool
+
+            # Prefer another server, a different model may also run on the same one.
+            endpoint = pool.acquire(self.hedge_model, exclude={primary.endpoint.url})
+            if endpoint is None and self.hedge_model != primary.model:
+                endpoint = pool.acquire(self.hedge_model)
+            if endpoint is None:
+                return False
+
+            print(f"Hedging chat request on {endpoint.url} with {self.hedge_model}")
+            self.call.metrics['hedged'] = True
+            self.client.hedge_stats['hedged'] += 1
+            self._launch(EnigmaHedgeAttempt(endpoint, self.hedge_model, hedge=True))
+            return True
+
+    def _on_part(self, attempt: EnigmaHedgeAttempt, part):
+        """
+        Runs on the loop thread. The first part with text decides the winner.
+        """
+        if self.winner is None:
+            if not part.message.content and not part.done:
+                return
+            with self._lock:
+                if self.winner is None:
+                    self.winner = attempt
+                    if self._timer is not None:
+                        self._timer.cancel()
+        if self.winner is attempt:
+            self.call.add_part(part)
+
+    def _is_cancelled(self, attempt: EnigmaHedgeAttempt) -> bool:
+        winner = self.winner
+        return self.call.is_cancelled() or (winner is not None and winner is not attempt)
+
+    def _done(self, attempt: EnigmaHedgeAttempt, future: concurrent.futures.Future):
+        """
+        Runs on the loop thread, whatever happens the result must resolve.
+        """
+        try:
+            self._settle(attempt, future)
+        except Exception as e:
+            with self._lock:
+                self._finished = True
+            if not self.result.done():
+                self.result.set_exception(e)
+
+    def _settle(self, attempt: EnigmaHedgeAttempt, future: concurrent.futures.Future):
+        error = None
+        try:
+            future.result()
+        except concurrent.futures.CancelledError:
+            pass
+        except Exception as e:
+            error = e
+
+        with self._lock:
+            attempt.done = True
+            winner = self.winner
+        pool = self.client.pool
+        pool.release(attempt.endpoint, attempt.model if error is None and winner is attempt else None)
+
+        if winner is not None and winner is not attempt:
+            return  # The loser, cancelled.
+
+        if winner is attempt:
+            if self.call.metrics.get('hedged'):
+                self.call.metrics['hedge_won'] = attempt.hedge
+                if attempt.hedge:
+                    self.client.hedge_stats['hedge_won'] += 1
+            self.call.metrics['endpoint'] = attempt.endpoint.url
+            if error is not None:
+                self.result.set_exception(error)
+            else:
+                self.result.set_result(self.call)
+            return
+
+        # Ended without a single token, send the hedge now if it isn't out yet.
+        if error is not None:
+            self.error = error
+            if not isinstance(error, ResponseError):
+                pool.mark_failed(attempt.endpoint, error)
+            self._hedge()
+        with self._lock:
+            if self._finished or any(not other.done for other in self.attempts):
+                return
+            self._finished = True
+        if self._timer is not None:
+            self._timer.cancel()
+        if self.call.is_cancelled() or self.error is None:
+            self.result.set_result(self.call)
+        else:
+            self.result.set_exception(self.error)
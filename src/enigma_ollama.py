@@ -3,18 +3,199 @@ from ollama import ChatResponse
 from enum import Enum
 from collections import deque
 from .enigma_prompts import EnigmaPrompts
+from .enigma_stream import EnigmaTokenCoalescer
+from .enigma_cache import EnigmaResponseCache
+from .enigma_context import EnigmaContextPacker
+from .enigma_async import EnigmaAsyncBackend
+from .enigma_files import write_json_atomic
+from .enigma_compact import EnigmaILCompactor
+from .enigma_similar import EnigmaSimilarityIndex
+from .enigma_pool import EnigmaEndpointPool, EnigmaEndpoint
+from .enigma_hedge import EnigmaHedgedStream
+from ollama import ResponseError
+import concurrent.futures
+import httpx
 import json
 import os
+import re
+import threading
+import time
 from PySide6 import QtCore
 
 class MType(Enum):
     SYSTEM = 1
     SYSTEM_PSEUDO = 2
     SYSTEM_RENAME_FN = 3
+    SYSTEM_SUMMARY = 4
+    SYSTEM_CHUNK = 5
+    SYSTEM_REDUCE = 6
+
+# One ollama.Client, and so one pool of keep-alive HTTP connections, per host
+# for the whole process.
+_http_clients = {}
+_http_clients_lock = threading.Lock()
+
+def shared_http_client(host: str, port: int = None) -> Client:
+    """
+    Return the process-wide Ollama client for a host, creating it on first use.
+    The host may be a full URL including the port.
+    """
+    url = host if port is None else f"{host}:{port}"
+    with _http_clients_lock:
+        client = _http_clients.get(url)
+        if client is None:
+            limits = httpx.Limits(max_connections=32, max_keepalive_connections=16, keepalive_expiry=120)
+            client = Client(host=url, limits=limits)
+            _http_clients[url] = client
+        return client
+
+class EnigmaConversation:
+    """
+    Chat history of one chat tab. Tabs of different binaries share the
+    client but never each other's history.
+    """
+
+    def __init__(self, maxlen: int = 200):
+        # How much of the history is sent is decided by the context packer.
+        self._messages = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+
+    def append(self, role: str, content: str) -> dict:
+        message = {'role': role, 'content': content}
+        with self._lock:
+            self._messages.append(message)
+        return message
+
+    def messages(self) -> list:
+        with self._lock:
+            return list(self._messages)
+
+    def clear(self):
+        with self._lock:
+            self._messages.clear()
+
+# Identifier characters at the end of streamed text, possibly an alias cut in two.
+_TRAILING_IDENTIFIER = re.compile(r'[A-Za-z0-9_]+$')
+
+# A Go duration as Ollama parses keep_alive, e.g. "30m", "1h30m" or "-1s".
+_DURATION = re.compile(r'^-?(?:(?:\d+(?:\.\d*)?|\.\d+)(?:ns|us|µs|ms|s|m|h))+$')
+
+class EnigmaChatCall:
+    """
+    State of a single streamed chat call, shared by the thread and asyncio backends.
+    """
+
+    def __init__(self, type: MType, message: str, messages: list, coalescer: EnigmaTokenCoalescer,
+                 cancel_event: threading.Event = None, on_metrics: callable = None):
+        self.type = type
+        self.message = message
+        self.messages = messages
+        self.coalescer = coalescer
+        self.conversation = None
+        self.cancel_event = cancel_event or threading.Event()
+        self.on_metrics = on_metrics
+        self.model = None
+        self.options = None
+        self.keep_alive = None
+        self.cache_key = None
+        self.cached = False
+        self.text = ""
+
+        # EnigmaCompactIL of the function IL, if it was compacted.
+        self.compact = None
+
+        # Streamed text held back until it can be expanded, see add_text.
+        self._held = ""
+
+        # The IL as shown in Binary Ninja, for the similarity index.
+        self.function_il = None
+        self.started = time.monotonic()
+        self.metrics = {'cached': False}
+
+    def request_kwargs(self) -> dict:
+        """
+        Arguments for Client.chat / AsyncClient.chat.
+        """
+        return {
+            'model': self.model,
+            'messages': self.messages,
+            'stream': True,
+            'options': self.options,
+            'keep_alive': self.keep_alive,
+        }
+
+    def is_cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def result(self) -> str:
+        """
+        The response text, with IL aliases expanded to the original names.
+        """
+        if self.compact is None:
+            return self.text
+        return self.compact.expand(self.text)
+
+    def add_text(self, text: str):
+        if 'ttft' not in self.metrics and text:
+            self.metrics['ttft'] = time.monotonic() - self.started
+        self.text += text
+        if self.compact is None or not self.compact.aliases:
+            self.coalescer.push(text)
+            return
+
+        # Stream with the aliases expanded. An identifier at the end of a
+        # chunk may continue in the next one, so it waits for that chunk.
+        text = self._held + text
+        match = _TRAILING_IDENTIFIER.search(text)
+        cut = match.start() if match else len(text)
+        self._held = text[cut:]
+        self.coalescer.push(self.compact.expand(text[:cut]))
+
+    def flush(self):
+        """
+        Hand on whatever streamed text is still buffered.
+        """
+        if self._held:
+            self.coalescer.push(self.compact.expand(self._held) if self.compact else self._held)
+            self._held = ""
+        self.coalescer.flush()
+
+    def add_part(self, part: ChatResponse):
+        """
+        Record a streamed response part.
+        """
+        if part.done:
+            self.metrics['prompt_eval_count'] = part.prompt_eval_count
+            self.metrics['prompt_eval_duration'] = (part.prompt_eval_duration or 0) / 1e9
+            self.metrics['load_duration'] = (part.load_duration or 0) / 1e9
+            self.metrics['eval_count'] = part.eval_count
+        self.add_text(part.message.content)
 
 class EnigmaOllamaClient(QtCore.QObject):  # Inherit from QObject
 
     response_received = QtCore.Signal(str)  # Define a signal
+    model_state_changed = QtCore.Signal(str)  # "unloaded", "loading", "loaded" or "error: ..."
+
+    # Stateless request types whose responses are cached on disk.
+    CACHED_TYPES = (MType.SYSTEM_PSEUDO, MType.SYSTEM_RENAME_FN, MType.SYSTEM_SUMMARY,
+                    MType.SYSTEM_CHUNK, MType.SYSTEM_REDUCE)
+
+    # Stateless request types whose IL is compacted, see EnigmaILCompactor.
+    COMPACT_TYPES = CACHED_TYPES
+
+    # Request types whose results are reused for near-duplicate functions,
+    # and their kind in the similarity index.
+    SIMILAR_TYPES = {MType.SYSTEM_PSEUDO: 'explain', MType.SYSTEM_RENAME_FN: 'rename'}
+
+    # Request types a user is waiting on, hedged when hedge_delay is set.
+    HEDGED_TYPES = (MType.SYSTEM,)
+
+    # Streams run on the executor's worker threads with the blocking client,
+    # or are multiplexed on one asyncio event loop with AsyncClient.
+    BACKEND_THREAD = "thread"
+    BACKEND_ASYNCIO = "asyncio"
+
+    DEFAULT_KEEP_ALIVE = "30m"
 
     def __init__(self, host: str = None, port: int = None, model: str = None):
         super().__init__()  # Call QObject's constructor
@@ -24,7 +205,54 @@ class EnigmaOllamaClient(QtCore.QObject):  # Inherit from QObject
         self.port = port
         self.system_messages_general = EnigmaPrompts.general
         self.system_messages_pseudo_c = EnigmaPrompts.pseudo_c
-        self.conversation_history = deque(maxlen=20)
+        # History of chat requests that don't bring their own conversation.
+        self.conversation = EnigmaConversation()
+        self.context_packer = EnigmaContextPacker()
+
+        # How long Ollama keeps the model (and its KV cache) loaded after a
+        # request. Long enough to span the pauses between chat turns.
+        # Configurable from the Model tab and saved in model.json.
+        self.keep_alive = self.DEFAULT_KEEP_ALIVE
+
+        # Model used for semantic search over functions, see EnigmaSemanticSearch.
+        # Saved in model.json.
+        self.embedding_model = "nomic-embed-text"
+
+        # Load state of the selected model, see preload_model.
+        self.model_state = "unloaded"
+        self._preload_lock = threading.Lock()
+        self._preloading = None
+        self._preload_next = None
+
+        # Saved in server.json, see set_backend.
+        self.backend = self.BACKEND_THREAD
+
+        # Servers besides host:port requests are spread over, e.g.
+        # "http://gpu2:11434". Saved in server.json, see set_endpoints.
+        self.endpoints = []
+        self.pool = EnigmaEndpointPool(client_factory=shared_http_client)
+
+        # Chat requests without a token after `hedge_delay` seconds are also
+        # sent to another server, or to `hedge_model`, see EnigmaHedgedStream.
+        # None disables hedging. Saved in model.json, see set_hedging.
+        self.hedge_delay = None
+        self.hedge_model = None
+        self.hedge_stats = {'requests': 0, 'hedged': 0, 'hedge_won': 0}
+
+        # Streamed chunks are batched before being signalled to the UI thread.
+        # Flush at most every `stream_flush_interval` seconds, or earlier once
+        # `stream_flush_bytes` characters are buffered.
+        self.stream_flush_interval = 0.05
+        self.stream_flush_bytes = 2048
+
+        # Compact the function IL of stateless requests before sending it, see EnigmaILCompactor.
+        self.compact_il = True
+        self.il_compactor = EnigmaILCompactor()
+
+        # Optional RagDocs, the best matching excerpts of the user's documents
+        # are added to chat and explain requests.
+        self.documents = None
+        self.document_top_k = 4
 
         # Current function IL
         self.function_il = {
@@ -39,6 +267,19 @@ class EnigmaOllamaClient(QtCore.QObject):  # Inherit from QObject
         if not os.path.exists(self.cache_dir):
             os.makedirs(self.cache_dir)
 
+        # Last contents read from or written to each config file, so files
+        # are only rewritten when something actually changed.
+        self._saved_config = {}
+
+        # Explain and rename responses, replayed when model, prompts and IL match
+        self.response_cache = EnigmaResponseCache(os.path.join(self.cache_dir, 'responses.sqlite3'))
+
+        # Explain and rename results of earlier functions, reused for
+        # near-duplicate IL in any binary. Set reuse_similar to False to
+        # always ask the model.
+        self.similarity_index = EnigmaSimilarityIndex(os.path.join(self.cache_dir, 'similar.sqlite3'))
+        self.reuse_similar = True
+
         # Load the cached model and set it       
         self._load_model_config()
 
@@ -56,14 +297,118 @@ class EnigmaOllamaClient(QtCore.QObject):  # Inherit from QObject
         if model:
             self.ollama_model = model
             self.cache_data()
+
+        # Warm up the selected or restored model so the first chat doesn't
+        # pay the load time.
+        self.preload_model()
  
     def create_client(self):
         """ Create the Ollama client. """
         
-        # Create the client 
-        self.client = Client(host=f"{self.host}:{self.port}")
+        # Reuse the pooled client of the host, if any
+        self.client = shared_http_client(self.host, self.port)
+        self.pool.set_urls([self.host_url()] + self.endpoints)
         self.cache_data()
 
+    def set_server(self, host: str, port: int):
+        """
+        Point the client at another server in place, keeping the model and
+        conversation history.
+        """
+        if self.client is not None and (host, port) == (self.host, self.port):
+            return
+        self.host = host
+        self.port = port
+        self.create_client()
+        self.preload_model()
+
+    def set_endpoints(self, endpoints: list):
+        """
+        Set the additional servers requests are load balanced over.
+        """
+        endpoints = [endpoint.strip().rstrip('/') for endpoint in endpoints if endpoint.strip()]
+        endpoints = [endpoint if "://" in endpoint else f"http://{endpoint}" for endpoint in endpoints]
+        self.endpoints = list(dict.fromkeys(endpoints))
+        if self.client is not None:
+            self.pool.set_urls([self.host_url()] + self.endpoints)
+        self.cache_data()
+
+    def host_url(self) -> str:
+        """
+        Return the URL of the configured server.
+        """
+        return f"{self.host}:{self.port}"
+
+    def set_backend(self, backend: str):
+        """
+        Select the thread or asyncio backend for streaming requests.
+        """
+        if backend not in (self.BACKEND_THREAD, self.BACKEND_ASYNCIO):
+            raise ValueError(f"Unknown backend: {backend}")
+        self.backend = backend
+        self.cache_data()
+
+    def async_backend(self) -> EnigmaAsyncBackend:
+        """
+        Return the shared asyncio backend.
+        """
+        return EnigmaAsyncBackend.shared()
+
+    def preload_model(self):
+        """
+        Load the selected model on the server in the background. Ollama loads
+        a model when sent an empty prompt and keeps it for `keep_alive`.
+        Asked again while a preload runs with other settings, the model is
+        loaded again with the latest ones once it finishes.
+        """
+        if not self.ollama_model or not self.client:
+            return
+
+        key = (self.client, self.ollama_model, self.keep_alive)
+        with self._preload_lock:
+            if self._preloading == key:
+                self._preload_next = None
+                return
+            if self._preloading is not None:
+                self._preload_next = key
+                return
+            self._preloading = key
+
+        thread = threading.Thread(target=self._preload, args=key, name="EnigmaPreload", daemon=True)
+        thread.start()
+
+    def model_options(self, client: Client, model: str) -> dict:
+        """
+        Return the options sent with every request to a model. Ollama
+        reloads the model when they change, see EnigmaContextPacker.num_ctx.
+        """
+        return {'num_ctx': self.context_packer.num_ctx(client, model)}
+
+    def _preload(self, client: Client, model: str, keep_alive):
+        while True:
+            self._set_model_state("loading")
+            try:
+                # Same options as chat requests, or the first one would load it again.
+                client.generate(model=model, prompt="", keep_alive=keep_alive,
+                                options=self.model_options(client, model))
+            except Exception as e:
+                print(f"Failed to preload {model}: {e}")
+                self._set_model_state(f"error: {e}")
+            else:
+                print(f"Preloaded {model}")
+                self._set_model_state("loaded")
+
+            # Settings changed meanwhile, load with the latest.
+            with self._preload_lock:
+                self._preloading, self._preload_next = self._preload_next, None
+                if self._preloading is None:
+                    return
+                client, model, keep_alive = self._preloading
+
+    def _set_model_state(self, state: str):
+        self.model_state = state
+        self.model_state_changed.emit(state)
+
     def get_models(self):
         """
         Return a list of available models.
@@ -81,93 +426,591 @@ class EnigmaOllamaClient(QtCore.QObject):  # Inherit from QObject
         Cache the model and client data.
         """
         if self.ollama_model:
-            with open(os.path.join(self.cache_dir, 'model.json'), 'w') as f:
-                json.dump({'model': self.ollama_model}, f)
+            self._write_config('model.json', {'model': self.ollama_model, 'keep_alive': self.keep_alive,
+                                              'embedding_model': self.embedding_model,
+                                              'hedge_delay': self.hedge_delay, 'hedge_model': self.hedge_model})
 
         if self.client:
-            with open(os.path.join(self.cache_dir, 'server.json'), 'w') as f:
-                json.dump({'host': self.host, 'port': self.port}, f)
+            self._write_config('server.json', {'host': self.host, 'port': self.port, 'backend': self.backend,
+                                               'endpoints': self.endpoints})
+
+    def _write_config(self, filename: str, config: dict):
+        """
+        Atomically write a config file, skipped if its contents are unchanged.
+        """
+        if self._saved_config.get(filename) == config:
+            return
+        write_json_atomic(os.path.join(self.cache_dir, filename), config)
+        self._saved_config[filename] = dict(config)
 
     def set_model(self, model: str):
+        if model == self.ollama_model:
+            return
         self.ollama_model = model
         self.cache_data()
+        self.preload_model()
 
-    def chat_psuedo_c(self):
+    def set_keep_alive(self, keep_alive):
+        """
+        Set how long Ollama keeps the model loaded, e.g. "30m", or -1 to keep
+        it loaded indefinitely. Numeric strings are sent as seconds, anything
+        Ollama can't parse falls back to DEFAULT_KEEP_ALIVE. The model is
+        loaded again so the new duration applies right away.
+        """
+        keep_alive = self.parse_keep_alive(keep_alive)
+        if keep_alive == self.keep_alive:
+            return
+        self.keep_alive = keep_alive
+        self.cache_data()
+        self.preload_model()
+
+    @classmethod
+    def parse_keep_alive(cls, keep_alive):
+        """
+        Return keep_alive as Ollama accepts it: seconds as a number or a
+        duration string, DEFAULT_KEEP_ALIVE if it is neither.
+        """
+        if isinstance(keep_alive, (int, float)) and not isinstance(keep_alive, bool):
+            return keep_alive
+        text = str(keep_alive or "").strip()
+        if re.fullmatch(r'-?\d+', text):
+            return int(text)
+        if re.fullmatch(r'-?\d*\.\d+', text):
+            return float(text)
+        if _DURATION.match(text):
+            return text
+        print(f"Invalid keep_alive {keep_alive!r}, using {cls.DEFAULT_KEEP_ALIVE}")
+        return cls.DEFAULT_KEEP_ALIVE
+
+    def set_hedging(self, delay: float = None, model: str = None):
+        """
+        Hedge chat requests that have no token after `delay` seconds on a
+        second server, or with `model` if given. A delay of None or 0
+        disables hedging.
+        """
+        self.hedge_delay = delay if delay and delay > 0 else None
+        self.hedge_model = model or None
+        self.cache_data()
+
+    def set_stream_coalescing(self, interval: float, max_bytes: int):
+        """
+        Configure how streamed chunks are batched before reaching the UI.
+        An interval of 0 forwards every chunk as it arrives.
+        """
+        self.stream_flush_interval = max(0.0, interval)
+        self.stream_flush_bytes = max(1, max_bytes)
+
+    def chat_psuedo_c(self, function_il: str = None, on_chunk: callable = None,
+                      cancel_event: threading.Event = None, use_cache: bool = True) -> str:
         """
         Send a message to the Ollama model and prepended system messages
         and save context.
         """
-        self.chat(type=MType.SYSTEM_PSEUDO)
+        return self.chat(type=MType.SYSTEM_PSEUDO, function_il=function_il,
+                         on_chunk=on_chunk, cancel_event=cancel_event, use_cache=use_cache)
     
-    def chat_rename_function(self):
+    def chat_rename_function(self, function_il: str = None, on_chunk: callable = None,
+                             cancel_event: threading.Event = None, use_cache: bool = True) -> str:
         """
         Send a message to the Ollama model and prepended system messages
         and save context.
         """
-        self.chat(type=MType.SYSTEM_RENAME_FN)
+        return self.chat(type=MType.SYSTEM_RENAME_FN, function_il=function_il,
+                         on_chunk=on_chunk, cancel_event=cancel_event, use_cache=use_cache)
 
-    def chat(self, message: str = None, type: MType = MType.SYSTEM):
+    def chat(self, message: str = None, type: MType = MType.SYSTEM,
+             function_il: str = None, on_chunk: callable = None,
+             cancel_event: threading.Event = None, use_cache: bool = True,
+             on_metrics: callable = None, related: str = None,
+             conversation: EnigmaConversation = None) -> str:
         """
         Send a message to the Ollama model and prepended system messages
         and save context.
+
+        Args:
+            function_il: IL to use for this request instead of the current function IL.
+            on_chunk: Receives the streamed text, defaults to emitting response_received.
+            cancel_event: When set, the HTTP stream is closed at the next chunk,
+                which makes Ollama stop generating.
+            use_cache: Replay explain and rename responses from the response
+                cache, pass False to always ask the model.
+            on_metrics: Receives a dict of timing and token counts once the
+                request completes, see _report_metrics.
+            related: Summaries of related functions, sent after the IL.
+            conversation: History of chat requests, the client's own if None.
+
+        Returns:
+            str: The full response (partial if cancelled), or None if no model
+                or client is set.
+        """
+        call = self._begin_chat(message, type, function_il, on_chunk, cancel_event, use_cache,
+                                on_metrics, related, conversation)
+        if call is None:
+            return None
+        if call.cached:
+            return call.result()
+        if self._hedged(call):
+            return self._finish_chat(self._chat_hedged(call).result())
+
+        tried = set()
+        while True:
+            endpoint = self.pool.acquire(call.model, tried)
+            call.metrics['endpoint'] = endpoint.url
+            try:
+                stream = endpoint.client.chat(**call.request_kwargs())
+                try:
+                    for part in stream:
+                        if call.is_cancelled():
+                            break
+                        call.add_part(part)
+                finally:
+                    # Closing the generator closes the HTTP response, which aborts
+                    # generation on the server if the stream was cut short.
+                    stream.close()
+            except Exception as e:
+                self.pool.release(endpoint)
+                tried.add(endpoint.url)
+                if not self._retry_stream(call, endpoint, e, tried):
+                    raise
+                continue
+            self.pool.release(endpoint, call.model)
+            break
+
+        return self._finish_chat(call)
+
+    def chat_async(self, message: str = None, type: MType = MType.SYSTEM,
+                   function_il: str = None, on_chunk: callable = None,
+                   cancel_event: threading.Event = None, use_cache: bool = True,
+                   on_metrics: callable = None, related: str = None,
+                   conversation: EnigmaConversation = None) -> concurrent.futures.Future:
+        """
+        Same as chat(), but the stream runs on the asyncio backend's event
+        loop and this returns immediately. Setting cancel_event aborts the
+        stream even while it is waiting for the first token.
+
+        The future resolves on the loop thread once the stream ends, before
+        the conversation, cache and indexes are updated, which would hold up
+        every other stream. Pass its result to finish_chat() on another thread.
+
+        Returns:
+            Future: Resolves to the EnigmaChatCall, or None without a model.
+        """
+        result = concurrent.futures.Future()
+        call = self._begin_chat(message, type, function_il, on_chunk, cancel_event, use_cache,
+                                on_metrics, related, conversation)
+        if call is None or call.cached:
+            result.set_result(call)
+            return result
+        if self._hedged(call):
+            return self._chat_hedged(call)
+
+        self._stream_async(call, result, set())
+        return result
+
+    def _stream_async(self, call: EnigmaChatCall, result: concurrent.futures.Future, tried: set):
+        """
+        Stream a call on the asyncio backend from the pool's best server,
+        moving to another server if it fails before the first token.
+        """
+        endpoint = self.pool.acquire(call.model, tried)
+        call.metrics['endpoint'] = endpoint.url
+
+        def settle(future):
+            try:
+                future.result()
+            except concurrent.futures.CancelledError:
+                self.pool.release(endpoint)
+                call.cancel_event.set()
+            except Exception as e:
+                self.pool.release(endpoint)
+                tried.add(endpoint.url)
+                if self._retry_stream(call, endpoint, e, tried):
+                    self._stream_async(call, result, tried)
+                else:
+                    result.set_exception(e)
+                return
+            else:
+                self.pool.release(endpoint, call.model)
+            result.set_result(call)
+
+        def done(future):
+            # Runs on the loop thread, whatever happens the result must resolve.
+            try:
+                settle(future)
+            except Exception as e:
+                if not result.done():
+                    result.set_exception(e)
+
+        stream = self.async_backend().stream(endpoint.url, call.request_kwargs(),
+                                             call.add_part, call.is_cancelled)
+        stream.add_done_callback(done)
+
+    def _hedged(self, call: EnigmaChatCall) -> bool:
+        return bool(self.hedge_delay) and call.type in self.HEDGED_TYPES
+
+    def _chat_hedged(self, call: EnigmaChatCall) -> concurrent.futures.Future:
+        """
+        Stream a call with a hedge request, see EnigmaHedgedStream.
+        return:
+            Future: Resolves to the response of whichever stream won.
+        """
+        result = concurrent.futures.Future()
+        call.metrics['hedged'] = False
+        self.hedge_stats['requests'] += 1
+        EnigmaHedgedStream(self, call, result, self.hedge_delay, self.hedge_model).start()
+        return result
+
+    def _retry_stream(self, call: EnigmaChatCall, endpoint: EnigmaEndpoint, error: Exception,
+                      tried: set) -> bool:
+        """
+        Decide whether a failed stream is retried on another server: only if
+        nothing was streamed yet and a server is left to try.
+        """
+        # An error response means the server is up, just not for this request.
+        if not isinstance(error, ResponseError):
+            self.pool.mark_failed(endpoint, error)
+        if 'ttft' in call.metrics or call.is_cancelled():
+            return False
+        if not any(url not in tried for url in (self.host_url(), *self.endpoints)):
+            return False
+        print(f"Retrying on another Ollama server after {endpoint.url} failed: {error}")
+        call.metrics['retries'] = call.metrics.get('retries', 0) + 1
+        return True
+
+    def fits_context(self, type: MType, function_il: str) -> bool:
+        """
+        Check whether the IL fits the context window next to the system prompts.
+        """
+        if not self.ollama_model or not self.client or not function_il:
+            return True
+        if self.compact_il and type in self.COMPACT_TYPES:
+            function_il = self.il_compactor.compact(function_il).text
+        packer = self.context_packer
+        used = packer.prompt_tokens(self.system_prompts(type))
+        il_tokens = packer.message_tokens({'role': 'system', 'content': function_il})
+        return used + il_tokens <= packer.budget(self.client, self.ollama_model)
+
+    def chat_chunked(self, function_il: str, on_chunk: callable = None, on_status: callable = None,
+                     cancel_event: threading.Event = None, use_cache: bool = True,
+                     on_metrics: callable = None, related: str = None, run_all: callable = None,
+                     **kwargs) -> str:
+        """
+        Explain a function too large for the context window, map-reduce style.
+
+        The IL is split between statements into chunks that fit and each chunk
+        is explained on its own. The partial explanations are merged in groups
+        that fit the context window, level by level, until a single merge is
+        left, which is streamed to on_chunk like a normal response.
+
+        Args:
+            on_status: Receives progress messages as chunks complete.
+            run_all: Callable([(MType, function_il), ...]) -> [str] running the
+                chunk and merge requests, on the executor. Sequential if None.
+            Other arguments as for chat().
+
+        Returns:
+            str: The merged explanation, partial or empty if cancelled.
+        """
+        if not self.ollama_model or not self.client:
+            return None
+        on_status = on_status or (lambda status: None)
+        cancel_event = cancel_event or threading.Event()
+        if run_all is None:
+            def run_all(calls):
+                return [self.chat(type=mtype, function_il=il, on_chunk=lambda text: None,
+                                  cancel_event=cancel_event, use_cache=use_cache) or ""
+                        for mtype, il in calls]
+
+        packer = self.context_packer
+        budget = packer.budget(self.client, self.ollama_model)
+        chunk_tokens = (budget - packer.prompt_tokens(self.system_prompts(MType.SYSTEM_CHUNK))
+                        - packer.MESSAGE_OVERHEAD - 16)
+        chunks = packer.split(function_il, chunk_tokens)
+        total = len(chunks)
+        on_status(f"Function too large for the context window, explaining {total} chunks")
+        parts = run_all([(MType.SYSTEM_CHUNK, f"Part {index + 1} of {total}:\n{chunk}")
+                         for index, chunk in enumerate(chunks)])
+        if cancel_event.is_set():
+            return ""
+
+        # (first, last) chunk numbers and explanation of every partial.
+        parts = [(index + 1, index + 1, part) for index, part in enumerate(parts)]
+        merge_tokens = (budget - packer.prompt_tokens(self.system_prompts(MType.SYSTEM_REDUCE))
+                        - packer.MESSAGE_OVERHEAD - 16)
+        while True:
+            groups = self._merge_groups(parts, total, merge_tokens)
+            if len(groups) == 1:
+                break
+            if len(groups) == len(parts):
+                print(f"Chunk explanations too long to merge in groups, merging {len(parts)} at once")
+                groups = [parts]
+                break
+            on_status(f"Merging {len(parts)} chunk explanations in {len(groups)} groups")
+            merged = run_all([(MType.SYSTEM_REDUCE, self._merge_text(group, total)) for group in groups])
+            if cancel_event.is_set():
+                return ""
+            parts = [(group[0][0], group[-1][1], text) for group, text in zip(groups, merged)]
+
+        on_status("Merging the chunk explanations")
+
+        def report(metrics):
+            metrics['chunks'] = total
+            if on_metrics is not None:
+                on_metrics(metrics)
+
+        return self.chat(type=MType.SYSTEM_REDUCE, function_il=self._merge_text(groups[0], total),
+                         on_chunk=on_chunk, cancel_event=cancel_event, use_cache=use_cache,
+                         on_metrics=report, related=related)
+
+    def _merge_groups(self, parts: list, total: int, tokens: int) -> list:
+        """
+        Group consecutive partial explanations so each group fits `tokens`.
+        """
+        groups = []
+        used = 0
+        for part in parts:
+            size = self.context_packer.estimate_tokens(self._merge_text([part], total)) + 1
+            if groups and used + size <= tokens:
+                groups[-1].append(part)
+                used += size
+            else:
+                groups.append([part])
+                used = size
+        return groups
+
+    @staticmethod
+    def _merge_text(parts: list, total: int) -> str:
+        return "\n\n".join(
+            f"Part {first} of {total}:\n{text}" if first == last else f"Parts {first}-{last} of {total}:\n{text}"
+            for first, last, text in parts)
+
+    def _begin_chat(self, message, type, function_il, on_chunk, cancel_event, use_cache, on_metrics,
+                    related=None, conversation: EnigmaConversation = None):
+        """
+        Prepare a chat call: pack the messages and replay the response from
+        the cache if possible.
         """
 
         # Check if the model and client are set
         if not self.ollama_model or not self.client:
             return None
         
-        # Prepare message queue based on mtype
-        messages = self.prepare_message_queue(type)
-
         # Only save system message context
+        new_message = None
         if type == MType.SYSTEM:
             
-            # Save the conversation context
-            new_message = self.save_conversation('user', message)
-            
-            # Prepare the new message
-            messages.append(new_message)
-
-        # Get the response back from the client
-        ai_response = ""
-        for part in self.client.chat(model=self.ollama_model, messages=messages, stream=True):
-            ai_response += part.message.content
-            self.response_received.emit(part.message.content)
+            # Prepare the new message, it is saved once the response completes
+            new_message = {'role': 'user', 'content': message}
+
+        # Look up documentation for the IL as shown in Binary Ninja, before it is compacted
+        raw_il = function_il if function_il is not None else self.function_il['content']
+        documents = self.retrieve_documents(type, raw_il, message)
+
+        # Shorten the IL of stateless requests, responses are expanded back
+        # as they stream. Chat keeps the original names: the user's message
+        # and the history refer to them, and aliases change between calls.
+        compact = None
+        if self.compact_il and type in self.COMPACT_TYPES:
+            if function_il is None:
+                function_il = self.function_il['content']
+            compact = self.il_compactor.compact(function_il)
+            function_il = compact.text
+
+        # Prepare message queue based on mtype, packed into the context window
+        messages = self.prepare_message_queue(type, function_il, new_message, related, documents, conversation)
+
+        # Coalesce chunks so the UI thread sees a bounded number of signals per second.
+        coalescer = EnigmaTokenCoalescer(on_chunk or self.response_received.emit,
+                                         self.stream_flush_interval,
+                                         self.stream_flush_bytes)
+        call = EnigmaChatCall(type, message, messages, coalescer, cancel_event, on_metrics)
+        call.conversation = conversation
+        call.compact = compact
+        call.function_il = raw_il
+        call.metrics['model'] = self.ollama_model
+        call.metrics['prompt_tokens'] = self.context_packer.prompt_tokens(messages)
+        if compact is not None and compact.original_chars:
+            call.metrics['il_tokens'] = int(compact.original_chars / self.context_packer.CHARS_PER_TOKEN) + 1
+            call.metrics['il_compact_tokens'] = self.context_packer.estimate_tokens(compact.text)
+
+        # Replay an identical explain or rename request from the cache
+        if use_cache and type in self.CACHED_TYPES:
+            # Related summaries and document excerpts change as more of them
+            # are generated or indexed, they would make every key unique.
+            extra = {content for content in (related, documents) if content}
+            call.cache_key = EnigmaResponseCache.make_key(
+                self.ollama_model, [m for m in messages if m['content'] not in extra])
+            cached = self.response_cache.get(call.cache_key)
+            if cached is not None:
+                call.cached = True
+                call.metrics['cached'] = True
+                call.add_text(cached)
+                call.flush()
+                self._report_metrics(call.metrics, on_metrics)
+                return call
+
+        # Propose the result of a near-duplicate function seen before
+        if use_cache and self.reuse_similar and type in self.SIMILAR_TYPES:
+            match = self.similarity_index.lookup(raw_il, self.SIMILAR_TYPES[type])
+            if match is not None:
+                result, similarity, source = match
+                print(f"Reusing the result of a similar function ({similarity:.0%})")
+                call.cached = True
+                call.compact = None  # Stored results already use the original names
+                call.metrics['cached'] = True
+                call.metrics['similar'] = similarity
+                call.metrics['similar_source'] = source
+                call.add_text(result)
+                call.flush()
+                self._report_metrics(call.metrics, on_metrics)
+                return call
+
+        call.options = self.model_options(self.client, self.ollama_model)
+        call.model = self.ollama_model
+        call.keep_alive = self.keep_alive
+        return call
+
+    def finish_chat(self, call: EnigmaChatCall) -> str:
+        """
+        Complete a call chat_async() streamed and return its response.
+        """
+        if call is None:
+            return None
+        if call.cached:
+            return call.result()
+        return self._finish_chat(call)
+
+    def _finish_chat(self, call) -> str:
+        """
+        Complete a chat call: save the conversation, cache and report metrics.
+        """
+        call.flush()
+
+        if call.is_cancelled():
+            print("Ollama request cancelled")
+            return call.result()
     
-        # Save the context of the response if message type is system
-        if type == MType.SYSTEM:
-            self.save_conversation("assistant", ai_response)
+        # Save the context of the exchange if message type is system.
+        # The cache keeps the aliases, they go with the compacted IL it is
+        # keyed on. The history gets the original names.
+        if call.type == MType.SYSTEM:
+            self.save_conversation('user', call.message, call.conversation)
+            self.save_conversation("assistant", call.result(), call.conversation)
+
+        if call.cache_key is not None and call.text:
+            self.response_cache.put(call.cache_key, call.text)
+
+        if call.type in self.SIMILAR_TYPES and call.text:
+            self.similarity_index.add(call.function_il, self.SIMILAR_TYPES[call.type], call.result(),
+                                      self.ollama_model)
+
+        self._report_metrics(call.metrics, call.on_metrics)
+        return call.result()
+
+    def _report_metrics(self, metrics: dict, on_metrics: callable = None):
+        """
+        Log and hand on the metrics of a completed request.
+
+        `prompt_tokens` is our estimate of the whole prompt, `prompt_eval_count`
+        is Ollama's count of the tokens it evaluated, a prefix reused from the
+        KV cache shows as a count well below the estimate and a short
+        `prompt_eval_duration`. They are reported side by side, not subtracted,
+        since the estimate is only a heuristic.
+        """
+        print(f"Ollama request: ttft={metrics.get('ttft', 0):.2f}s "
+              f"prompt~{metrics['prompt_tokens']} evaluated={metrics.get('prompt_eval_count')} "
+              f"in {metrics.get('prompt_eval_duration', 0):.2f}s cached={metrics['cached']} "
+              f"il~{metrics.get('il_tokens')}->{metrics.get('il_compact_tokens')}")
+        if on_metrics is not None:
+            on_metrics(metrics)
     
-    def prepare_message_queue(self, type: MType) -> list:
-        """ Prepare initial message queue to provide to the model """
+    def retrieve_documents(self, type: MType, function_il: str = None, message: str = None) -> str:
+        """
+        Search the saved documents for the function and question of a chat
+        or explain request.
+        return:
+            str: The best matching excerpts, or None.
+        """
+        if self.documents is None or type not in (MType.SYSTEM, MType.SYSTEM_PSEUDO):
+            return None
+        query = "\n".join(part for part in (message, function_il) if part)
+        try:
+            return self.documents.context(query, self.document_top_k)
+        except Exception as e:
+            print(f"Document search failed: {e}")
+            return None
+
+    def prepare_message_queue(self, type: MType, function_il: str = None, message: dict = None,
+                              related: str = None, documents: str = None,
+                              conversation: EnigmaConversation = None) -> list:
+        """
+        Prepare the message queue to provide to the model, packed by priority
+        into the model's context window: system prompts, the function IL and
+        the new message first, then the summaries of related functions and
+        excerpts of the user's documents, then the most recent conversation
+        turns. See EnigmaContextPacker for the order they are sent in.
+        """
         
         # Create a fresh message queue for prepending system
         # messages to conversation history.
-        messages = []
+        system = self.system_prompts(type)
+        history = []
 
         if type == MType.SYSTEM:
-       
-            # Add the system messages first.
-            messages.extend([{'role': 'system', 'content': msg} for msg in self.system_messages_general])
             
             # Append the conversation history - only for system messages
-            messages.extend(self.conversation_history)
+            history.extend((conversation or self.conversation).messages())
+
+        # Enigma AI should always have context of the current function IL
+        # Atleast for now.
+        if function_il is not None:
+            il_message = {'role': 'system', 'content': function_il}
+        else:
+            il_message = dict(self.function_il)
+
+        related_messages = [{'role': 'system', 'content': content}
+                            for content in (related, documents) if content]
+
+        budget = self.context_packer.budget(self.client, self.ollama_model)
+        return self.context_packer.pack(budget, system, il_message, history, message, related_messages)
+
+    def system_prompts(self, type: MType) -> list:
+        """
+        Return the system prompt messages of a request type.
+        """
+        system = []
+
+        if type == MType.SYSTEM:
+       
+            # Add the system messages first.
+            system.extend([{'role': 'system', 'content': msg} for msg in self.system_messages_general])
        
         elif type == MType.SYSTEM_PSEUDO:
 
             # Add the system pseudo-c messages 
-            messages.extend([{'role': 'system', 'content': msg} for msg in self.system_messages_pseudo_c])
+            system.extend([{'role': 'system', 'content': msg} for msg in self.system_messages_pseudo_c])
         
         elif type == MType.SYSTEM_RENAME_FN:
 
             # Add the system rename function messages
-            messages.extend([{'role': 'system', 'content': msg} for msg in EnigmaPrompts.rename_fn])
+            system.extend([{'role': 'system', 'content': msg} for msg in EnigmaPrompts.rename_fn])
 
-        # Enigma AI should always have context of the current function IL
-        # Atleast for now.
-        messages.append(self.function_il)
+        elif type == MType.SYSTEM_SUMMARY:
+
+            # Add the system summary messages
+            system.extend([{'role': 'system', 'content': msg} for msg in EnigmaPrompts.summary])
+
+        elif type == MType.SYSTEM_CHUNK:
+
+            # Add the system chunk messages
+            system.extend([{'role': 'system', 'content': msg} for msg in EnigmaPrompts.chunk])
 
-        return messages
+        elif type == MType.SYSTEM_REDUCE:
+
+            # Add the system reduce messages
+            system.extend([{'role': 'system', 'content': msg} for msg in EnigmaPrompts.reduce])
+
+        return system
     
     def set_function_il(self, function_il: str):
         """ 
@@ -196,17 +1039,11 @@ class EnigmaOllamaClient(QtCore.QObject):  # Inherit from QObject
         }
         self.system_messages_pseudo_c.append(message)
 
-    def save_conversation(self, role: str, message: str) -> dict:
+    def save_conversation(self, role: str, message: str, conversation: EnigmaConversation = None) -> dict:
         """ 
         Save conversation context for a period of time.
         """
-        message = {
-            'role': role,
-            'content': message,
-        }
-        self.conversation_history.append(message)
-
-        return message
+        return (conversation or self.conversation).append(role, message)
     
     def _load_client_config(self):
         """ 
@@ -218,8 +1055,11 @@ class EnigmaOllamaClient(QtCore.QObject):  # Inherit from QObject
             print("Loading client config")
             with open(os.path.join(self.cache_dir, 'server.json'), 'r') as f:
                 config = json.load(f)
+                self._saved_config['server.json'] = dict(config)
                 self.host = config['host']
                 self.port = config['port']
+                self.backend = config.get('backend', self.backend)
+                self.endpoints = config.get('endpoints', self.endpoints)
                 self.create_client()
                 return True
         print("No client config found")
@@ -233,7 +1073,12 @@ class EnigmaOllamaClient(QtCore.QObject):  # Inherit from QObject
             print("Loading model config")
             with open(os.path.join(self.cache_dir, 'model.json'), 'r') as f:
                 config = json.load(f)
+                self._saved_config['model.json'] = dict(config)
                 self.ollama_model = config['model']
+                self.keep_alive = self.parse_keep_alive(config.get('keep_alive', self.keep_alive))
+                self.embedding_model = config.get('embedding_model', self.embedding_model)
+                self.hedge_delay = config.get('hedge_delay', self.hedge_delay)
+                self.hedge_model = config.get('hedge_model', self.hedge_model)
                 return True
         return False
     
@@ -241,7 +1086,7 @@ class EnigmaOllamaClient(QtCore.QObject):  # Inherit from QObject
         """ 
         Clear the conversation history.
         """
-        self.conversation_history.clear()
+        self.conversation.clear()
 
     def client_exists(self):
         """ 
@@ -0,0 +1,341 @@
+import bisect
+import hashlib
+import json
+import mmap
+import os
+import re
+import shutil
+import struct
+import threading
+
+
+# Variable names Binary Ninja generates (var_18, arg1, rax_1, ...), not worth sharing.
+_AUTO_VARIABLE = re.compile(r'^(?:var_[0-9a-f]+|arg\d+|[a-z]{1,4}\d*)(?:_\d+)?$')
+
+# Functions with fewer instructions are too generic to identify by their code.
+MIN_INSTRUCTIONS = 8
+
+# Immediates below this are constants (sizes, offsets, flags), larger ones
+# are usually addresses that move between builds.
+MAX_IMMEDIATE = 0x10000
+
+# Symbols that name the same thing in every binary.
+_IMPORTED_SYMBOLS = ('ImportedFunctionSymbol', 'ImportAddressSymbol', 'ImportedDataSymbol',
+                     'ExternalSymbol', 'LibraryFunctionSymbol')
+
+
+def _normalise_token(func, token) -> str:
+    """
+    Keep what identifies the code (mnemonics, registers, small constants,
+    imported names, branch targets relative to the function) and drop what
+    moves between builds (absolute addresses, names the analyst gave).
+    """
+    kind = token.type.name
+    if kind in ('IntegerToken', 'PossibleAddressToken', 'CodeRelativeAddressToken',
+                'CodeSymbolToken', 'DataSymbolToken', 'ImportToken', 'ExternalSymbolToken'):
+        value = token.value
+        symbol = func.view.get_symbol_at(value) if value >= MAX_IMMEDIATE else None
+        if symbol is not None and symbol.type.name in _IMPORTED_SYMBOLS:
+            return symbol.name
+        if kind == 'ImportToken':
+            return token.text
+        if value < MAX_IMMEDIATE:
+            return f"{value:x}"
+        if func.start <= value < func.highest_address + 1:
+            return f"L{value - func.start:x}"
+        return "F" if kind == 'CodeSymbolToken' else "A"
+    if kind in ('InstructionToken', 'RegisterToken', 'OperandSeparatorToken', 'BeginMemoryOperandToken',
+                'EndMemoryOperandToken', 'FloatingPointToken', 'TextToken'):
+        return token.text.strip()
+    return ""
+
+
+def function_digest(func) -> bytes:
+    """
+    Identify a function by its code rather than its address or names: a
+    hash of its instructions in address order with normalised operands,
+    see _normalise_token. The same function in another build or rebased
+    binary gets the same digest, and renaming it, its callees or its
+    variables doesn't change it.
+    return:
+        bytes: A 16 byte digest, or None for functions too small to identify.
+    """
+    instructions = sorted(
+        (address, " ".join(filter(None, (_normalise_token(func, token) for token in tokens))))
+        for tokens, address in func.instructions if tokens)
+    if len(instructions) < MIN_INSTRUCTIONS:
+        return None
+    text = "\n".join(instruction for _, instruction in instructions)
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
+
+def function_annotation(func, summary: str = None) -> dict:
+    """
+    Collect what an analyst added to a function: its name if it isn't an
+    auto-generated sub_*, its summary and its renamed variables.
+    return:
+        dict: The annotation, or None if there is nothing to share.
+    """
+    annotation = {}
+    if not func.name.startswith("sub_"):
+        annotation['name'] = func.name
+    if summary:
+        annotation['summary'] = summary
+
+    # Variables are matched by storage, their names are what changed.
+    variables = {}
+    for var in func.vars:
+        if not _AUTO_VARIABLE.match(var.name):
+            variables[f"{int(var.source_type)}:{var.storage}"] = var.name
+    if variables:
+        annotation['variables'] = variables
+    return annotation or None
+
+
+class EnigmaAnnotationPack:
+    """
+    A read-only, memory-mapped pack of function annotations.
+
+    Layout (little endian):
+
+        header   magic, count, bloom bits, bloom hashes, index and data offsets
+        bloom    bloom filter over the digests
+        index    count x (16 byte digest, u64 data offset, u32 length), sorted
+        data     one JSON annotation per entry
+
+    Opening a pack only maps the file, so a pack of millions of entries
+    opens instantly. Most lookups are misses and stop at the bloom filter,
+    hits are a binary search over the index and one JSON decode.
+    """
+
+    # Version 2 digests include operands, version 1 packs can't be matched.
+    MAGIC = b'ENIGPAK2'
+    HEADER = struct.Struct('<8sIIIQQ')
+    ENTRY = struct.Struct('<16sQI')
+    BLOOM_BITS_PER_ENTRY = 10
+    BLOOM_HASHES = 7
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, self._bloom_bits, self._bloom_hashes, self._index_offset, self._data_offset = \
+            self.HEADER.unpack_from(self._map, 0)
+        if magic != self.MAGIC:
+            self.close()
+            raise ValueError(f"Not an EnigmaAI annotation pack: {path}")
+        self._keys = _PackKeys(self._map, self._index_offset, self.count)
+
+    @classmethod
+    def write(cls, path: str, annotations: dict):
+        """
+        Write a pack from {digest: annotation}.
+        """
+        entries = sorted(annotations.items())
+        bits = max(64, len(entries) * cls.BLOOM_BITS_PER_ENTRY)
+        bits += -bits % 8
+        bloom = bytearray(bits // 8)
+        for digest, _ in entries:
+            for bit in cls._bloom_positions(digest, bits, cls.BLOOM_HASHES):
+                bloom[bit // 8] |= 1 << (bit % 8)
+
+        records = [json.dumps(annotation, separators=(',', ':')).encode('utf-8') for _, annotation in entries]
+        index_offset = cls.HEADER.size + len(bloom)
+        data_offset = index_offset + cls.ENTRY.size * len(entries)
+
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(cls.HEADER.pack(cls.MAGIC, len(entries), bits, cls.BLOOM_HASHES, index_offset, data_offset))
+            f.write(bloom)
+            offset = 0
+            for (digest, _), record in zip(entries, records):
+                f.write(cls.ENTRY.pack(digest, offset, len(record)))
+                offset += len(record)
+            for record in records:
+                f.write(record)
+        os.replace(tmp_path, path)
+
+    def get(self, digest: bytes) -> dict:
+        """
+        Return the annotation of a function digest, or None.
+        """
+        if digest is None or self._map is None:
+            return None
+        bloom = self.HEADER.size
+        for bit in self._bloom_positions(digest, self._bloom_bits, self._bloom_hashes):
+            if not self._map[bloom + bit // 8] & (1 << (bit % 8)):
+                return None
+
+        position = bisect.bisect_left(self._keys, digest)
+        if position == self.count or self._keys[position] != digest:
+            return None
+        _, offset, length = self.ENTRY.unpack_from(self._map, self._index_offset + position * self.ENTRY.size)
+        start = self._data_offset + offset
+        return json.loads(self._map[start:start + length])
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __len__(self) -> int:
+        return self.count
+
+    @staticmethod
+    def _bloom_positions(digest: bytes, bits: int, hashes: int):
+        # Double hashing on the two halves of the digest.
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:16], 'little') | 1
+        return [(first + i * second) % bits for i in range(hashes)]
+
+
+class _PackKeys:
+    """
+    Sequence view of the digests in a pack's index, for bisect.
+    """
+
+    def __init__(self, data: mmap.mmap, offset: int, count: int):
+        self.data = data
+        self.offset = offset
+        self.count = count
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, position: int) -> bytes:
+        start = self.offset + position * EnigmaAnnotationPack.ENTRY.size
+        return self.data[start:start + 16]
+
+
+class EnigmaAnnotationPacks:
+    """
+    The annotation packs imported into EnigmaAI, checked before asking the
+    model to name or summarise a function.
+    """
+
+    EXTENSION = '.enigmapack'
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._packs = []
+        for filename in sorted(os.listdir(directory)):
+            if filename.endswith(self.EXTENSION):
+                self._open(os.path.join(directory, filename))
+
+    def lookup(self, func) -> dict:
+        """
+        Return the annotation of a function from the first pack that has it.
+        """
+        with self._lock:
+            if not self._packs:
+                return None
+        digest = function_digest(func)
+        if digest is None:
+            return None
+        # Held while reading, an import may close a pack and unmap it.
+        with self._lock:
+            for pack in self._packs:
+                annotation = pack.get(digest)
+                if annotation is not None:
+                    self.hits += 1
+                    return annotation
+            self.misses += 1
+        return None
+
+    def import_pack(self, path: str) -> int:
+        """
+        Copy a pack into the packs directory and start using it, in place
+        of a pack of the same name. A pack that can't be copied or read
+        leaves the current one in use.
+        return:
+            int: The number of entries in the pack.
+        """
+        target = os.path.join(self.directory, os.path.basename(path))
+        if not target.endswith(self.EXTENSION):
+            target += self.EXTENSION
+
+        # Importing a pack from the packs directory only reloads it.
+        tmp_path = None
+        if not (os.path.exists(target) and os.path.samefile(path, target)):
+            tmp_path = target + '.tmp'
+            try:
+                shutil.copyfile(path, tmp_path)
+                EnigmaAnnotationPack(tmp_path).close()
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+        with self._lock:
+            # Closed before the swap, a mapped file can't be replaced on Windows.
+            replaced = [pack for pack in self._packs if pack.path == target]
+            for pack in replaced:
+                pack.close()
+                self._packs.remove(pack)
+            try:
+                if tmp_path is not None:
+                    os.replace(tmp_path, target)
+                pack = EnigmaAnnotationPack(target)
+            except Exception:
+                if tmp_path is not None and os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                if replaced:
+                    self._packs.append(EnigmaAnnotationPack(target))
+                raise
+            self._packs.append(pack)
+        print(f"Loaded annotation pack {os.path.basename(target)} with {len(pack)} entries")
+        return len(pack)
+
+    def export(self, bv, path: str, summaries=None, progress: callable = None) -> int:
+        """
+        Write the annotations of every function of a binary to a pack.
+        Functions without a name, summary or renamed variable are left out,
+        and so are functions whose code is identical to another function's,
+        since an importer couldn't tell which annotation belongs where.
+        return:
+            int: The number of entries written.
+        """
+        progress = progress or (lambda status: None)
+        store = summaries.store(bv) if summaries is not None else None
+        annotations = {}
+        seen = set()
+        ambiguous = set()
+        functions = list(bv.functions)
+        for number, func in enumerate(functions):
+            if number % 500 == 0:
+                progress(f"Exporting annotations: {number}/{len(functions)}")
+            digest = function_digest(func)
+            if digest is None:
+                continue
+            if digest in seen:
+                ambiguous.add(digest)
+                continue
+            seen.add(digest)
+            summary = store.get(func.start) if store is not None else None
+            annotation = function_annotation(func, summary)
+            if annotation is not None:
+                annotations[digest] = annotation
+        for digest in ambiguous:
+            annotations.pop(digest, None)
+        EnigmaAnnotationPack.write(path, annotations)
+        print(f"Exported {len(annotations)} annotations to {path}, "
+              f"{len(ambiguous)} functions with duplicate code left out")
+        return len(annotations)
+
+    def info(self) -> dict:
+        with self._lock:
+            entries = sum(len(pack) for pack in self._packs)
+            return {'packs': len(self._packs), 'entries': entries, 'hits': self.hits, 'misses': self.misses}
+
+    def _open(self, path: str) -> EnigmaAnnotationPack:
+        pack = EnigmaAnnotationPack(path)
+        with self._lock:
+            self._packs.append(pack)
+        print(f"Loaded annotation pack {os.path.basename(path)} with {len(pack)} entries")
+        return pack
@@ -0,0 +1,167 @@
+from ollama import Client
+import threading
+import time
+
+
+def model_key(model: str) -> str:
+    """
+    Ollama reports "llama3" as "llama3:latest".
+    """
+    if model and ":" not in model:
+        return model + ":latest"
+    return model
+
+
+class EnigmaEndpoint:
+    """
+    One Ollama server of the pool and what we know about it.
+    """
+
+    def __init__(self, url: str, client: Client):
+        self.url = url
+        self.client = client
+
+        # Requests streaming from this server right now.
+        self.outstanding = 0
+
+        # Assumed healthy until a health check or request says otherwise.
+        self.healthy = True
+        self.error = None
+        self.checked = 0.0
+
+        # Models the server has, and has loaded. None until the first check.
+        self.models = None
+        self.loaded = set()
+
+    def info(self) -> dict:
+        return {'url': self.url, 'healthy': self.healthy, 'outstanding': self.outstanding,
+                'loaded': sorted(self.loaded), 'error': self.error}
+
+
+class EnigmaEndpointPool:
+    """
+    Routes requests over several Ollama servers.
+
+    Each request goes to the healthy server with the fewest outstanding
+    requests, preferring servers that already have the model loaded and
+    skipping servers known not to have it at all. A background thread
+    checks every server each HEALTH_INTERVAL seconds (reachable, models
+    available and loaded). Servers that fail a request are taken out of
+    rotation until their next successful check.
+    """
+
+    HEALTH_INTERVAL = 15.0
+
+    # Health checks must not hang on a server that went away.
+    HEALTH_TIMEOUT = 5.0
+
+    def __init__(self, urls: list = None, client_factory: callable = None):
+        self.client_factory = client_factory or (lambda url: Client(host=url))
+        self.endpoints = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._health_clients = {}
+        self.set_urls(urls or [])
+
+    def set_urls(self, urls: list):
+        """
+        Replace the servers of the pool, keeping the state of those that stay.
+        """
+        with self._lock:
+            current = {endpoint.url: endpoint for endpoint in self.endpoints}
+            self.endpoints = [current.get(url) or EnigmaEndpoint(url, self.client_factory(url))
+                              for url in dict.fromkeys(urls)]
+        self._start()
+        self._wake.set()
+
+    def acquire(self, model: str, exclude: set = ()) -> EnigmaEndpoint:
+        """
+        Pick the server for a request and count it as outstanding there.
+        Release it with release() once the request ends.
+        return:
+            EnigmaEndpoint: The chosen server, or None if every server is excluded.
+        """
+        key = model_key(model)
+        with self._lock:
+            candidates = [endpoint for endpoint in self.endpoints if endpoint.url not in exclude]
+            # Servers known not to have the model only as a last resort.
+            candidates.sort(key=lambda endpoint: (
+                not endpoint.healthy,
+                endpoint.models is not None and key not in endpoint.models,
+                key not in endpoint.loaded,
+                endpoint.outstanding))
+            if not candidates:
+                return None
+            endpoint = candidates[0]
+            endpoint.outstanding += 1
+            return endpoint
+
+    def release(self, endpoint: EnigmaEndpoint, model: str = None):
+        """
+        Count a request as done. A model that answered is loaded there now.
+        """
+        with self._lock:
+            endpoint.outstanding = max(0, endpoint.outstanding - 1)
+            if model:
+                endpoint.loaded.add(model_key(model))
+
+    def mark_failed(self, endpoint: EnigmaEndpoint, error: Exception):
+        """
+        Take a server out of rotation until its next successful health check.
+        """
+        print(f"Ollama server {endpoint.url} failed: {error}")
+        with self._lock:
+            endpoint.healthy = False
+            endpoint.error = str(error)
+
+    def info(self) -> list:
+        with self._lock:
+            return [endpoint.info() for endpoint in self.endpoints]
+
+    def check(self, endpoint: EnigmaEndpoint):
+        """
+        Check that a server answers and refresh its available and loaded models.
+        """
+        client = self._health_clients.get(endpoint.url)
+        if client is None:
+            client = Client(host=endpoint.url, timeout=self.HEALTH_TIMEOUT)
+            self._health_clients[endpoint.url] = client
+        try:
+            models = {model.model for model in client.list().models}
+            loaded = {model.model for model in client.ps().models}
+        except Exception as e:
+            with self._lock:
+                if endpoint.healthy:
+                    print(f"Ollama server {endpoint.url} is unreachable: {e}")
+                endpoint.healthy = False
+                endpoint.error = str(e)
+                endpoint.checked = time.monotonic()
+            return
+        with self._lock:
+            if not endpoint.healthy:
+                print(f"Ollama server {endpoint.url} is back")
+            endpoint.healthy = True
+            endpoint.error = None
+            endpoint.models = models
+            endpoint.loaded = loaded
+            endpoint.checked = time.monotonic()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is not None or not self.endpoints:
+                return
+            self._thread = threading.Thread(target=self._health_loop, name="EnigmaHealthCheck", daemon=True)
+            self._thread.start()
+
+    def _health_loop(self):
+        """
+        Check every server, for the lifetime of the process.
+        """
+        while True:
+            with self._lock:
+                endpoints = list(self.endpoints)
+            for endpoint in endpoints:
+                self.check(endpoint)
+            self._wake.wait(self.HEALTH_INTERVAL)
+            self._wake.clear()
@@ -31,4 +31,29 @@ class EnigmaPrompts:
         "Do not include any additional text, just provide the suggested function name.",
         "Ensure the function name is concise and accurately reflects the function's purpose.",
         "Avoid using generic names or names that are too specific to the current implementation."
-    ]
\ No newline at end of file
+    ]
+
+    # General system prompts for one-line function summaries, used as
+    # context for the callers and callees of other functions.
+    summary = [
+        "Based on the provided IL, summarise what the function does in a single sentence.",
+        "Mention the important inputs, outputs and side effects, such as files, network or memory it touches.",
+        "Do not include any additional text, just provide the one line summary."
+    ]
+
+    # General system prompts for explaining one part of a function too
+    # large for the context window.
+    chunk = [
+        "The provided IL is one part of a function that is too large to explain at once.",
+        "Explain concisely what this part does, as a short list of its steps.",
+        "Mention the variables, calls and data it reads or writes, later parts may depend on them.",
+        "Do not speculate about the parts you cannot see."
+    ]
+
+    # General system prompts for merging the explanations of those parts.
+    reduce = [
+        "You are given explanations of consecutive parts of one large function, in order.",
+        "Combine them into a single clear and concise explanation of the whole function.",
+        "Describe the overall purpose first, then the main steps.",
+        "Do not mention that the function was split into parts."
+    ]
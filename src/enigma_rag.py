@@ -1,36 +1,437 @@
+from .enigma_files import write_json_atomic
+import concurrent.futures
+import concurrent.futures.process
+import hashlib
+import json
+import math
+import multiprocessing
 import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+
+def prepare_document(path: str) -> tuple:
+    """
+    Read, hash and chunk a document for the index. Module-level so it can
+    run in a worker process.
+    return:
+        tuple: The sha256 of the file and its prepared index rows.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    content = data.decode('utf-8', errors='replace')
+    return hashlib.sha256(data).hexdigest(), EnigmaDocIndex.prepare(content)
+
+
+class EnigmaDocIndex:
+    """
+    BM25 index over chunks of the saved documents, stored in SQLite.
+
+    Documents are split into overlapping chunks of about CHUNK_CHARS
+    characters at line boundaries. Every chunk's terms go into a postings
+    table, and the document frequency of each term is kept in a separate
+    table so a query can pick its most selective terms before touching any
+    postings. Common terms (int, return, ...) never get scored, which keeps
+    queries in the millisecond range over tens of thousands of chunks.
+    """
+
+    CHUNK_CHARS = 1200
+    CHUNK_OVERLAP = 200
+
+    # Only this many of the rarest query terms are scored.
+    MAX_QUERY_TERMS = 24
+
+    # BM25 parameters.
+    K1 = 1.2
+    B = 0.75
+
+    _TERM = re.compile(r'[A-Za-z_][A-Za-z0-9_]{2,}|0x[0-9a-fA-F]+')
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+        # Shared by the UI and the executor's workers, access is serialised by the lock.
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+
+        # Postings are clustered by term, a query term is one range scan.
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " id INTEGER PRIMARY KEY,"
+            " doc TEXT NOT NULL,"
+            " text TEXT NOT NULL,"
+            " length INTEGER NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS chunks_doc ON chunks(doc);"
+            "CREATE TABLE IF NOT EXISTS postings ("
+            " term TEXT NOT NULL,"
+            " chunk INTEGER NOT NULL,"
+            " tf INTEGER NOT NULL,"
+            " PRIMARY KEY (term, chunk)) WITHOUT ROWID;"
+            "CREATE INDEX IF NOT EXISTS postings_chunk ON postings(chunk);"
+            "CREATE TABLE IF NOT EXISTS terms ("
+            " term TEXT PRIMARY KEY,"
+            " df INTEGER NOT NULL);")
+        self._db.commit()
+        self._stats = None
+
+    @classmethod
+    def tokenize(cls, text: str) -> list:
+        """
+        Split text into lowercase identifier and hex constant terms.
+        """
+        return [term.lower() for term in cls._TERM.findall(text)]
+
+    @classmethod
+    def chunk(cls, content: str) -> list:
+        """
+        Split a document into overlapping chunks at line boundaries.
+        """
+        chunks = []
+        current = []
+        size = 0
+        carried = 0  # Lines in `current` carried over from the previous chunk
+        for line in content.splitlines():
+            if size + len(line) + 1 > cls.CHUNK_CHARS and len(current) > carried:
+                chunks.append("\n".join(current))
+                # Carry the last lines over so text at a cut isn't lost.
+                overlap = []
+                kept = 0
+                for previous in reversed(current):
+                    if kept + len(previous) + 1 > cls.CHUNK_OVERLAP:
+                        break
+                    overlap.insert(0, previous)
+                    kept += len(previous) + 1
+                current, size, carried = overlap, kept, len(overlap)
+            current.append(line[:cls.CHUNK_CHARS])
+            size += min(len(line), cls.CHUNK_CHARS) + 1
+        if current:
+            chunks.append("\n".join(current))
+        return [chunk for chunk in chunks if chunk.strip()]
+
+    @classmethod
+    def prepare(cls, content: str) -> list:
+        """
+        Chunk and tokenize a document, the CPU-heavy part of indexing.
+        return:
+            list: (chunk text, term count, {term: frequency}) per chunk.
+        """
+        rows = []
+        for text in cls.chunk(content):
+            terms = cls.tokenize(text)
+            counts = {}
+            for term in terms:
+                counts[term] = counts.get(term, 0) + 1
+            rows.append((text, len(terms), counts))
+        return rows
+
+    def add_document(self, name: str, content: str):
+        """
+        Index a document, replacing any previous version of it.
+        """
+        self.add_prepared(name, self.prepare(content))
+
+    def add_prepared(self, name: str, rows: list):
+        """
+        Index a document prepared with prepare(), replacing any previous version of it.
+        """
+        with self._lock:
+            self._remove(name)
+            postings = []
+            frequencies = {}
+            for text, length, counts in rows:
+                chunk_id = self._db.execute(
+                    "INSERT INTO chunks (doc, text, length) VALUES (?, ?, ?)",
+                    (name, text, length)).lastrowid
+                for term, tf in counts.items():
+                    postings.append((term, chunk_id, tf))
+                    frequencies[term] = frequencies.get(term, 0) + 1
+            self._db.executemany("INSERT INTO postings (term, chunk, tf) VALUES (?, ?, ?)", postings)
+            self._db.executemany(
+                "INSERT INTO terms (term, df) VALUES (?, ?)"
+                " ON CONFLICT(term) DO UPDATE SET df = df + excluded.df",
+                list(frequencies.items()))
+            self._db.commit()
+            self._stats = None
+
+    def remove_document(self, name: str):
+        """
+        Drop a document from the index.
+        """
+        with self._lock:
+            self._remove(name)
+            self._db.commit()
+            self._stats = None
+
+    def documents(self) -> set:
+        """
+        Return the names of the indexed documents.
+        """
+        with self._lock:
+            return {row[0] for row in self._db.execute("SELECT DISTINCT doc FROM chunks")}
+
+    def search(self, query: str, top_k: int = 4) -> list:
+        """
+        Return the best matching chunks for a query.
+        return:
+            list: (score, document name, chunk text) tuples, best first.
+        """
+        terms = list(dict.fromkeys(self.tokenize(query)))
+        if not terms:
+            return []
+
+        with self._lock:
+            count, avg_length = self._get_stats()
+            if count == 0:
+                return []
+
+            # Document frequencies of the query terms, rarest first.
+            frequencies = []
+            for start in range(0, len(terms), 500):
+                batch = terms[start:start + 500]
+                frequencies += self._db.execute(
+                    f"SELECT term, df FROM terms WHERE term IN ({','.join('?' * len(batch))})",
+                    batch).fetchall()
+            frequencies.sort(key=lambda row: row[1])
+
+            scores = {}
+            for term, df in frequencies[:self.MAX_QUERY_TERMS]:
+                idf = math.log(1 + (count - df + 0.5) / (df + 0.5))
+                for chunk_id, tf, length in self._db.execute(
+                        "SELECT p.chunk, p.tf, c.length FROM postings p JOIN chunks c ON c.id = p.chunk"
+                        " WHERE p.term = ?", (term,)):
+                    norm = self.K1 * (1 - self.B + self.B * length / avg_length)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.K1 + 1) / (tf + norm)
+
+            best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+            results = []
+            for chunk_id, score in best:
+                doc, text = self._db.execute("SELECT doc, text FROM chunks WHERE id = ?", (chunk_id,)).fetchone()
+                results.append((score, doc, text))
+            return results
+
+    def _get_stats(self) -> tuple:
+        """
+        Chunk count and average chunk length. Called with the lock held.
+        """
+        if self._stats is None:
+            count, avg_length = self._db.execute("SELECT COUNT(*), AVG(length) FROM chunks").fetchone()
+            self._stats = (count, max(avg_length or 1.0, 1.0))
+        return self._stats
+
+    def _remove(self, name: str):
+        """
+        Delete a document's chunks and postings. Called with the lock held.
+        """
+        ids = [row[0] for row in self._db.execute("SELECT id FROM chunks WHERE doc = ?", (name,))]
+        for chunk_id in ids:
+            terms = [(row[0],) for row in self._db.execute("SELECT term FROM postings WHERE chunk = ?", (chunk_id,))]
+            self._db.executemany("UPDATE terms SET df = df - 1 WHERE term = ?", terms)
+            self._db.execute("DELETE FROM postings WHERE chunk = ?", (chunk_id,))
+        self._db.execute("DELETE FROM chunks WHERE doc = ?", (name,))
+        self._db.execute("DELETE FROM terms WHERE df <= 0")
+
 
 class RagDocs:
 
+    # Save the manifest at most this often while indexing (seconds).
+    MANIFEST_INTERVAL = 2.0
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
     def __init__(self):
         self.local_dir = os.path.dirname(os.path.abspath(__file__))
         self.local_cache_dir = os.path.join(self.local_dir, 'cache')
         if not os.path.exists(self.local_cache_dir):
             os.makedirs(self.local_cache_dir)
 
+        # The index lives outside cache/, which only holds the documents.
+        self.local_index_dir = os.path.join(self.local_dir, 'index')
+        if not os.path.exists(self.local_index_dir):
+            os.makedirs(self.local_index_dir)
+        self.index = EnigmaDocIndex(os.path.join(self.local_index_dir, 'documents.sqlite3'))
+
+        # mtime, size and sha256 of every indexed document, so only added,
+        # changed or deleted documents are re-indexed.
+        self.manifest_path = os.path.join(self.local_index_dir, 'manifest.json')
+        self.manifest = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r') as f:
+                self.manifest = json.load(f)
+
+        self._refresh_lock = threading.Lock()
+        self._refresh_thread = None
+        self._refresh_again = False
+
+        # Catch up with documents changed while Binary Ninja was closed.
+        self.refresh()
+
+    @classmethod
+    def shared(cls) -> "RagDocs":
+        """
+        Return the process-wide documents, one index for every widget.
+        """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
     def save_files(self, filepaths: list[str]):
-        """ Save the contents of a file to the cache directory. """
+        """ Save the contents of a file to the cache directory, unchanged files are skipped. """
         for filepath in filepaths:
             filename = os.path.basename(filepath)
             with open(filepath, 'r') as f:
                 content = f.read()
+            target = os.path.join(self.local_cache_dir, filename)
+            if os.path.exists(target) and self.read_file(filename) == content:
+                continue
             self._write_file(filename, content)
-   
+        self.refresh()
+
+    def refresh(self):
+        """
+        Bring the index up to date with cache/ in the background. A refresh
+        requested while one is running is folded into a single rerun.
+        """
+        with self._refresh_lock:
+            if self._refresh_thread is not None:
+                self._refresh_again = True
+                return
+            self._refresh_thread = threading.Thread(target=self._refresh, name="EnigmaDocIndex", daemon=True)
+            self._refresh_thread.start()
+
+    def is_indexing(self) -> bool:
+        """ True while documents are being indexed. """
+        return self._refresh_thread is not None
+
+    def _refresh(self):
+        while True:
+            try:
+                self._update_index()
+            except Exception as e:
+                print(f"Document indexing failed: {e}")
+            with self._refresh_lock:
+                if not self._refresh_again:
+                    self._refresh_thread = None
+                    return
+                self._refresh_again = False
+
+    def _update_index(self):
+        """
+        Re-index added and changed documents and drop deleted ones.
+        """
+        files = set(self.list_files())
+        for filename in (set(self.manifest) | self.index.documents()) - files:
+            self.index.remove_document(filename)
+            self.manifest.pop(filename, None)
+
+        changed = []
+        for filename in sorted(files):
+            stat = os.stat(os.path.join(self.local_cache_dir, filename))
+            entry = self.manifest.get(filename)
+            if entry and entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size:
+                continue
+            if entry:
+                # Touched but possibly not modified, compare contents first.
+                with open(os.path.join(self.local_cache_dir, filename), 'rb') as f:
+                    if hashlib.sha256(f.read()).hexdigest() == entry['sha256']:
+                        entry.update(mtime=stat.st_mtime, size=stat.st_size)
+                        continue
+            changed.append((filename, stat))
+
+        if changed:
+            print(f"Indexing {len(changed)} documents")
+        stats = dict(changed)
+        saved = time.monotonic()
+        for filename, (sha256, rows) in self._prepare_documents(list(stats)):
+            self.index.add_prepared(filename, rows)
+            self.manifest[filename] = {'mtime': stats[filename].st_mtime, 'size': stats[filename].st_size,
+                                       'sha256': sha256}
+
+            # Save progress now and then, an interrupted run resumes from it.
+            if time.monotonic() - saved > self.MANIFEST_INTERVAL:
+                write_json_atomic(self.manifest_path, self.manifest)
+                saved = time.monotonic()
+        write_json_atomic(self.manifest_path, self.manifest)
+
+    def _prepare_documents(self, filenames: list):
+        """
+        Yield (filename, (sha256, rows)) as documents are prepared, in worker
+        processes if possible and in threads otherwise.
+        """
+        pending = list(filenames)
+        for pool in self._pools(len(pending)):
+            if not pending:
+                return
+            with pool:
+                futures = {pool.submit(prepare_document, os.path.join(self.local_cache_dir, filename)): filename
+                           for filename in pending}
+                try:
+                    for future in concurrent.futures.as_completed(futures):
+                        filename = futures[future]
+                        try:
+                            result = future.result()
+                        except concurrent.futures.process.BrokenProcessPool:
+                            raise
+                        except Exception as e:
+                            print(f"Failed to index {filename}: {e}")
+                            pending.remove(filename)
+                            continue
+                        pending.remove(filename)
+                        yield filename, result
+                    return
+                except concurrent.futures.process.BrokenProcessPool as e:
+                    print(f"Document indexing processes failed, using threads: {e}")
+
+    def _pools(self, jobs: int):
+        """
+        Yield a process pool, if worker processes can be started, then a thread pool.
+        """
+        workers = max(1, min(jobs, os.cpu_count() or 1, 4))
+
+        # Inside Binary Ninja sys.executable is Binary Ninja itself, which
+        # can't run worker processes.
+        if jobs > 1 and os.path.basename(sys.executable).lower().startswith('python'):
+            try:
+                yield concurrent.futures.ProcessPoolExecutor(
+                    max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            except (OSError, ValueError) as e:
+                print(f"Could not start indexing processes: {e}")
+        yield concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="EnigmaDocIndex")
+
     def read_file(self, filename: str):
        """ Read the contents of a file in the cache directory. """
        with open(os.path.join(self.local_cache_dir, filename), 'r') as f:
             return f.read()
-        
+
     def list_files(self):
         """ List all files in the cache directory. """
         return os.listdir(self.local_cache_dir)
-    
+
+    def search(self, query: str, top_k: int = 4) -> list:
+        """ Return the (score, filename, text) of the chunks best matching a query. """
+        return self.index.search(query, top_k)
+
+    def context(self, query: str, top_k: int = 4) -> str:
+        """ Format the best matching chunks as a prompt message, or None if nothing matches. """
+        results = self.search(query, top_k)
+        if not results:
+            return None
+        parts = [f"[{filename}]\n{text}" for _, filename, text in results]
+        return "Relevant excerpts from the user's documentation:\n\n" + "\n\n".join(parts)
+
     def _write_file(self, filename: str, content: str):
         """ Write the contents to a file in the cache directory. """
         with open(os.path.join(self.local_cache_dir, filename), 'w') as f:
             f.write(content)
-        
+
     def delete_file(self, filename: str):
-        """ Delete a file in the cache directory. """
+        """ Delete a file in the cache directory, it is dropped from the index in the background. """
         if os.path.exists(os.path.join(self.local_cache_dir, filename)):
-            os.remove(os.path.join(self.local_cache_dir, filename))
\ No newline at end of file
+            os.remove(os.path.join(self.local_cache_dir, filename))
+        self.refresh()
@@ -1,20 +1,45 @@
 from .enigma_ollama import EnigmaOllamaClient
+from .enigma_packs import EnigmaAnnotationPacks
+import os
+import threading
 
 class OllamaConfig:
+    """
+    Process-wide Ollama settings. Every sidebar widget shares the same
+    instance, see shared(), and setting changes update its client in place.
+    """
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
     def __init__(self):
-        self.host = None
-        self.port = None
-        self.model = None
-        self.client = self._create_client()
+        # The client reads server.json and model.json once, here.
+        self.client = EnigmaOllamaClient()
+        self.host = self.client.host
+        self.port = self.client.port
+        self.model = self.client.ollama_model
 
-    def _create_client(self):
-        return EnigmaOllamaClient(host=self.host, port=self.port, model=self.model)
+        # Imported annotation packs, shared by every widget.
+        self.packs = EnigmaAnnotationPacks(os.path.join(self.client.cache_dir, 'packs'))
+
+    @classmethod
+    def shared(cls) -> "OllamaConfig":
+        """
+        Return the shared config, creating it on first use.
+        """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
 
     def update_host_port(self, host, port):
         self.host = host
         self.port = port
-        self.client = self._create_client()
+        self.client.set_server(host, port)
+
+    def update_endpoints(self, endpoints):
+        self.client.set_endpoints(endpoints)
 
     def update_model(self, model):
         self.model = model
-        self.client = self._create_client()
\ No newline at end of file
+        self.client.set_model(model)
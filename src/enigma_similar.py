@@ -0,0 +1,165 @@
+import hashlib
+import numpy as np
+import re
+import sqlite3
+import threading
+import time
+import zlib
+
+
+class EnigmaSimilarityIndex:
+    """
+    Persistent index of earlier rename and explain results, looked up by
+    near-duplicate IL.
+
+    IL is normalised (auto-generated function, variable and data names and
+    constants are replaced by placeholders, imported and named symbols are
+    kept) and cut into shingles of SHINGLE_SIZE tokens. A MinHash signature
+    of NUM_HASHES values estimates the Jaccard similarity of two functions'
+    shingle sets, and locality sensitive hashing over BANDS bands of the
+    signature finds candidates without comparing against every entry.
+    Entries live in SQLite and are shared by every binary, so functions of
+    statically linked libraries or a known malware family are recognised
+    across binaries.
+    """
+
+    SHINGLE_SIZE = 5
+    NUM_HASHES = 128
+    BANDS = 32
+
+    # Functions with fewer shingles are too generic to match reliably.
+    MIN_SHINGLES = 16
+
+    _TOKEN = re.compile(r'[A-Za-z_][A-Za-z0-9_]*|0x[0-9a-fA-F]+|\d+|[^\sA-Za-z0-9_]')
+    _PLACEHOLDERS = (
+        (re.compile(r'^sub_[0-9a-fA-F]+$'), 'FUNC'),
+        (re.compile(r'^(?:var|arg)_[0-9a-fA-F]+(?:_\d+)?$|^arg\d+$'), 'VAR'),
+        (re.compile(r'^(?:data|jump_table|switch_table|str)_[0-9a-fA-F]+$'), 'DATA'),
+        (re.compile(r'^0x[0-9a-fA-F]{5,}$'), 'ADDR'),
+    )
+
+    # Mersenne prime for the MinHash permutations, products stay in 64 bits.
+    _PRIME = (1 << 31) - 1
+
+    def __init__(self, path: str, threshold: float = 0.85):
+        self.path = path
+
+        # Minimum estimated Jaccard similarity for a match.
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        # Fixed seed, signatures have to stay comparable across sessions.
+        rng = np.random.default_rng(0x5eed)
+        self._a = rng.integers(1, self._PRIME, size=self.NUM_HASHES, dtype=np.uint64)
+        self._b = rng.integers(0, self._PRIME, size=self.NUM_HASHES, dtype=np.uint64)
+
+        # Shared by the executor's workers, access is serialised by the lock.
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " id INTEGER PRIMARY KEY,"
+            " digest TEXT UNIQUE NOT NULL,"
+            " kind TEXT NOT NULL,"
+            " result TEXT NOT NULL,"
+            " source TEXT,"
+            " signature BLOB NOT NULL,"
+            " created REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS bands ("
+            " band INTEGER NOT NULL,"
+            " key INTEGER NOT NULL,"
+            " entry INTEGER NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS bands_key ON bands(band, key);")
+        self._db.commit()
+
+    def signature(self, il: str):
+        """
+        Return the MinHash signature of some IL, or None if it is too short.
+        """
+        tokens = []
+        for token in self._TOKEN.findall(il or ""):
+            for pattern, placeholder in self._PLACEHOLDERS:
+                if pattern.match(token):
+                    token = placeholder
+                    break
+            tokens.append(token)
+
+        size = self.SHINGLE_SIZE
+        shingles = {zlib.crc32(" ".join(tokens[i:i + size]).encode('utf-8'))
+                    for i in range(len(tokens) - size + 1)}
+        if len(shingles) < self.MIN_SHINGLES:
+            return None
+
+        values = np.fromiter(shingles, dtype=np.uint64, count=len(shingles))
+        hashes = (self._a[:, None] * values[None, :] + self._b[:, None]) % self._PRIME
+        return hashes.min(axis=1).astype(np.uint32)
+
+    def lookup(self, il: str, kind: str) -> tuple:
+        """
+        Find the result stored for the most similar earlier function.
+        return:
+            tuple: (result, similarity, source), or None below the threshold.
+        """
+        signature = self.signature(il)
+        if signature is None:
+            return None
+
+        with self._lock:
+            candidates = set()
+            for band, key in self._band_keys(signature):
+                candidates.update(row[0] for row in self._db.execute(
+                    "SELECT entry FROM bands WHERE band = ? AND key = ?", (band, key)))
+
+            best = None
+            for entry in candidates:
+                row = self._db.execute("SELECT result, source, signature FROM entries WHERE id = ? AND kind = ?",
+                                       (entry, kind)).fetchone()
+                if row is None:
+                    continue
+                other = np.frombuffer(row[2], dtype=np.uint32)
+                similarity = float(np.mean(other == signature))
+                if similarity >= self.threshold and (best is None or similarity > best[1]):
+                    best = (row[0], similarity, row[1])
+
+            if best is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return best
+
+    def add(self, il: str, kind: str, result: str, source: str = None):
+        """
+        Remember the result of a request about some IL. A function with an
+        identical signature only has its result updated.
+        """
+        signature = self.signature(il)
+        if signature is None or not result:
+            return
+        digest = hashlib.sha1(kind.encode('utf-8') + signature.tobytes()).hexdigest()
+        with self._lock:
+            row = self._db.execute("SELECT id FROM entries WHERE digest = ?", (digest,)).fetchone()
+            if row is not None:
+                self._db.execute("UPDATE entries SET result = ?, source = ?, created = ? WHERE id = ?",
+                                 (result, source, time.time(), row[0]))
+                self._db.commit()
+                return
+            entry = self._db.execute(
+                "INSERT INTO entries (digest, kind, result, source, signature, created) VALUES (?, ?, ?, ?, ?, ?)",
+                (digest, kind, result, source, signature.tobytes(), time.time())).lastrowid
+            self._db.executemany("INSERT INTO bands (band, key, entry) VALUES (?, ?, ?)",
+                                 [(band, key, entry) for band, key in self._band_keys(signature)])
+            self._db.commit()
+
+    def info(self) -> dict:
+        """
+        Return the hit and miss counters and the number of entries.
+        """
+        with self._lock:
+            count = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return {'hits': self.hits, 'misses': self.misses, 'entries': count}
+
+    def _band_keys(self, signature) -> list:
+        rows = self.NUM_HASHES // self.BANDS
+        return [(band, zlib.crc32(signature[band * rows:(band + 1) * rows].tobytes()))
+                for band in range(self.BANDS)]
@@ -0,0 +1,49 @@
+import time
+
+
+class EnigmaTokenCoalescer:
+    """
+    Buffers streamed chunks in the worker thread and hands them to the GUI
+    thread in batches.
+
+    A batch is flushed when the flush interval has elapsed since the last
+    flush or when the buffer reaches the byte threshold, so the number of
+    cross-thread signals stays bounded by the interval no matter how fast
+    the server streams. Call flush() once the stream ends to deliver the tail.
+    """
+
+    def __init__(self, emit: callable, interval: float = 0.05, max_bytes: int = 2048):
+        self.emit = emit
+        self.interval = interval
+        self.max_bytes = max_bytes
+        self._buffer = []
+        self._size = 0
+        self._last_flush = 0.0
+
+    def push(self, chunk: str):
+        """
+        Add a chunk, flushing if the interval or byte threshold is reached.
+        """
+        if not chunk:
+            return
+        self._buffer.append(chunk)
+        self._size += len(chunk)
+
+        now = time.monotonic()
+        if self._size >= self.max_bytes or now - self._last_flush >= self.interval:
+            self._flush(now)
+
+    def flush(self):
+        """
+        Deliver anything still buffered.
+        """
+        self._flush(time.monotonic())
+
+    def _flush(self, now: float):
+        self._last_flush = now
+        if not self._buffer:
+            return
+        text = "".join(self._buffer)
+        self._buffer.clear()
+        self._size = 0
+        self.emit(text)
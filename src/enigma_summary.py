@@ -0,0 +1,204 @@
+from binaryninja import BinaryView
+from .enigma_binapi import EnigmaFunctionContext
+from .enigma_executor import EnigmaExecutor, EnigmaRequest, Priority
+from .enigma_files import write_json_atomic
+from .enigma_ollama import EnigmaOllamaClient, MType
+import hashlib
+import json
+import os
+import threading
+
+
+def sanitize_summary(response: str) -> str:
+    """
+    Reduce a model response to a single line summary, or None.
+    """
+    for line in response.strip().strip('`').splitlines():
+        line = line.strip().lstrip('-*# ').strip()
+        if line:
+            return line[:240]
+    return None
+
+
+class EnigmaSummaryStore:
+    """
+    One-line summaries of the functions of a binary, keyed by function start
+    and saved as JSON next to the other EnigmaAI config. Summaries are
+    written once and reused by every later request that touches the function.
+    """
+
+    _stores = {}
+    _stores_lock = threading.Lock()
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._summaries = {}
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                self._summaries = {int(start, 16): summary for start, summary in json.load(f).items()}
+
+    @classmethod
+    def for_view(cls, bv: BinaryView, directory: str) -> "EnigmaSummaryStore":
+        """
+        Return the store of a binary, shared by everything in the process.
+        """
+        binary_id = hashlib.sha1(bv.file.filename.encode('utf-8')).hexdigest()
+        path = os.path.join(directory, f"summaries_{binary_id}.json")
+        with cls._stores_lock:
+            store = cls._stores.get(path)
+            if store is None:
+                if not os.path.exists(directory):
+                    os.makedirs(directory)
+                store = cls(path)
+                cls._stores[path] = store
+            return store
+
+    def get(self, start: int) -> str:
+        with self._lock:
+            return self._summaries.get(start)
+
+    def put(self, start: int, summary: str):
+        """
+        Store a summary and save the file.
+        """
+        with self._lock:
+            self._summaries[start] = summary
+            write_json_atomic(self.path, {f"{s:x}": text for s, text in self._summaries.items()})
+
+    def invalidate(self, start: int):
+        """
+        Forget the summary of a function that changed and save the file.
+        """
+        with self._lock:
+            if self._summaries.pop(start, None) is not None:
+                write_json_atomic(self.path, {f"{s:x}": text for s, text in self._summaries.items()})
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._summaries)
+
+
+class EnigmaSummaryContext:
+    """
+    Describes the neighbourhood of a function to the model through one-line
+    summaries of its callees and callers, instead of their full IL.
+
+    Neighbours are visited breadth-first up to `depth` calls away, callees
+    before callers, until `budget_tokens` is used up. Neighbours without a
+    summary yet are queued on the shared executor in the background (at
+    most `max_pending` at a time) and show up in later requests, so the
+    extra context costs a few tokens per function rather than its whole IL.
+    """
+
+    def __init__(self, client: EnigmaOllamaClient, budget_tokens: int = 512, depth: int = 1,
+                 max_pending: int = 16, executor: EnigmaExecutor = None):
+        self.client = client
+        self.budget_tokens = budget_tokens
+        self.depth = depth
+        self.max_pending = max_pending
+        self.executor = executor or EnigmaExecutor.shared()
+        self.directory = os.path.join(client.cache_dir, 'summaries')
+
+        # Optional EnigmaAnnotationPacks, checked before a summary is generated.
+        self.packs = None
+
+        # (store path, function start) of summaries being generated.
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def store(self, bv: BinaryView) -> EnigmaSummaryStore:
+        return EnigmaSummaryStore.for_view(bv, self.directory)
+
+    def invalidate(self, bv: BinaryView, start: int):
+        """
+        Drop the summary of a function whose code changed, it is generated
+        again the next time a neighbour needs it.
+        """
+        self.store(bv).invalidate(start)
+
+    def describe(self, bv: BinaryView, func) -> str:
+        """
+        Return the summaries of a function's neighbours as one message, or
+        None if none of them has a summary yet. Runs on a worker thread.
+        """
+        store = self.store(bv)
+        estimate = self.client.context_packer.estimate_tokens
+        lines = []
+        used = 0
+
+        for relation, neighbour in self._neighbours(func):
+            summary = store.get(neighbour.start)
+            if summary is None and self.packs is not None:
+                annotation = self.packs.lookup(neighbour)
+                summary = annotation.get('summary') if annotation else None
+                if summary:
+                    store.put(neighbour.start, summary)
+            if summary is None:
+                self.queue(bv, neighbour)
+                continue
+            line = f"{relation} {neighbour.name} (0x{neighbour.start:x}): {summary}"
+            cost = estimate(line)
+            if used + cost > self.budget_tokens:
+                break
+            lines.append(line)
+            used += cost
+
+        if not lines:
+            return None
+        return "Summaries of functions related to the current function:\n" + "\n".join(lines)
+
+    def queue(self, bv: BinaryView, func):
+        """
+        Generate the summary of a function in the background, if not already
+        stored or queued.
+        """
+        store = self.store(bv)
+        key = (store.path, func.start)
+        with self._lock:
+            if key in self._pending or len(self._pending) >= self.max_pending:
+                return
+            if store.get(func.start) is not None:
+                return
+            self._pending.add(key)
+
+        request = EnigmaRequest(self.client, MType.SYSTEM_SUMMARY)
+        request.priority = Priority.PREFETCH
+        request.function_start = func.start
+        request.context_provider = lambda progress, cancel_event: EnigmaFunctionContext(
+            func.start, func.name, str(func.high_level_il))
+        request.on_done = lambda request: self._on_done(store, key, request)
+        self.executor.submit(request)
+
+    def _on_done(self, store: EnigmaSummaryStore, key: tuple, request: EnigmaRequest):
+        with self._lock:
+            self._pending.discard(key)
+        if request.error is not None or request.is_cancelled():
+            return
+        summary = sanitize_summary(request.result or "")
+        if summary:
+            store.put(request.function_start, summary)
+
+    def _neighbours(self, func):
+        """
+        Yield (relation, function) pairs breadth-first, up to `depth` calls away.
+        """
+        seen = {func.start}
+        frontier = [func]
+        for _ in range(self.depth):
+            callees = []
+            callers = []
+            for current in frontier:
+                for callee in current.callees:
+                    if callee.start not in seen:
+                        seen.add(callee.start)
+                        callees.append(callee)
+                for caller in current.callers:
+                    if caller.start not in seen:
+                        seen.add(caller.start)
+                        callers.append(caller)
+            for callee in callees:
+                yield "callee", callee
+            for caller in callers:
+                yield "caller", caller
+            frontier = callees + callers
@@ -1,6 +1,12 @@
 from PySide6 import QtCore, QtWidgets, QtGui
-from .enigma_workers import OllamaWorker
+from ..enigma_batch import EnigmaBatchRenamer
+from ..enigma_embed import EnigmaSemanticSearch
+from ..enigma_executor import EnigmaExecutor, EnigmaRequest
+from ..enigma_ollama import EnigmaConversation, MType
+from .enigma_render import EnigmaStreamRenderer
+import html
 import markdown
+import threading
 
 class EnigmaChatSidebar(QtWidgets.QWidget):
     def __init__(self, parent=None):
@@ -16,40 +22,82 @@ class EnigmaChatSidebar(QtWidgets.QWidget):
         self.rename_vr = QtWidgets.QPushButton("Rename variables", self)
         self.rename_fn = QtWidgets.QPushButton("Rename function", self)
 
+        # Whole-binary rename of sub_* functions.
+        self.rename_all = QtWidgets.QPushButton("Rename all sub_* functions", self)
+        self.parallelism = QtWidgets.QSpinBox(self)
+        self.parallelism.setRange(1, 64)
+        self.parallelism.setValue(4)
+        self.parallelism.setPrefix("Parallel requests: ")
+
         self.example_fn.clicked.connect(parent.explain_function)
         self.rename_fn.clicked.connect(parent.rename_function)
+        self.rename_all.clicked.connect(parent.rename_all_functions)
 
         layout.addWidget(self.example_fn)
         layout.addWidget(self.rename_vr)
         layout.addWidget(self.rename_fn)
+        layout.addWidget(self.rename_all)
+        layout.addWidget(self.parallelism)
+
+        # Ask the model again even if an identical explain/rename is cached.
+        self.bypass_cache = QtWidgets.QCheckBox("Bypass response cache", self)
+        layout.addWidget(self.bypass_cache)
+
+        # Share names, summaries and variable names with other analysts.
+        self.export_pack = QtWidgets.QPushButton("Export annotation pack", self)
+        self.import_pack = QtWidgets.QPushButton("Import annotation pack", self)
+        self.export_pack.clicked.connect(parent.export_pack)
+        self.import_pack.clicked.connect(parent.import_pack)
+        layout.addWidget(self.export_pack)
+        layout.addWidget(self.import_pack)
         layout.addStretch()
 
+        # Request and cache statistics.
+        self.stats = QtWidgets.QLabel(self)
+        self.stats.setWordWrap(True)
+        layout.addWidget(self.stats)
+
 class EnigmaChatTab(QtWidgets.QWidget):
+
+    # Results of a /search, emitted from the search thread.
+    search_finished = QtCore.Signal(str, list)
+    search_failed = QtCore.Signal(str)
+    search_status = QtCore.Signal(str)
+
+    # Outcome of an annotation pack export or import, emitted from its thread.
+    pack_finished = QtCore.Signal(str)
+
     def __init__(self, parent, bin_api):
         super().__init__()
         self.bin_api = bin_api
         self.parent = parent
         self._ai_client = parent._ai_client
 
-        # For renaming function
-        self._tmp_new_fn_name = ""
-        self._tmp_old_fn_name = ""
+        # Requests run on the plugin-wide executor.
+        self.executor = EnigmaExecutor.shared()
+
+        # Requests from this tab that are queued or streaming, by id.
+        self._requests = {}
+
+        # Metrics of the last completed request, shown in the sidebar.
+        self.last_metrics = None
+
+        # Running whole-binary rename, if any.
+        self.batch = None
+
+        # Embedding search over the binary's functions, see search_functions.
+        self.semantic_search = EnigmaSemanticSearch(self._ai_client, bin_api.summaries)
+        self._search_cancel = None
 
         # Initialize Markdown with an extension for fenced code blocks.
         self.md = markdown.Markdown(extensions=['fenced_code', 'codehilite', 'tables'])
 
         # Chat history: list of (author, message) tuples.
         self.chat_history = []
-        
-        # Buffer to hold the current streaming AI response.
-        self.current_stream = ""
- 
-        # Connect the Explain function button to the parent's explain_function.
-        self._ollama_message_connected = False
-        self._fn_name_connected = False
-       
-        # Flag to indicate streaming is in progress.
-        self.is_streaming = False
+
+        # What the model is sent as history, per tab so chats about
+        # different binaries stay apart.
+        self.conversation = EnigmaConversation()
 
         # UI elements for the chat area.
         self.chat_box = QtWidgets.QTextBrowser()
@@ -58,16 +106,27 @@ class EnigmaChatTab(QtWidgets.QWidget):
         self.chat_box.anchorClicked.connect(self.on_anchor_clicked)
         self.chat_box.document().setDefaultStyleSheet(self.get_style_sheet())
 
+        # Appends streamed tokens to the live message instead of re-rendering the chat.
+        self.renderer = EnigmaStreamRenderer(self.chat_box)
+
+        # Shows what queued requests are waiting on (analysis, the model, ...).
+        self.status_label = QtWidgets.QLabel()
+        self.status_label.setVisible(False)
+
         self.input_box = QtWidgets.QLineEdit()
         self.send_button = QtWidgets.QPushButton("Send")
+        self.stop_button = QtWidgets.QPushButton("Stop")
+        self.stop_button.setEnabled(False)
         self.clear_button = QtWidgets.QPushButton("Clear Chat")
 
         # Chat layout (chat_box + input area).
         chat_layout = QtWidgets.QVBoxLayout()
         chat_layout.addWidget(self.chat_box)
+        chat_layout.addWidget(self.status_label)
         input_layout = QtWidgets.QHBoxLayout()
         input_layout.addWidget(self.input_box)
         input_layout.addWidget(self.send_button)
+        input_layout.addWidget(self.stop_button)
         input_layout.addWidget(self.clear_button)
         chat_layout.addLayout(input_layout)
 
@@ -91,8 +150,13 @@ class EnigmaChatTab(QtWidgets.QWidget):
 
         # Connections.
         self.send_button.clicked.connect(self.on_send_clicked)
+        self.stop_button.clicked.connect(self.cancel_requests)
         self.clear_button.clicked.connect(self.clear_chat)
         self.input_box.returnPressed.connect(self.on_send_clicked)
+        self.search_finished.connect(self.show_search_results)
+        self.search_failed.connect(self.search_error)
+        self.search_status.connect(self.show_search_status)
+        self.pack_finished.connect(self.pack_done)
 
         # Render initial chat (if any).
         self.render_html()
@@ -129,181 +193,482 @@ class EnigmaChatTab(QtWidgets.QWidget):
             self.sidebar_toggle.setText("»")
         self.resizeEvent(None)
 
-    def _send_message(self, message, run_method_name: str):
+    def _send_message(self, message, mtype: MType):
         """
-        Common method to append message, start worker thread, and update UI.
-        The run_method_name argument should be the name of the worker method
-        to call (e.g. 'run' or 'run_c').
+        Common method to append message, queue the request on the executor,
+        and update UI. Each request streams into its own live message.
         """
         if not message.strip():
             return
 
         self.append_message("You", message)
-        self._ai_client.set_function_il(self.bin_api.get_function_il())
         self.input_box.clear()
 
-        self.is_streaming = True
-        self.current_stream = ""
+        # The function context (IL, name) is captured on the worker, so the
+        # UI stays responsive while HLIL is generated or analysis finishes.
+        request = EnigmaRequest(self._ai_client, mtype, message=message)
+        request.context_provider = self.bin_api.context_capture()
+        request.function_start = self.bin_api.get_function_start()
+        request.use_cache = not self.sidebar.bypass_cache.isChecked()
+        request.conversation = self.conversation
+
+        # Per-request UI state, so overlapping requests never share a buffer.
+        request.text = ""
+        request.history_index = len(self.chat_history)
         self.chat_history.append(("EnigmaAI", ""))
-        self.render_html()
+        request.live = self.renderer.begin_stream(self.message_html("EnigmaAI", "", streaming=True))
 
-        # Create a new thread and worker for the long-running task. 
-        self.thread = QtCore.QThread()
-        self.worker = OllamaWorker(self._ai_client, message=message)
-        self.worker.moveToThread(self.thread)
-        
-        # Get the worker method to call.
+        if mtype == MType.SYSTEM_RENAME_FN:
+            # The suggested name is collected silently and applied at the end.
+            request.progress.connect(self.append_fn_name)
+            request.finished.connect(self.final_rename)
+        else:
+            request.progress.connect(self.append_ollama_message)
+            request.finished.connect(self.finish_response)
+        request.failed.connect(self.request_failed)
+        request.cancelled.connect(self.request_cancelled)
+        request.status.connect(self.request_status)
+        request.metrics.connect(self.request_metrics)
+
+        self._requests[request.id] = request
+        self.stop_button.setEnabled(True)
+        self.executor.submit(request)
+        self.update_stats()
+
+    def update_stats(self):
+        """
+        Shows the IL cache counters in the sidebar.
+        """
+        info = self.bin_api.cache_info()
+        responses = self._ai_client.response_cache.info()
+        similar = self._ai_client.similarity_index.info()
+        packs = self.parent.config.packs.info()
+        hedging = self._ai_client.hedge_stats
+        queues = self.executor.info()
+        documents = self.parent.rag_docs
+        # Requests sent while indexing only search the documents indexed so far.
+        indexing = " (indexing, excerpts may be incomplete)" if documents.is_indexing() else ""
+        self.sidebar.stats.setText(
+            f"IL cache: {info['hits']} hits / {info['misses']} misses "
+            f"({info['size']}/{info['maxsize']})\n"
+            f"Response cache: {responses['hits']} hits / {responses['misses']} misses "
+            f"({responses['entries']} entries)\n"
+            f"Similar functions: {similar['hits']} reused / {similar['misses']} new "
+            f"({similar['entries']} known)\n"
+            f"Annotation packs: {packs['hits']} hits / {packs['misses']} misses "
+            f"({packs['entries']} functions in {packs['packs']} packs)\n"
+            f"Hedged chats: {hedging['hedged']} of {hedging['requests']}, "
+            f"{hedging['hedge_won']} won by the hedge\n"
+            f"Documents: {len(documents.manifest)} indexed{indexing}\n"
+            "Requests (queued/running): " + ", ".join(
+                f"{priority.name.lower()} {queued}/{running}" for priority, (queued, running) in queues.items())
+            + self._metrics_text())
+
+    def _metrics_text(self) -> str:
+        """
+        Formats the last request's metrics for the sidebar.
+        """
+        metrics = self.last_metrics
+        if not metrics:
+            return ""
+        text = f"\nLast request: {metrics.get('ttft', 0):.2f}s to first token"
+        if metrics.get('chunks'):
+            text += f", explained in {metrics['chunks']} chunks"
+        if metrics.get('hedged'):
+            text += ", hedged" + (" (hedge won)" if metrics.get('hedge_won') else "")
+        if metrics.get('il_compact_tokens') is not None:
+            text += f", IL ~{metrics['il_tokens']} -> ~{metrics['il_compact_tokens']} tokens"
+        if metrics.get('pack'):
+            return text + " (from an annotation pack)"
+        if metrics.get('similar') is not None:
+            return text + f" (reused from a {metrics['similar']:.0%} similar function)"
+        if metrics.get('cached'):
+            return text + " (cached)"
+        if metrics.get('prompt_eval_count') is not None:
+            text += (f", {metrics['prompt_eval_count']} of ~{metrics['prompt_tokens']} prompt tokens"
+                     f" evaluated in {metrics.get('prompt_eval_duration', 0):.2f}s")
+        return text
+
+    @property
+    def is_streaming(self) -> bool:
+        """
+        True while any request from this tab is queued or streaming.
+        """
+        return bool(self._requests)
+
+    def cancel_requests(self):
+        """
+        Cancels every queued or streaming request from this tab, and the
+        batch rename if one is running.
+        """
+        for request in self._requests.values():
+            request.cancel()
+        if self.batch is not None:
+            self.batch.cancel()
+
+    def cancel_stale(self, function_start):
+        """
+        Cancels requests about a function other than function_start, called
+        when the user navigates away so the server works on what they are
+        looking at.
+        """
+        for request in self._requests.values():
+            if request.function_start is not None and request.function_start != function_start:
+                request.cancel()
 
-        # Depending on the run_method_name, we will call the appropriate method.
-        # This is a simple way to avoid code duplication.
-        run_method = getattr(self.worker, run_method_name)
-        self.thread.started.connect(run_method)
+    def on_send_clicked(self):
+        """
+        Called when the Send button is clicked.
+        """
+        message = self.input_box.text()
+        if message.startswith("/search "):
+            self.search_functions(message[len("/search "):].strip())
+            return
+        self._send_message(message, MType.SYSTEM)
 
-        # Connect signals for cleanup        
+    def search_functions(self, query):
+        """
+        Rank the binary's functions against a question using embeddings,
+        without the chat model reading any of them.
+        """
+        self.append_message("You", f"/search {html.escape(query)}")
+        self.input_box.clear()
+        if not query:
+            return
+        if self.parent.bv is None:
+            self.append_message("EnigmaAI", "Error: No binary is open.")
+            return
 
-        self.worker.finished.connect(self.thread.quit)
-        self.worker.finished.connect(self.worker.deleteLater)
-        self.thread.finished.connect(self.thread.deleteLater)
-        
-        # Depending on the run_method_name, we will connect the appropriate signals.
-        if run_method_name in ["run", "run_c"]:
-            self._ai_client.response_received.connect(self.append_ollama_message, QtCore.Qt.UniqueConnection)
-            self._ollama_message_connected = True
-            self.worker.finished.connect(self.finish_response)
+        if self._search_cancel is not None:
+            self._search_cancel.set()
+        cancel_event = threading.Event()
+        self._search_cancel = cancel_event
+        bv = self.parent.bv
 
-        elif run_method_name == "run_rename_fn":
-            self._ai_client.response_received.connect(self.append_fn_name, QtCore.Qt.UniqueConnection)
-            self._fn_name_connected = True
-            self.worker.finished.connect(self.final_rename)
+        def run():
+            try:
+                results = self.semantic_search.search(bv, query, progress=self.search_status.emit,
+                                                      cancel_event=cancel_event)
+            except Exception as e:
+                print(f"Function search failed: {e}")
+                self.search_failed.emit(str(e))
+                return
+            if not cancel_event.is_set():
+                self.search_finished.emit(query, results)
+
+        self.status_label.setText("Searching functions")
+        self.status_label.setVisible(True)
+        threading.Thread(target=run, name="EnigmaSearch", daemon=True).start()
 
-        self.thread.start()
+    @QtCore.Slot(str)
+    def show_search_status(self, status):
+        self.status_label.setText(status)
+        self.status_label.setVisible(True)
 
-    def on_send_clicked(self):
+    @QtCore.Slot(str, list)
+    def show_search_results(self, query, results):
         """
-        Called when the Send button is clicked.
+        Lists the matching functions, each linking to its address.
         """
-        message = self.input_box.text()
-        self._send_message(message, "run")
+        self._search_cancel = None
+        self.status_label.setVisible(bool(self._requests))
+        if not results:
+            self.append_message("EnigmaAI", f"No functions found for <em>{html.escape(query)}</em>.")
+            return
+        items = "".join(f"<li><a href='enigma:0x{start:x}'>{html.escape(name)}</a> "
+                        f"(0x{start:x}, {score:.2f})</li>" for start, name, score in results)
+        self.append_message("EnigmaAI", f"Functions matching <em>{html.escape(query)}</em>:<ol>{items}</ol>")
+
+    @QtCore.Slot(str)
+    def search_error(self, error):
+        self._search_cancel = None
+        self.status_label.setVisible(bool(self._requests))
+        self.append_message("EnigmaAI", f"Function search failed: {html.escape(error)}")
 
     def explain_function(self):
         """
         Called to explain a function; behaves like on_send_clicked
-        but uses the worker's run_c method.
+        but uses the pseudo-c prompts.
         """
 
         # In this example, we use the same input box text.
         # You could alternatively pre-populate the message from another source.
-        self._send_message("Running explain function.", "run_c")
+        self._send_message("Running explain function.", MType.SYSTEM_PSEUDO)
 
     def rename_function(self):
         """
         Use the Binary Ninja API to rename a function based on
         EnigmaAI's suggestion.
         """
-        
-        # Store the old function name for later. 
-        # This techincally is going to cause a bug, but it's a good example for now.
-        self._tmp_old_fn_name = self.bin_api.get_function_name()
+        self._send_message("Running rename function.", MType.SYSTEM_RENAME_FN)
+
+    def rename_all_functions(self):
+        """
+        Starts (or resumes) renaming every sub_* function in the binary.
+        """
+        if self.parent.bv is None:
+            self.append_message("EnigmaAI", "Error: No binary is open.")
+            return
+        if self.batch is not None and self.batch.is_running():
+            self.append_message("EnigmaAI", "A batch rename is already running.")
+            return
+
+        self.batch = EnigmaBatchRenamer(self.parent.bv, self._ai_client,
+                                        parallelism=self.sidebar.parallelism.value(),
+                                        packs=self.bin_api.packs)
+        self.batch.progress.connect(self.batch_progress)
+        self.batch.finished.connect(self.batch_finished)
+        self.batch.failed.connect(self.batch_failed)
+        self.batch.cancelled.connect(self.batch_cancelled)
+        self.append_message("EnigmaAI", "Renaming all `sub_*` functions...")
+        self.stop_button.setEnabled(True)
+        self.batch.start()
+
+    def export_pack(self):
+        """
+        Writes the names, summaries and variable names of the binary's
+        functions to an annotation pack other analysts can import.
+        """
+        if self.parent.bv is None:
+            self.append_message("EnigmaAI", "Error: No binary is open.")
+            return
+        path, _ = QtWidgets.QFileDialog.getSaveFileName(
+            self, "Export annotation pack", "", "EnigmaAI annotation packs (*.enigmapack)")
+        if not path:
+            return
+        if not path.endswith(".enigmapack"):
+            path += ".enigmapack"
+        bv = self.parent.bv
+        packs = self.parent.config.packs
+
+        def run():
+            try:
+                count = packs.export(bv, path, self.bin_api.summaries, progress=self.search_status.emit)
+            except Exception as e:
+                print(f"Annotation pack export failed: {e}")
+                self.pack_finished.emit(f"Annotation pack export failed: {html.escape(str(e))}")
+                return
+            self.pack_finished.emit(f"Exported {count} functions to `{html.escape(path)}`.")
+
+        self.status_label.setText("Exporting annotation pack")
+        self.status_label.setVisible(True)
+        threading.Thread(target=run, name="EnigmaPackExport", daemon=True).start()
+
+    def import_pack(self):
+        """
+        Adds an annotation pack, its names and summaries are used before
+        asking the model from now on.
+        """
+        path, _ = QtWidgets.QFileDialog.getOpenFileName(
+            self, "Import annotation pack", "", "EnigmaAI annotation packs (*.enigmapack)")
+        if not path:
+            return
+        try:
+            count = self.parent.config.packs.import_pack(path)
+        except Exception as e:
+            print(f"Annotation pack import failed: {e}")
+            self.append_message("EnigmaAI", f"Annotation pack import failed: {html.escape(str(e))}")
+            return
+        self.append_message("EnigmaAI", f"Imported an annotation pack with {count} functions.")
+        self.update_stats()
+
+    @QtCore.Slot(str)
+    def pack_done(self, message):
+        self.status_label.setVisible(bool(self._requests))
+        self.append_message("EnigmaAI", message)
+        self.update_stats()
+
+    @QtCore.Slot(int, int, float)
+    def batch_progress(self, done, total, rate):
+        """
+        Shows the batch rename progress and throughput.
+        """
+        self.status_label.setText(f"Batch rename: {done}/{total} functions ({rate:.1f} functions/min)")
+        self.status_label.setVisible(True)
 
-        # Set the tmp name to empty.
-        self._tmp_new_fn_name = ""
+    @QtCore.Slot(int)
+    def batch_finished(self, renamed):
+        """
+        Reports the result of the batch rename.
+        """
+        self.status_label.setVisible(bool(self._requests))
+        self.stop_button.setEnabled(bool(self._requests))
+        self.append_message("EnigmaAI", f"Batch rename finished, {renamed} functions renamed.")
 
-        # Run the rename function.
-        self._send_message("Running rename function.", "run_rename_fn")
+    @QtCore.Slot(int)
+    def batch_cancelled(self, checkpointed):
+        """
+        Reports a stopped batch rename, the next run resumes from its checkpoint.
+        """
+        self.status_label.setVisible(bool(self._requests))
+        self.stop_button.setEnabled(bool(self._requests))
+        self.append_message("EnigmaAI", f"Batch rename stopped, {checkpointed} names kept for the next run.")
+
+    @QtCore.Slot(str)
+    def batch_failed(self, error):
+        """
+        Reports a failed batch rename.
+        """
+        self.status_label.setVisible(bool(self._requests))
+        self.stop_button.setEnabled(bool(self._requests))
+        self.append_message("EnigmaAI", f"Batch rename failed: {error}")
+
+    def _request_from_sender(self):
+        """
+        Return the request that emitted the current signal, or None if it
+        belongs to a chat that has since been cleared.
+        """
+        request = self.sender()
+        if request is None:
+            return None
+        return self._requests.get(request.id)
 
-    def final_rename(self):
+    def _finish_request(self, request, message):
+        """
+        Replace the request's streaming placeholder with its final message.
+        """
+        self._requests.pop(request.id, None)
+        self.stop_button.setEnabled(bool(self._requests))
+        self.status_label.setVisible(bool(self._requests))
+        self.update_stats()
+        self.chat_history[request.history_index] = ("EnigmaAI", message)
+        self.renderer.finish_stream(self.message_html("EnigmaAI", message), request.live)
+
+    @QtCore.Slot(str)
+    def final_rename(self, response):
         """
         Final function rename call.
         """
-        if self._tmp_new_fn_name:
-            self.bin_api.rename_function(self._tmp_old_fn_name, self._tmp_new_fn_name)
+        request = self._request_from_sender()
+        if request is None:
+            return
+
+        # The response has the IL aliases expanded, the streamed text may not.
+        new_name = response.strip()
+        if new_name and request.context is not None:
+            old_name = request.context.name
+            self.bin_api.rename_function(old_name, new_name, request.context.start)
             
             # Add confirmation message to chat window
-            confirmation = f"Function renamed successfully:\n- Old name: `{self._tmp_old_fn_name}`\n- New name: `{self._tmp_new_fn_name}`"
-            self.append_message("EnigmaAI", confirmation)
+            confirmation = f"Function renamed successfully:\n- Old name: `{old_name}`\n- New name: `{new_name}`"
+            if getattr(request, 'from_pack', False):
+                variables = (request.context.annotation or {}).get('variables')
+                renamed = self.bin_api.rename_variables(request.context.start, variables)
+                confirmation += f"\n- Taken from an annotation pack, {renamed} variables renamed"
+            elif getattr(request, 'similar', None) is not None:
+                confirmation += f"\n- Reused from a {request.similar:.0%} similar function, rename again with the response cache bypassed to ask the model"
         else:
             # Handle case where no name was generated
-            self.append_message("EnigmaAI", "Error: Failed to generate a new function name.")
-        
-        self.disconnect_signals()
-        self.render_html()
+            confirmation = "Error: Failed to generate a new function name."
+
+        self._finish_request(request, confirmation)
 
     @QtCore.Slot(str)
     def append_fn_name(self, message):
         """
         Store's the returned function name from the AI.
         """
-        self._tmp_new_fn_name += message
+        request = self._request_from_sender()
+        if request is not None:
+            request.text += message
 
     def append_message(self, author, message):
         """
-        Appends a message to the chat history and refreshes the display.
+        Appends a message to the chat history and to the end of the display.
         """
         self.chat_history.append((author, message))
-        self.render_html()
+        self.renderer.append_message(self.message_html(author, message))
 
     @QtCore.Slot(str)
     def append_ollama_message(self, message):
         """
         Called when a new chunk arrives from the AI.
-        Updates the streaming buffer and refreshes the display.
+        Appends only the new text to the request's live message.
         """
-        self.current_stream += message
-        self.chat_history[-1] = ("EnigmaAI", self.current_stream)
-        self.render_html()
+        request = self._request_from_sender()
+        if request is None:
+            return
+        request.text += message
+        self.status_label.setVisible(False)
+        self.renderer.append(message, request.live)
 
-    def finish_response(self):
+    @QtCore.Slot(str)
+    def finish_response(self, response):
         """
-        Ends streaming and renders the final Markdown-processed response.
+        Ends streaming and re-renders only the finished message as Markdown.
         """
-        self.is_streaming = False
-        final_text = self.md.convert(self.current_stream)
-        self.chat_history[-1] = ("EnigmaAI", final_text)
-        self.render_html()
-        self.disconnect_signals()
-        
-    def disconnect_signals(self):
+        request = self._request_from_sender()
+        if request is None:
+            return
+        if getattr(request, 'similar', None) is not None:
+            response = (f"*Reused from a {request.similar:.0%} similar function, bypass the response "
+                        f"cache to ask the model.*\n\n{response}")
+        self._finish_request(request, self.md.convert(response))
+
+    @QtCore.Slot(str)
+    def request_failed(self, error):
         """
-        Disconnects all signals from the AI client.
+        Shows the error in place of the failed request's response.
         """
-        if self._ollama_message_connected:
-            try:
-                self._ai_client.response_received.disconnect(self.append_ollama_message)
-                self._ollama_message_connected = False
-            except (TypeError, RuntimeError):
-                # Slot was not connected or object already deleted
-                self._ollama_message_connected = False
-        
-        if self._fn_name_connected:
-            try:
-                self._ai_client.response_received.disconnect(self.append_fn_name)
-                self._fn_name_connected = False
-            except (TypeError, RuntimeError):
-                # Slot was not connected or object already deleted
-                self._fn_name_connected = False
+        request = self._request_from_sender()
+        if request is None:
+            return
+        self._finish_request(request, f"Error: {error}")
+
+    @QtCore.Slot(str)
+    def request_status(self, status):
+        """
+        Shows the progress of a request that hasn't started streaming yet.
+        """
+        if self._request_from_sender() is None:
+            return
+        self.status_label.setText(status)
+        self.status_label.setVisible(True)
+
+    @QtCore.Slot(dict)
+    def request_metrics(self, metrics):
+        """
+        Records the metrics of a completed request.
+        """
+        request = self._request_from_sender()
+        if request is not None:
+            request.similar = metrics.get('similar')
+            request.from_pack = metrics.get('pack', False)
+        self.last_metrics = metrics
+        self.update_stats()
+
+    @QtCore.Slot(str)
+    def request_cancelled(self, partial):
+        """
+        Renders whatever was received before the request was cancelled.
+        """
+        request = self._request_from_sender()
+        if request is None:
+            return
+        self._finish_request(request, self.md.convert(request.text + "\n\n*(cancelled)*"))
+
+    def message_html(self, author, message, streaming=False):
+        """
+        Returns the HTML for a single chat message.
+        """
+        if author == "Context":
+            return f"<div class='context'>{self.md.convert(message)}</div>"
+        elif author == "You":
+            return f"<div class='user-message'><strong>{author}:</strong> {message}</div>"
+        elif author == "EnigmaAI":
+            if streaming:
+                return f"<div class='ai-message streaming'><strong>{author}:</strong> {message}</div>"
+            return f"<div class='ai-message'><strong>{author}:</strong> {message}</div>"
+        return f"<div><strong>{author}:</strong> {message}</div>"
 
     def render_html(self):
         """
-        Renders the chat history to the chat box.
-        """
-        html_parts = []
-
-        for author, message in self.chat_history:
-            if author == "Context":
-                html_parts.append(f"<div class='context'>{self.md.convert(message)}</div>")
-            elif author == "You":
-                html_parts.append(f"<div class='user-message'><strong>{author}:</strong> {message}</div>")
-            elif author == "EnigmaAI":
-                if self.is_streaming and message == self.current_stream:
-                    html_parts.append(f"<div class='ai-message streaming'><strong>{author}:</strong> {message}</div>")
-                else:
-                    html_parts.append(f"<div class='ai-message'><strong>{author}:</strong> {message}</div>")
-            else:
-                html_parts.append(f"<div><strong>{author}:</strong> {message}</div>")
-
-        final_html = self.get_style_sheet() + "".join(html_parts)
-        self.chat_box.setHtml(final_html)
-        self.scroll_to_bottom()
+        Renders the whole chat history to the chat box. Streaming updates
+        go through the renderer instead, this is only for full rebuilds.
+        """
+        html_parts = [self.get_style_sheet()]
+        html_parts.extend(self.message_html(author, message) for author, message in self.chat_history)
+        self.renderer.set_messages(html_parts)
         
     def get_style_sheet(self):
         """
@@ -331,14 +696,19 @@ class EnigmaChatTab(QtWidgets.QWidget):
         """
         Scrolls the chat box to the bottom.
         """
-        scrollbar = self.chat_box.verticalScrollBar()
-        scrollbar.setValue(scrollbar.maximum())
+        self.renderer.scroll_to_bottom()
 
     def on_anchor_clicked(self, url: QtCore.QUrl):
         """
-        Opens a clicked URL in the default browser.
+        Navigates to enigma:<address> links, opens other URLs in the default browser.
         """
         print(f"Anchor clicked: {url.toString()}")
+        if url.scheme() == "enigma":
+            try:
+                self.parent.navigate_to(int(url.path(), 16))
+            except ValueError:
+                print(f"Invalid address link: {url.toString()}")
+            return
         QtGui.QDesktopServices.openUrl(url)
 
     def clear_chat(self):
@@ -346,9 +716,13 @@ class EnigmaChatTab(QtWidgets.QWidget):
         Clears the chat history and resets the UI.
         """
         self.chat_history.clear()
-        self.current_stream = ""
-        if hasattr(self._ai_client, "clear_context"):
-            self._ai_client.clear_context()
+
+        # Cancel in-flight requests, their output is discarded.
+        self.cancel_requests()
+        self._requests.clear()
+        self.stop_button.setEnabled(False)
+        self.status_label.setVisible(False)
+        self.conversation.clear()
 
         # Refresh the chat box.
         self.render_html()
\ No newline at end of file
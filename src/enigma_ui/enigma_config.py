@@ -2,12 +2,15 @@ from PySide6 import QtWidgets, QtCore
 
 class EnigmaConfigTab(QtWidgets.QWidget):
     
-    def __init__(self, update_host_port: callable):
+    def __init__(self, update_host_port: callable, update_backend: callable = None, use_async: bool = False,
+                 update_endpoints: callable = None, endpoints: list = None):
         """
         Initializes the EnigmaConfigTab for configuring the Ollama server URL and port.
         """
         super().__init__()
         self.update_host_port = update_host_port
+        self.update_backend = update_backend
+        self.update_endpoints = update_endpoints
 
         # Initialize UI elements
         self.url_label = QtWidgets.QLabel("Ollama Server URL:")
@@ -16,6 +19,16 @@ class EnigmaConfigTab(QtWidgets.QWidget):
         self.port_label = QtWidgets.QLabel("Ollama Server Port:")
         self.port_input = QtWidgets.QLineEdit("11434")  # Default Port
 
+        # Requests are load balanced over this server and any additional ones.
+        self.endpoints_label = QtWidgets.QLabel("Additional Ollama Servers (comma separated):")
+        self.endpoints_input = QtWidgets.QLineEdit(", ".join(endpoints or []))
+        self.endpoints_input.setPlaceholderText("http://gpu2:11434, http://gpu3:11434")
+
+        # Stream requests with ollama.AsyncClient on a single event loop
+        # instead of one worker thread per stream.
+        self.async_checkbox = QtWidgets.QCheckBox("Multiplex requests on an asyncio event loop")
+        self.async_checkbox.setChecked(use_async)
+
         self.save_button = QtWidgets.QPushButton("Save Configuration")
         self.save_button.clicked.connect(self.onSaveConfigClicked)
 
@@ -25,6 +38,9 @@ class EnigmaConfigTab(QtWidgets.QWidget):
         layout.addWidget(self.url_input)
         layout.addWidget(self.port_label)
         layout.addWidget(self.port_input)
+        layout.addWidget(self.endpoints_label)
+        layout.addWidget(self.endpoints_input)
+        layout.addWidget(self.async_checkbox)
         layout.addWidget(self.save_button)
 
         self.url = None
@@ -45,6 +61,10 @@ class EnigmaConfigTab(QtWidgets.QWidget):
             
             # Run the update_ai_client function to update the AI client with the new configuration
             self.update_host_port(self.url, self.port)
+            if self.update_endpoints is not None:
+                self.update_endpoints(self.endpoints_input.text().split(","))
+            if self.update_backend is not None:
+                self.update_backend(self.async_checkbox.isChecked())
 
             QtWidgets.QMessageBox.information(self, "Configuration Saved", f"Ollama Server URL and Port saved successfully!")
 
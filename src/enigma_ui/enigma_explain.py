@@ -1,5 +1,8 @@
 from PySide6 import QtCore, QtWidgets, QtGui
-from .enigma_workers import OllamaWorker
+from ..enigma_executor import EnigmaExecutor, EnigmaRequest
+from ..enigma_ollama import MType
+from .enigma_render import EnigmaStreamRenderer
+import html
 import markdown  
 
 class EnigmaExplainTab(QtWidgets.QWidget):
@@ -24,6 +27,9 @@ class EnigmaExplainTab(QtWidgets.QWidget):
         self.text_box.setOpenLinks(False)
         self.text_box.anchorClicked.connect(self.onAnchorClicked)
 
+        # Appends streamed chunks instead of rewriting the whole buffer.
+        self.renderer = EnigmaStreamRenderer(self.text_box)
+
         layout = QtWidgets.QVBoxLayout()
         layout.addWidget(self.text_box)
         layout.addLayout(self._create_explain_buttons_layout())
@@ -32,6 +38,9 @@ class EnigmaExplainTab(QtWidgets.QWidget):
 
         self.message_data = ""
 
+        # The explain request currently shown, later results are ignored.
+        self.request = None
+
         # Connect the signal from EnigmaOllamaClient to the slot
         #self.parent._ai_client.response_received.connect(self.update_text_box) # REMOVE THIS LINE
 
@@ -77,18 +86,21 @@ class EnigmaExplainTab(QtWidgets.QWidget):
         Called when the 'Explain Function' button is clicked.
         """
 
+        # A new explanation replaces the previous one, stop it if still running
+        if self.request is not None:
+            self.request.cancel()
+
         # Always clear the text box before adding new text
-        self.text_box.clear()
-        self.thread = QtCore.QThread()
-        self.worker = OllamaWorker(self.parent._ai_client, self.bin_api.get_function_il())
-        self.worker.moveToThread(self.thread)
-        self.thread.started.connect(self.worker.run_c)
-        self.worker.finished.connect(self.thread.quit)
-        self.worker.finished.connect(self.worker.deleteLater)
-        self.thread.finished.connect(self.thread.deleteLater)
-        self.worker.progress.connect(self.update_text_box)
-        self.worker.finished.connect(self.render_html)
-        self.thread.start()
+        self.message_data = ""
+        self.renderer.clear()
+        self.renderer.begin_stream()
+
+        self.request = EnigmaRequest(self.parent._ai_client, MType.SYSTEM_PSEUDO)
+        self.request.context_provider = self.bin_api.context_capture()
+        self.request.progress.connect(self.update_text_box)
+        self.request.finished.connect(self.render_html)
+        self.request.failed.connect(self.request_failed)
+        EnigmaExecutor.shared().submit(self.request)
 
     def onExplainLineClicked(self) -> None:
         """
@@ -119,20 +131,30 @@ class EnigmaExplainTab(QtWidgets.QWidget):
     
     def render_html(self):
         """
-        Render the HTML to the text box.
+        Render the finished explanation as Markdown.
         """
+        if self.sender() is not self.request:
+            return
         html = self.md.convert(self.message_data)
-        self.text_box.clear()
-        self.text_box.setHtml(html)
+        self.renderer.finish_stream(html)
+
 
+    @QtCore.Slot(str)
+    def request_failed(self, error):
+        """
+        End the explanation being streamed with the error, keeping what arrived.
+        """
+        if self.sender() is not self.request:
+            return
+        self.renderer.finish_stream(self.md.convert(self.message_data) + f"<p>Error: {html.escape(error)}</p>")
 
     @QtCore.Slot(str)
     def update_text_box(self, message):
         """
-        Update the text box with the new message.
+        Append the new chunk to the text box.
         """
-        # html = self.md.convert(message)
+        if self.sender() is not self.request:
+            return
         self.message_data += message
-        self.text_box.clear()
-        self.text_box.append(self.message_data)
+        self.renderer.append(message)
 
@@ -20,11 +20,36 @@ class EnigmaModelTab(QtWidgets.QWidget):
         self.refresh = QtWidgets.QPushButton("Refresh")
         self.refresh.clicked.connect(self.update_model_list)
 
+        # How long the server keeps the model loaded between requests.
+        self.keep_alive_label = QtWidgets.QLabel("Keep model loaded for (e.g. 30m, -1 = forever):")
+        self.keep_alive_input = QtWidgets.QLineEdit(str(self.parent._ai_client.keep_alive))
+
+        # Chat requests without a token after this long are also sent to
+        # another server or model, the first to answer wins.
+        client = self.parent._ai_client
+        self.hedge_delay = QtWidgets.QDoubleSpinBox()
+        self.hedge_delay.setRange(0.0, 120.0)
+        self.hedge_delay.setSingleStep(0.5)
+        self.hedge_delay.setSpecialValueText("Off")
+        self.hedge_delay.setPrefix("Hedge chat after ")
+        self.hedge_delay.setSuffix(" s")
+        self.hedge_delay.setValue(client.hedge_delay or 0.0)
+        self.hedge_model = QtWidgets.QLineEdit(client.hedge_model or "")
+        self.hedge_model.setPlaceholderText("Hedge model (default: same model)")
+
+        # Load state of the selected model.
+        self.state_label = QtWidgets.QLabel()
+
         # Set up the layout
         layout = QtWidgets.QVBoxLayout()
         layout.addWidget(self.model_list)
         layout.addWidget(self.refresh)
+        layout.addWidget(self.keep_alive_label)
+        layout.addWidget(self.keep_alive_input)
+        layout.addWidget(self.hedge_delay)
+        layout.addWidget(self.hedge_model)
         layout.addWidget(self.save_button)
+        layout.addWidget(self.state_label)
 
         # Cache directory for config
         self.cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config')
@@ -35,6 +60,18 @@ class EnigmaModelTab(QtWidgets.QWidget):
 
         self.setLayout(layout)
 
+        # Show the model load state of the (shared) client.
+        self.parent._ai_client.model_state_changed.connect(self.update_model_state)
+        self.update_model_state(self.parent._ai_client.model_state)
+
+    @QtCore.Slot(str)
+    def update_model_state(self, state: str):
+        """
+        Updates the model load state label.
+        """
+        model = self.parent._ai_client.ollama_model
+        self.state_label.setText(f"Model: {model or 'none'} ({state})")
+
     def update_model_list(self):
         """
         Updates the model list with the available models.
@@ -65,5 +102,9 @@ class EnigmaModelTab(QtWidgets.QWidget):
         Saves the entered URL and port.
         """
         self.current_model = self.model_list.currentText()
+        # The model first, a keep_alive change then applies to the new one.
         self.model_ai_update(self.current_model)
+        self.parent._ai_client.set_keep_alive(self.keep_alive_input.text())
+        self.keep_alive_input.setText(str(self.parent._ai_client.keep_alive))
+        self.parent._ai_client.set_hedging(self.hedge_delay.value(), self.hedge_model.text().strip())
         QtWidgets.QMessageBox.information(self, "Model Selected", f"Model selection saved successfully!")
\ No newline at end of file
@@ -0,0 +1,152 @@
+from PySide6 import QtGui, QtWidgets
+
+
+class EnigmaLiveMessage:
+    """
+    Handle to a message that is still streaming.
+
+    The start and end cursors keep their position when other messages are
+    inserted at the same spot, and Qt shifts them when text is inserted
+    before them, so several live messages can grow independently.
+    """
+
+    def __init__(self, document: QtGui.QTextDocument, start: int, end: int):
+        self.start = QtGui.QTextCursor(document)
+        self.start.setPosition(start)
+        self.start.setKeepPositionOnInsert(True)
+        self.end = QtGui.QTextCursor(document)
+        self.end.setPosition(end)
+        self.end.setKeepPositionOnInsert(True)
+
+
+class EnigmaStreamRenderer:
+    """
+    Incremental renderer for a QTextBrowser.
+
+    Finished messages are written to the document once and never touched
+    again. A streaming message is grown by appending plain text at its end
+    through a QTextCursor, and only that message is re-rendered (e.g. as
+    Markdown) once the stream has finished.
+    """
+
+    def __init__(self, text_box: QtWidgets.QTextBrowser):
+        self.text_box = text_box
+
+        # Messages that are still streaming, most recent last.
+        self._live = []
+
+        # Plain format for streamed text so it doesn't inherit the header's bold.
+        self._plain_format = QtGui.QTextCharFormat()
+
+    def is_streaming(self) -> bool:
+        """
+        Return True while any live message is being streamed.
+        """
+        return bool(self._live)
+
+    def append_message(self, html: str):
+        """
+        Append a finished message to the end of the document.
+        """
+        with self._follow_bottom():
+            cursor = self._end_cursor(new_block=True)
+            cursor.insertHtml(html)
+
+    def begin_stream(self, header_html: str = "") -> EnigmaLiveMessage:
+        """
+        Start a new live message, optionally prefixed by an HTML header.
+        """
+        with self._follow_bottom():
+            cursor = self._end_cursor(new_block=True)
+            start = cursor.position()
+            if header_html:
+                cursor.insertHtml(header_html)
+                cursor.insertText(" ", self._plain_format)
+            live = EnigmaLiveMessage(self.text_box.document(), start, cursor.position())
+        self._live.append(live)
+        return live
+
+    def append(self, text: str, live: EnigmaLiveMessage = None):
+        """
+        Append streamed text to a live message, by default the most recent.
+        """
+        if not text:
+            return
+        live = live or (self._live[-1] if self._live else self.begin_stream())
+        with self._follow_bottom():
+            cursor = QtGui.QTextCursor(live.end)
+            cursor.setKeepPositionOnInsert(False)
+            cursor.insertText(text, self._plain_format)
+            live.end.setPosition(cursor.position())
+
+    def finish_stream(self, html: str, live: EnigmaLiveMessage = None):
+        """
+        Replace a live message, by default the most recent, with its final rendering.
+        """
+        live = live or (self._live[-1] if self._live else None)
+        if live is None or live not in self._live:
+            self.append_message(html)
+            return
+        with self._follow_bottom():
+            cursor = QtGui.QTextCursor(live.start)
+            cursor.setPosition(live.end.position(), QtGui.QTextCursor.KeepAnchor)
+            cursor.removeSelectedText()
+            cursor.insertHtml(html)
+        self._live.remove(live)
+
+    def set_messages(self, html_parts: list[str]):
+        """
+        Replace the whole document. Only used for full re-renders such as
+        clearing the chat, never while streaming.
+        """
+        self._live.clear()
+        self.text_box.setHtml("".join(html_parts))
+        self.scroll_to_bottom()
+
+    def clear(self):
+        """
+        Clear the document.
+        """
+        self._live.clear()
+        self.text_box.clear()
+
+    def scroll_to_bottom(self):
+        """
+        Scroll the text box to the bottom.
+        """
+        scrollbar = self.text_box.verticalScrollBar()
+        scrollbar.setValue(scrollbar.maximum())
+
+    def _end_cursor(self, new_block: bool = False) -> QtGui.QTextCursor:
+        """
+        Return a cursor at the end of the document, starting a new block
+        first if requested and the document isn't empty.
+        """
+        cursor = QtGui.QTextCursor(self.text_box.document())
+        cursor.movePosition(QtGui.QTextCursor.End)
+        if new_block and not self.text_box.document().isEmpty():
+            cursor.insertBlock()
+        return cursor
+
+    def _follow_bottom(self):
+        """
+        Keep the view pinned to the bottom only if it already was, so users
+        can scroll back through history while a response streams.
+        """
+        return _FollowBottom(self.text_box.verticalScrollBar())
+
+
+class _FollowBottom:
+
+    def __init__(self, scrollbar: QtWidgets.QScrollBar):
+        self.scrollbar = scrollbar
+        self.at_bottom = False
+
+    def __enter__(self):
+        self.at_bottom = self.scrollbar.value() >= self.scrollbar.maximum() - 4
+        return self
+
+    def __exit__(self, *exc):
+        if self.at_bottom:
+            self.scrollbar.setValue(self.scrollbar.maximum())
+        return False
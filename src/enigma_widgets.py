@@ -7,6 +7,7 @@ from PySide6 import QtCore, QtWidgets
 from .enigma_ollama import EnigmaOllamaClient, MType
 from .enigma_rag import RagDocs
 from .enigma_binapi import EnigmaBinAPI
+from .enigma_summary import EnigmaSummaryContext
 from .enigma_ui import EnigmaExplainTab, EnigmaConfigTab, EnigmaModelTab, EnigmaChatTab
 from .enigma_settings import OllamaConfig  # Import OllamaConfig
 
@@ -26,12 +27,14 @@ class EnigmaAIWidgets(SidebarWidget):
         """
         super().__init__(name)
         self.offset_addr = 0
-        self.config = OllamaConfig()  # Create OllamaConfig instance
+        self.config = OllamaConfig.shared()  # Shared by every EnigmaAI widget
         self._ai_client = self.config.client  # Initialise the client - attempts to load cached config
-        self.rag_docs = RagDocs()
+        self.rag_docs = RagDocs.shared()  # Shared, every widget would refresh the same index
+        self._ai_client.documents = self.rag_docs  # Searched for chat and explain requests
         self.actionHandler = UIActionHandler()
         self.actionHandler.setupActionHandler(self)
         self.bv = None
+        self.view_frame = None
         self.binapi = None
         self.session_log = []
         self._init_ui()
@@ -44,14 +47,20 @@ class EnigmaAIWidgets(SidebarWidget):
     def ai_client(self, new_client: EnigmaOllamaClient) -> None:
         self._ai_client = new_client
 
-    # Call back to update the AI client when the configuration is changed
+    # Call back to update the AI client when the configuration is changed.
+    # The shared client is updated in place, so the tabs keep their reference.
     def update_host_port(self, host: str, port: int):
         self.config.update_host_port(host, port)
-        self.ai_client = self.config.client
+
+    def update_endpoints(self, endpoints: list):
+        self.config.update_endpoints(endpoints)
 
     def model_ai_update(self, model: str):
         self.config.update_model(model)
-        self.ai_client = self.config.client
+
+    def update_backend(self, use_async: bool):
+        backend = EnigmaOllamaClient.BACKEND_ASYNCIO if use_async else EnigmaOllamaClient.BACKEND_THREAD
+        self.ai_client.set_backend(backend)
 
     def _init_ui(self) -> None:
         """
@@ -61,10 +70,19 @@ class EnigmaAIWidgets(SidebarWidget):
         # Initialise the Binary Ninja API class for retrieving information
         self.bin_api = EnigmaBinAPI(self)
 
+        # Attach one-line callee and caller summaries to requests.
+        self.bin_api.summaries = EnigmaSummaryContext(self.ai_client)
+
+        # Names and summaries from imported annotation packs come before the model.
+        self.bin_api.packs = self.config.packs
+        self.bin_api.summaries.packs = self.config.packs
+
         # Initialise the tabs for the widget
         # self.explain_tab = EnigmaExplainTab(self, self.bin_api)
         self.model_tab = EnigmaModelTab(self, self.model_ai_update)
-        self.config_tab = EnigmaConfigTab(self.update_host_port)
+        self.config_tab = EnigmaConfigTab(self.update_host_port, self.update_backend,
+                                          self.ai_client.backend == EnigmaOllamaClient.BACKEND_ASYNCIO,
+                                          self.update_endpoints, self.ai_client.endpoints)
         self.chat_tab = EnigmaChatTab(self, self.bin_api)
 
         # Add the tabs to the main tab widget
@@ -89,6 +107,10 @@ class EnigmaAIWidgets(SidebarWidget):
         self.offset_addr = offset
         self.bin_api.update_offset(offset)
 
+        # Stop work on a function the user has navigated away from.
+        if self.chat_tab.is_streaming:
+            self.chat_tab.cancel_stale(self.bin_api.get_function_start(offset))
+
     def notifyViewChanged(self, view_frame) -> None:
         """
         Updates the widget's context based on changes in the view frame.
@@ -96,6 +118,8 @@ class EnigmaAIWidgets(SidebarWidget):
         Parameters:
             view_frame (ViewFrame): The new view frame context.
         """
+        self.view_frame = view_frame
+        previous = self.bv
         if view_frame is None:
             self.il_type = None
             self.datatype = None
@@ -105,5 +129,18 @@ class EnigmaAIWidgets(SidebarWidget):
             self.datatype = view_frame.getCurrentView()
             self.bv = view_frame.getCurrentBinaryView()
 
+        # Stop watching a view this widget no longer shows, e.g. once closed.
+        # Views compare by handle, the Python wrappers are not unique.
+        if previous is not None and (self.bv is None or previous != self.bv):
+            self.chat_tab.semantic_search.release(previous)
+
+    def navigate_to(self, address: int) -> None:
+        """
+        Navigates the current view to an address, e.g. from a link in the chat.
+        """
+        if self.view_frame is None or self.bv is None:
+            return
+        self.view_frame.navigate(self.bv, address)
+
     def contextMenuEvent(self, event) -> None:
         self.m_contextMenuManager.show(self.m_menu, self.actionHandler)
\ No newline at end of file
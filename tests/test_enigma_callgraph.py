@@ -0,0 +1,86 @@
+import importlib.util
+import os
+import threading
+import types
+
+# Loaded from its file, the src package needs Binary Ninja and Ollama.
+_spec = importlib.util.spec_from_file_location(
+    "enigma_callgraph", os.path.join(os.path.dirname(__file__), os.pardir, "src", "enigma_callgraph.py"))
+enigma_callgraph = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(enigma_callgraph)
+EnigmaCallGraph = enigma_callgraph.EnigmaCallGraph
+
+
+def fake_view(calls: dict):
+    """
+    A view whose functions call each other as in {start: [callee starts]}.
+    """
+    functions = {start: types.SimpleNamespace(start=start, callees=[]) for start in calls}
+    for start, callees in calls.items():
+        functions[start].callees = [functions.get(callee) or types.SimpleNamespace(start=callee)
+                                    for callee in callees]
+    return types.SimpleNamespace(functions=list(functions.values()))
+
+
+def drain(schedule) -> list:
+    order = []
+    while True:
+        start = schedule.next()
+        if start is None:
+            return order
+        order.append(start)
+        schedule.done(start)
+
+
+def test_cycles_collapse_into_one_component():
+    # 1 -> 2 -> 3 -> 1 is a cycle, 4 calls into it, 3 calls the leaf 5.
+    graph = EnigmaCallGraph(fake_view({1: [2], 2: [3], 3: [1, 5], 4: [1], 5: []}))
+    assert sorted(graph.components) == [[1, 2, 3], [4], [5]]
+    assert graph.by_level() == [[5], [1, 2, 3], [4]]
+
+
+def test_calls_outside_the_set_and_self_calls_are_ignored():
+    # 0x99 isn't one of the functions (an import, or already named).
+    graph = EnigmaCallGraph(fake_view({1: [1, 0x99], 2: [1]}))
+    assert graph.callees == {1: [], 2: [1]}
+    assert graph.by_level() == [[1], [2]]
+
+
+def test_deep_call_chain_does_not_recurse():
+    depth = 5000
+    graph = EnigmaCallGraph(fake_view({start: [start + 1] if start < depth else [] for start in range(1, depth + 1)}))
+    assert len(graph.components) == depth
+    assert graph.levels[graph.component_of[1]] == depth - 1
+
+
+def test_schedule_hands_out_callees_first():
+    calls = {1: [2, 3], 2: [4], 3: [4], 4: [], 5: [6], 6: [5], 7: [5]}
+    order = drain(EnigmaCallGraph(fake_view(calls)).schedule())
+    assert sorted(order) == sorted(calls)
+    position = {start: index for index, start in enumerate(order)}
+    for caller in (1, 2, 3):
+        for callee in calls[caller]:
+            assert position[callee] < position[caller]
+    assert position[7] > max(position[5], position[6])
+
+
+def test_schedule_waits_for_the_whole_cycle():
+    schedule = EnigmaCallGraph(fake_view({1: [2], 2: [1], 3: [1]})).schedule()
+    first, second = schedule.next(), schedule.next()
+    assert {first, second} == {1, 2}
+    schedule.done(first)
+    cancel = threading.Event()
+    timer = threading.Timer(0.3, cancel.set)
+    timer.start()
+    assert schedule.next(cancel) is None  # 3 isn't ready until 2 is done
+    timer.cancel()
+    schedule.done(second)
+    assert schedule.next() == 3
+    schedule.done(3)
+    assert schedule.next() is None
+
+
+def test_substitute_names_replaces_whole_identifiers():
+    text = "sub_401000(sub_4010001); x = sub_401000;"
+    assert enigma_callgraph.substitute_names(text, {'sub_401000': 'parse_header'}) == \
+        "parse_header(sub_4010001); x = parse_header;"
@@ -0,0 +1,72 @@
+import importlib.util
+import os
+
+# Loaded from its file, the src package needs Binary Ninja and Ollama.
+_spec = importlib.util.spec_from_file_location(
+    "enigma_compact", os.path.join(os.path.dirname(__file__), os.pardir, "src", "enigma_compact.py"))
+enigma_compact = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(enigma_compact)
+EnigmaILCompactor = enigma_compact.EnigmaILCompactor
+
+IL = """\
+140001000  int64_t sub_140001000(struct _IMAGE_DOS_HEADER* arg_8)
+140001000  {
+140001004      int32_t var_1c8_1 = 0;
+
+140001008      if (arg_8 != 0)
+14000100c      {
+140001010          var_1c8_1 = data_140023a40;
+140001014          std::vector<std::basic_string<char> >::push_back(&var_1c8_1);
+140001018      }
+14000101c      return var_1c8_1 + v1;
+140001020  }
+"""
+
+
+def test_aliases_expand_back_to_the_original_names():
+    compact = EnigmaILCompactor().compact(IL)
+
+    assert "var_1c8_1" not in compact.text
+    assert "data_140023a40" not in compact.text
+    assert "struct _IMAGE_DOS_HEADER" not in compact.text
+    assert len(compact.text) < compact.original_chars
+    assert set(compact.aliases.values()) == {
+        "var_1c8_1", "data_140023a40", "struct _IMAGE_DOS_HEADER",
+        "std::vector<std::basic_string<char> >"}
+
+    # What the model says about the aliases reads as the original names.
+    for alias, name in compact.aliases.items():
+        assert compact.expand(f"rename {alias} to count") == f"rename {name} to count"
+    assert compact.expand(compact.text).split() == \
+        EnigmaILCompactor()._strip_lines(IL).split()
+
+
+def test_aliases_skip_identifiers_already_in_the_il():
+    compact = EnigmaILCompactor().compact(IL)
+    # v1 is a real variable here, so var_1c8_1 has to get another alias.
+    assert "v1" not in compact.aliases
+    assert compact.expand("v1") == "v1"
+
+
+def test_compaction_is_deterministic():
+    assert EnigmaILCompactor().compact(IL).text == EnigmaILCompactor().compact(IL).text
+    assert EnigmaILCompactor().compact(IL).aliases == EnigmaILCompactor().compact(IL).aliases
+
+
+def test_addresses_braces_and_blank_lines_are_stripped():
+    text = EnigmaILCompactor()._strip_lines(IL)
+    assert text.splitlines() == [
+        "int64_t sub_140001000(struct _IMAGE_DOS_HEADER* arg_8)",
+        " int32_t var_1c8_1 = 0;",
+        " if (arg_8 != 0)",
+        "  var_1c8_1 = data_140023a40;",
+        "  std::vector<std::basic_string<char> >::push_back(&var_1c8_1);",
+        " return var_1c8_1 + v1;",
+    ]
+
+
+def test_short_names_are_left_alone():
+    compact = EnigmaILCompactor().compact("int32_t var_8 = arg_c;\nreturn var_8;")
+    assert compact.aliases == {}
+    assert compact.text == "int32_t var_8 = arg_c;\nreturn var_8;"
+    assert EnigmaILCompactor().compact("").text == ""
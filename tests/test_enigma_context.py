@@ -0,0 +1,109 @@
+import importlib.util
+import os
+
+# Loaded from its file, the src package needs Binary Ninja and Ollama.
+_spec = importlib.util.spec_from_file_location(
+    "enigma_context", os.path.join(os.path.dirname(__file__), os.pardir, "src", "enigma_context.py"))
+enigma_context = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(enigma_context)
+EnigmaContextPacker = enigma_context.EnigmaContextPacker
+
+
+class FakeClient:
+    """
+    Answers show() with a fixed context length, or fails while `down`.
+    """
+
+    def __init__(self, context_length: int):
+        self.context_length = context_length
+        self.down = False
+        self.calls = 0
+
+    def show(self, model):
+        self.calls += 1
+        if self.down:
+            raise ConnectionError("server down")
+        return type("ShowResponse", (), {'modelinfo': {'llama.context_length': self.context_length}})()
+
+
+def test_num_ctx_is_fixed_per_model():
+    packer = EnigmaContextPacker(max_num_ctx=32768)
+    client = FakeClient(8192)
+    assert packer.num_ctx(client, "small") == 8192
+    assert packer.budget(client, "small") == 8192 - packer.reserve_tokens
+
+    client.context_length = 131072
+    assert packer.num_ctx(client, "large") == 32768
+    assert packer.num_ctx(client, "small") == 8192
+    assert client.calls == 2
+
+
+def test_pack_keeps_the_prefix_stable_across_turns():
+    packer = EnigmaContextPacker()
+    system = [{'role': 'system', 'content': "You explain code."}]
+    il = {'role': 'system', 'content': "int main() { return 0; }"}
+    history = [{'role': 'user', 'content': "What is this?"},
+               {'role': 'assistant', 'content': "A main function."}]
+
+    first = packer.pack(4000, system, il, history,
+                        {'role': 'user', 'content': "Why 0?"},
+                        [{'role': 'system', 'content': "Excerpt about exit codes"}])
+    second = packer.pack(4000, system, il, history + first[-1:] + [{'role': 'assistant', 'content': "Success."}],
+                         {'role': 'user', 'content': "And 1?"},
+                         [{'role': 'system', 'content': "Excerpt about errors"}])
+
+    # Everything before the retrieved context of the first turn is sent again unchanged.
+    assert first[:4] == system + [il] + history
+    assert second[:4] == first[:4]
+    assert first[4:] == [{'role': 'system', 'content': "Excerpt about exit codes"},
+                         {'role': 'user', 'content': "Why 0?"}]
+    assert second[-2:] == [{'role': 'system', 'content': "Excerpt about errors"},
+                           {'role': 'user', 'content': "And 1?"}]
+
+
+def test_context_length_is_asked_again_after_a_failure():
+    packer = EnigmaContextPacker(default_context_length=4096)
+    client = FakeClient(16384)
+    client.down = True
+    assert packer.context_length(client, "model") == 4096
+
+    client.down = False
+    assert packer.context_length(client, "model") == 16384
+    assert packer.context_length(client, "model") == 16384
+    assert client.calls == 2
+
+
+def test_split_keeps_every_line_within_the_chunk_size():
+    packer = EnigmaContextPacker()
+    text = "\n".join(f"    x_{index} = y_{index} + {index};" for index in range(200))
+    chunks = packer.split(text, 100)
+
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 350 for chunk in chunks)
+    assert "\n".join(chunks).splitlines() == text.splitlines()
+
+
+def test_split_prefers_top_level_statements():
+    packer = EnigmaContextPacker()
+    lines = ["int32_t main()"]
+    for index in range(3):
+        lines.append(f"    for (i_{index} = 0; i_{index} < n; i_{index} += 1)")
+        lines.extend(f"        total = total + table_{index}[i_{index}] * {line};" for line in range(6))
+    chunks = packer.split("\n".join(lines), 150)
+
+    assert "\n".join(chunks).splitlines() == lines
+    # Each loop stays whole, cuts come right before a `for`.
+    for chunk in chunks[1:]:
+        assert chunk.startswith("    for (")
+
+
+def test_split_cuts_a_line_longer_than_a_chunk():
+    packer = EnigmaContextPacker()
+    long_line = "    puts(\"" + "A" * 100 + "\");"
+    chunks = packer.split("    x = 1;\n" + long_line + "\n    return x;", 10)
+
+    assert all(len(chunk) <= 35 for chunk in chunks)
+    assert chunks[0] == "    x = 1;"
+    # The rest of the long line starts the next chunk.
+    assert "".join(chunks[1:]) == long_line + "\n    return x;"
+    assert packer.split("\n\n", 10) == []
@@ -0,0 +1,112 @@
+import concurrent.futures
+import os
+import sys
+import threading
+import types
+
+import pytest
+
+pytest.importorskip("ollama")
+pytest.importorskip("httpx")
+pytest.importorskip("PySide6")
+
+# The client modules use relative imports, load them as the src package.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+from src import enigma_ollama  # noqa: E402
+from src.enigma_ollama import EnigmaConversation, EnigmaOllamaClient, MType  # noqa: E402
+from src.enigma_pool import EnigmaEndpointPool  # noqa: E402
+
+preload_model = EnigmaOllamaClient.preload_model
+
+
+def part(text: str, done: bool = False):
+    return types.SimpleNamespace(done=done, message=types.SimpleNamespace(content=text),
+                                 prompt_eval_count=10, prompt_eval_duration=0, load_duration=0,
+                                 eval_count=2, eval_duration=0, total_duration=0)
+
+
+class FakeLoop:
+    """
+    Stands in for EnigmaAsyncBackend, streams a fixed reply on its own thread.
+    """
+
+    def __init__(self, texts: list):
+        self.texts = texts
+        self.requests = []
+
+    def stream(self, url, request, on_part, is_cancelled):
+        self.requests.append(request)
+        future = concurrent.futures.Future()
+
+        def run():
+            for index, text in enumerate(self.texts):
+                on_part(part(text, done=index == len(self.texts) - 1))
+            future.set_result(None)
+
+        threading.Thread(target=run, daemon=True).start()
+        return future
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    # Keep the config and caches out of the source tree, and off the network.
+    monkeypatch.setattr(enigma_ollama, '__file__', str(tmp_path / 'enigma_ollama.py'))
+    monkeypatch.setattr(EnigmaOllamaClient, 'preload_model', lambda self: None)
+    monkeypatch.setattr(EnigmaEndpointPool, 'check', lambda self, endpoint: None)
+    client = EnigmaOllamaClient(host="http://localhost", port=11434, model="test-model")
+    client.context_packer.context_length = lambda ollama_client, model: 8192
+    return client
+
+
+def test_hedged_chat_on_thread_backend_finishes_the_call(client):
+    client.backend = EnigmaOllamaClient.BACKEND_THREAD
+    client.hedge_delay = 10.0
+    loop = FakeLoop(["Hel", "lo"])
+    client.async_backend = lambda: loop
+    metrics = {}
+    conversation = EnigmaConversation()
+
+    reply = client.chat("What does it do?", MType.SYSTEM, function_il="int main() {}",
+                        on_chunk=lambda text: None, on_metrics=metrics.update,
+                        conversation=conversation)
+
+    assert reply == "Hello"
+    assert len(loop.requests) == 1
+    assert metrics['hedged'] is False
+    assert metrics['ttft'] >= 0
+    assert conversation.messages() == [{'role': 'user', 'content': "What does it do?"},
+                                       {'role': 'assistant', 'content': "Hello"}]
+
+
+def test_preload_sends_the_chat_options(client):
+    generated = []
+    ollama_client = types.SimpleNamespace(generate=lambda **kwargs: generated.append(kwargs))
+
+    client._preload(ollama_client, "test-model", client.keep_alive)
+
+    assert generated == [{'model': "test-model", 'prompt': "", 'keep_alive': client.keep_alive,
+                          'options': client.model_options(ollama_client, "test-model")}]
+    assert generated[0]['options'] == {'num_ctx': 8192}
+
+
+def test_preload_again_when_keep_alive_changes_meanwhile(client):
+    generated = []
+    release = threading.Event()
+
+    def generate(**kwargs):
+        generated.append(kwargs['keep_alive'])
+        release.wait(5)
+
+    client.client = types.SimpleNamespace(generate=generate)
+    preload_model(client)
+    client.keep_alive = "1h"
+    preload_model(client)
+    preload_model(client)
+    release.set()
+
+    for _ in range(100):
+        with client._preload_lock:
+            if client._preloading is None:
+                break
+        threading.Event().wait(0.01)
+    assert generated == ["30m", "1h"]
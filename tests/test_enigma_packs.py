@@ -0,0 +1,129 @@
+import hashlib
+import importlib.util
+import os
+import types
+
+import pytest
+
+# Loaded from its file, the src package needs Binary Ninja and Ollama.
+_spec = importlib.util.spec_from_file_location(
+    "enigma_packs", os.path.join(os.path.dirname(__file__), os.pardir, "src", "enigma_packs.py"))
+enigma_packs = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(enigma_packs)
+EnigmaAnnotationPack = enigma_packs.EnigmaAnnotationPack
+
+
+def digest(value) -> bytes:
+    return hashlib.blake2b(str(value).encode(), digest_size=16).digest()
+
+
+def test_round_trip(tmp_path):
+    annotations = {digest(i): {'name': f"func_{i}", 'summary': f"does {i}"} for i in range(1000)}
+    path = str(tmp_path / "team.enigmapack")
+    EnigmaAnnotationPack.write(path, annotations)
+
+    pack = EnigmaAnnotationPack(path)
+    try:
+        assert len(pack) == 1000
+        for key, annotation in annotations.items():
+            assert pack.get(key) == annotation
+        misses = [pack.get(digest(f"missing {i}")) for i in range(1000)]
+        assert misses == [None] * 1000
+        assert pack.get(None) is None
+    finally:
+        pack.close()
+
+
+def test_empty_pack(tmp_path):
+    path = str(tmp_path / "empty.enigmapack")
+    EnigmaAnnotationPack.write(path, {})
+    pack = EnigmaAnnotationPack(path)
+    try:
+        assert len(pack) == 0
+        assert pack.get(digest(1)) is None
+    finally:
+        pack.close()
+
+
+def test_bloom_filter_rejects_most_misses(tmp_path):
+    path = str(tmp_path / "team.enigmapack")
+    EnigmaAnnotationPack.write(path, {digest(i): {'name': str(i)} for i in range(1000)})
+    pack = EnigmaAnnotationPack(path)
+    try:
+        bloom = pack.HEADER.size
+        passed = 0
+        for i in range(10000):
+            bits = pack._bloom_positions(digest(f"missing {i}"), pack._bloom_bits, pack._bloom_hashes)
+            passed += all(pack._map[bloom + bit // 8] & (1 << (bit % 8)) for bit in bits)
+        # 10 bits and 7 hashes per entry give about 1% false positives.
+        assert passed < 300
+    finally:
+        pack.close()
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "notes.enigmapack"
+    path.write_bytes(b"not a pack" * 10)
+    with pytest.raises(ValueError):
+        EnigmaAnnotationPack(str(path))
+
+
+def fake_function(instructions, start=0x1000):
+    """
+    A function whose instructions are (mnemonic, register, immediate) tuples.
+    """
+    kind = lambda name: types.SimpleNamespace(name=name)
+    rows = []
+    for offset, (mnemonic, register, immediate) in enumerate(instructions):
+        tokens = [types.SimpleNamespace(type=kind('InstructionToken'), text=mnemonic, value=0),
+                  types.SimpleNamespace(type=kind('RegisterToken'), text=register, value=0),
+                  types.SimpleNamespace(type=kind('IntegerToken'), text=hex(immediate), value=immediate)]
+        rows.append((tokens, start + offset * 4))
+    view = types.SimpleNamespace(get_symbol_at=lambda address: None)
+    return types.SimpleNamespace(instructions=rows, start=start, highest_address=start + len(rows) * 4,
+                                 view=view)
+
+
+def test_digest_includes_operands():
+    code = [("mov", "eax", 1), ("add", "eax", 2)] * 4
+    other = [("mov", "ecx", 1), ("add", "ecx", 2)] * 4
+    assert enigma_packs.function_digest(fake_function(code)) == \
+        enigma_packs.function_digest(fake_function(code, start=0x5000))
+    assert enigma_packs.function_digest(fake_function(code)) != enigma_packs.function_digest(fake_function(other))
+    assert enigma_packs.function_digest(fake_function(code[:4])) is None
+
+
+def test_import_replaces_a_pack_of_the_same_name(tmp_path):
+    packs = enigma_packs.EnigmaAnnotationPacks(str(tmp_path / "packs"))
+    source = str(tmp_path / "team.enigmapack")
+    EnigmaAnnotationPack.write(source, {digest(1): {'name': "one"}})
+    assert packs.import_pack(source) == 1
+
+    EnigmaAnnotationPack.write(source, {digest(1): {'name': "one"}, digest(2): {'name': "two"}})
+    assert packs.import_pack(source) == 2
+    assert packs.info()['packs'] == 1
+    assert packs.info()['entries'] == 2
+    assert not os.path.exists(os.path.join(packs.directory, "team.enigmapack.tmp"))
+
+
+def test_import_from_the_packs_directory_reloads(tmp_path):
+    packs = enigma_packs.EnigmaAnnotationPacks(str(tmp_path / "packs"))
+    source = str(tmp_path / "team.enigmapack")
+    EnigmaAnnotationPack.write(source, {digest(1): {'name': "one"}})
+    packs.import_pack(source)
+
+    assert packs.import_pack(os.path.join(packs.directory, "team.enigmapack")) == 1
+    assert packs.info()['packs'] == 1
+
+
+def test_failed_import_keeps_the_current_pack(tmp_path):
+    packs = enigma_packs.EnigmaAnnotationPacks(str(tmp_path / "packs"))
+    source = tmp_path / "team.enigmapack"
+    EnigmaAnnotationPack.write(str(source), {digest(1): {'name': "one"}})
+    packs.import_pack(str(source))
+
+    source.write_bytes(b"not a pack" * 10)
+    with pytest.raises(ValueError):
+        packs.import_pack(str(source))
+    assert packs.info()['entries'] == 1
+    assert os.listdir(packs.directory) == ["team.enigmapack"]
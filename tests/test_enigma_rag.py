@@ -0,0 +1,130 @@
+import importlib
+import os
+import sys
+import threading
+import types
+
+import pytest
+
+# enigma_rag uses a relative import, load it from a package that doesn't
+# run src/__init__.py (which needs Binary Ninja).
+_package = types.ModuleType("enigma_rag_src")
+_package.__path__ = [os.path.join(os.path.dirname(__file__), os.pardir, "src")]
+sys.modules.setdefault("enigma_rag_src", _package)
+enigma_rag = importlib.import_module("enigma_rag_src.enigma_rag")
+EnigmaDocIndex = enigma_rag.EnigmaDocIndex
+RagDocs = enigma_rag.RagDocs
+
+
+@pytest.fixture
+def index(tmp_path):
+    return EnigmaDocIndex(str(tmp_path / "documents.sqlite3"))
+
+
+@pytest.fixture
+def docs(tmp_path, monkeypatch):
+    # Keep cache/ and index/ out of the source tree.
+    monkeypatch.setattr(enigma_rag, '__file__', str(tmp_path / 'enigma_rag.py'))
+    docs = RagDocs()
+    for _ in range(500):
+        if not docs.is_indexing():
+            break
+        threading.Event().wait(0.01)
+    assert not docs.is_indexing()
+
+    docs.indexed = []
+    add_prepared = docs.index.add_prepared
+
+    def record(name, rows):
+        docs.indexed.append(name)
+        add_prepared(name, rows)
+
+    docs.index.add_prepared = record
+    return docs
+
+
+def write(docs, filename: str, content: str, mtime: float):
+    path = os.path.join(docs.local_cache_dir, filename)
+    with open(path, 'w') as f:
+        f.write(content)
+    os.utime(path, (mtime, mtime))
+
+
+def test_search_ranks_rarer_matches_first(index):
+    index.add_document("crypto.txt", "RC4 key schedule swaps the state array.\nThe key is 16 bytes.")
+    index.add_document("network.txt", "The socket sends the key to the server.")
+    index.add_document("misc.txt", "Nothing relevant here at all.")
+
+    results = index.search("schedule key")
+    assert [doc for _, doc, _ in results] == ["crypto.txt", "network.txt"]
+    assert results[0][0] > results[1][0]
+    assert index.search("0x67452301") == []
+
+
+def test_removed_documents_are_no_longer_found(index):
+    index.add_document("a.txt", "magic constant 0xdeadbeef")
+    index.add_document("b.txt", "another magic value")
+    index.remove_document("a.txt")
+
+    assert index.documents() == {"b.txt"}
+    assert index.search("0xdeadbeef") == []
+    assert [doc for _, doc, _ in index.search("magic")] == ["b.txt"]
+
+    # Adding a document again replaces it.
+    index.add_document("b.txt", "replaced")
+    assert index.search("magic") == []
+
+
+def test_chunks_overlap_at_the_cut():
+    lines = [f"line {index} " + "x" * 90 for index in range(40)]
+    chunks = EnigmaDocIndex.chunk("\n".join(lines))
+
+    assert len(chunks) > 1
+    assert all(len(chunk) <= EnigmaDocIndex.CHUNK_CHARS for chunk in chunks)
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert chunk.splitlines()[0] in previous.splitlines()
+    # Every line is in some chunk.
+    assert set(lines) == {line for chunk in chunks for line in chunk.splitlines()}
+
+
+def test_only_added_and_changed_documents_are_indexed(docs):
+    write(docs, "a.txt", "alpha document about decryption", 1000)
+    docs._update_index()
+    write(docs, "b.txt", "beta document about sockets", 1000)
+    docs._update_index()
+    assert docs.indexed == ["a.txt", "b.txt"]
+    assert set(docs.manifest) == {"a.txt", "b.txt"}
+
+    # Touched but not modified: only the manifest moves on.
+    write(docs, "a.txt", "alpha document about decryption", 2000)
+    docs._update_index()
+    assert docs.indexed == ["a.txt", "b.txt"]
+    assert docs.manifest["a.txt"]['mtime'] == 2000
+
+    write(docs, "b.txt", "beta document about compression", 3000)
+    docs._update_index()
+    assert docs.indexed == ["a.txt", "b.txt", "b.txt"]
+    assert [doc for _, doc, _ in docs.search("compression")] == ["b.txt"]
+    assert docs.search("sockets") == []
+
+    os.remove(os.path.join(docs.local_cache_dir, "a.txt"))
+    docs._update_index()
+    assert set(docs.manifest) == {"b.txt"}
+    assert docs.index.documents() == {"b.txt"}
+    assert docs.search("decryption") == []
+
+
+def test_manifest_is_picked_up_by_the_next_instance(docs, monkeypatch):
+    write(docs, "a.txt", "alpha document about decryption", 1000)
+    docs._update_index()
+
+    indexed = []
+    monkeypatch.setattr(EnigmaDocIndex, 'add_prepared', lambda self, name, rows: indexed.append(name))
+    again = RagDocs()
+    assert again.manifest == docs.manifest
+    for _ in range(500):
+        if not again.is_indexing():
+            break
+        threading.Event().wait(0.01)
+    assert indexed == []
+    assert [doc for _, doc, _ in again.search("decryption")] == ["a.txt"]